@@ -0,0 +1,387 @@
+"""Audio sources used by the guild players."""
+
+import math
+import threading
+from collections import deque
+from typing import Any, Callable, Optional, Tuple
+
+import discord
+import numpy as np
+from discord.opus import Encoder
+
+
+# 20 ms frames of 48 kHz stereo 16-bit PCM; 50 frames cover one second of audio
+FRAME_SIZE = Encoder.FRAME_SIZE
+SAMPLES_PER_FRAME = Encoder.SAMPLES_PER_FRAME
+CHANNELS = Encoder.CHANNELS
+FRAME_SAMPLES = SAMPLES_PER_FRAME * CHANNELS
+FRAMES_PER_SECOND = 50
+
+PREBUFFER_FRAMES = FRAMES_PER_SECOND
+
+# Volume and ducking changes are ramped over 100 ms to avoid clicks
+RAMP_FRAMES = 5
+
+
+class PrebufferedSource(discord.AudioSource):
+    """Wraps a source and reads its first frames ahead of playback.
+
+    ``prebuffer`` blocks while FFmpeg starts and decodes, so call it from a
+    worker thread; afterwards the first ``read`` calls return immediately.
+    """
+
+    def __init__(self, source: discord.AudioSource):
+        self.source = source
+        self._buffer = deque()
+        self._exhausted = False
+
+    def prebuffer(self, frames: int = PREBUFFER_FRAMES):
+        """Read up to ``frames`` frames into memory."""
+        while len(self._buffer) < frames and not self._exhausted:
+            data = self.source.read()
+            if not data:
+                self._exhausted = True
+                break
+            self._buffer.append(data)
+        return self
+
+    def read(self) -> bytes:
+        if self._buffer:
+            return self._buffer.popleft()
+        if self._exhausted:
+            return b''
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self._buffer.clear()
+        self.source.cleanup()
+
+
+class _GainRamp:
+    """A gain that moves linearly towards a target over a number of frames."""
+
+    def __init__(self, value: float):
+        self.value = value
+        self.target = value
+        self.step = 0.0
+
+    def set(self, target: float, frames: int):
+        self.target = target
+        self.step = (target - self.value) / frames if frames > 0 else target - self.value
+
+    def advance(self) -> Tuple[float, float]:
+        """Gain at the start and end of the next frame."""
+        start = self.value
+        if start != self.target:
+            end = start + self.step
+            if (self.step > 0 and end >= self.target) or (self.step < 0 and end <= self.target) or self.step == 0:
+                end = self.target
+            self.value = end
+        return start, self.value
+
+
+class MixerSource(discord.AudioSource):
+    """Plays a track and its queued follow-ups through an in-process PCM mixer.
+
+    Frames are mixed with NumPy into buffers allocated once per source, so
+    volume changes take effect on the next frame (ramped to avoid clicks),
+    ducking can lower playback temporarily, and tracks crossfade over
+    ``crossfade_frames`` frames. The current track is read that many frames
+    ahead, so its tail is known as soon as FFmpeg runs dry. With no
+    crossfade the switch to the next track happens on the frame boundary.
+
+    Opus sources from the Opus cache are passed through as packets while
+    nothing needs mixing (volume at 100%, no ducking or crossfade), and
+    decoded to PCM only when it does.
+
+    ``on_advance`` is called from the audio thread with the tag given to
+    ``set_next`` once the follow-up becomes audible. ``position`` counts the
+    frames of the current track handed to the voice client, which stops
+    reading while paused, so it stays exact across pauses and crossfades.
+    """
+
+    def __init__(
+        self,
+        source: discord.AudioSource,
+        on_advance: Callable[[Any], None],
+        volume: float = 1.0,
+        crossfade_frames: int = 0,
+        ramp_frames: int = RAMP_FRAMES
+    ):
+        self.current = source
+        self.on_advance = on_advance
+        self.crossfade_frames = crossfade_frames
+        self.ramp_frames = ramp_frames
+        self._next: Optional[Tuple[discord.AudioSource, Any]] = None
+        self._skip = False
+        self._pending_crossfade: Optional[int] = None
+        self._opus = False
+        self._lock = threading.Lock()
+        # Frames of the current track delivered so far
+        self.frames = 0
+
+        self._volume = _GainRamp(volume)
+        self._duck = _GainRamp(1.0)
+
+        # Read-ahead of the current track, as a ring of frames; one spare
+        # slot so a full crossfade's worth is still buffered after each pop
+        self._ring = np.zeros((crossfade_frames + 1, FRAME_SAMPLES), dtype=np.int16)
+        self._ring_start = 0
+        self._ring_len = 0
+        self._exhausted = False
+
+        # Crossfade in progress: frames done and total
+        self._fading: Optional[discord.AudioSource] = None
+        self._fade_pos = 0
+        self._fade_len = 0
+
+        # Scratch buffers reused for every frame
+        self._unit = np.repeat(np.arange(SAMPLES_PER_FRAME, dtype=np.float32) / SAMPLES_PER_FRAME, CHANNELS)
+        self._gain = np.empty(FRAME_SAMPLES, dtype=np.float32)
+        self._mix = np.empty(FRAME_SAMPLES, dtype=np.float32)
+        self._scratch = np.empty(FRAME_SAMPLES, dtype=np.float32)
+        self._out = np.empty(FRAME_SAMPLES, dtype=np.int16)
+
+    @property
+    def has_next(self) -> bool:
+        return self._next is not None
+
+    @property
+    def next_tag(self) -> Any:
+        """Tag of the queued follow-up, or None if nothing is queued."""
+        upcoming = self._next
+        return upcoming[1] if upcoming else None
+
+    @property
+    def position(self) -> float:
+        """Seconds of the current track played."""
+        return self.frames / FRAMES_PER_SECOND
+
+    @property
+    def volume(self) -> float:
+        return self._volume.target
+
+    def set_volume(self, volume: float, ramp_frames: int = None):
+        """Change the volume, ramped over ``ramp_frames`` frames."""
+        self._volume.set(volume, self.ramp_frames if ramp_frames is None else ramp_frames)
+
+    def duck(self, level: float, ramp_frames: int = None):
+        """Lower playback to ``level`` (1.0 restores it) on top of the volume."""
+        self._duck.set(level, self.ramp_frames if ramp_frames is None else ramp_frames)
+
+    def set_crossfade(self, frames: int):
+        """Change the crossfade length; applied by the audio thread before its next frame."""
+        self._pending_crossfade = max(0, frames)
+
+    def _apply_crossfade_change(self):
+        frames, self._pending_crossfade = self._pending_crossfade, None
+        if frames + 1 > len(self._ring):
+            # Keep buffered frames, in order, in the larger ring
+            ring = np.zeros((frames + 1, FRAME_SAMPLES), dtype=np.int16)
+            for i in range(self._ring_len):
+                ring[i] = self._ring[(self._ring_start + i) % len(self._ring)]
+            self._ring, self._ring_start = ring, 0
+        self.crossfade_frames = frames
+
+    def set_next(self, source: discord.AudioSource, tag: Any = None):
+        """Queue the source to continue with when the current one ends."""
+        with self._lock:
+            previous, self._next = self._next, (source, tag)
+        if previous:
+            previous[0].cleanup()
+
+    def clear_next(self):
+        """Drop the queued follow-up, e.g. after the queue changed."""
+        with self._lock:
+            previous, self._next = self._next, None
+        if previous:
+            previous[0].cleanup()
+
+    def skip(self):
+        """End the current track at the next frame boundary, crossfading if enabled."""
+        self._skip = True
+
+    def _read_frame(self, source: discord.AudioSource) -> Optional[np.ndarray]:
+        # Opus sources (the Opus cache) are decoded only when they have to be mixed
+        data = source.read_pcm() if source.is_opus() else source.read()
+        if len(data) != FRAME_SIZE:
+            return None
+        return np.frombuffer(data, dtype=np.int16)
+
+    def _top_up_ring(self):
+        """Grow the read-ahead by at most one frame beyond the one about to be played."""
+        size = len(self._ring)
+        reads = 0
+        while self._ring_len <= self.crossfade_frames and reads < 2 and not self._exhausted:
+            frame = self._read_frame(self.current)
+            reads += 1
+            if frame is None:
+                self._exhausted = True
+                break
+            self._ring[(self._ring_start + self._ring_len) % size] = frame
+            self._ring_len += 1
+
+    def _pop_ring(self) -> np.ndarray:
+        frame = self._ring[self._ring_start]
+        self._ring_start = (self._ring_start + 1) % len(self._ring)
+        self._ring_len -= 1
+        return frame
+
+    def _clear_ring(self):
+        self._ring_start = self._ring_len = 0
+
+    def _take_next(self):
+        with self._lock:
+            upcoming, self._next = self._next, None
+        return upcoming
+
+    def _switch(self, upcoming, fade: bool):
+        """Make the queued follow-up current, keeping the old track to fade out if asked."""
+        finished, (self.current, tag) = self.current, upcoming
+        if fade:
+            self._fading = finished
+            self._fade_pos = 0
+            self._fade_len = self._ring_len
+        else:
+            finished.cleanup()
+        self._exhausted = False
+        self.frames = 0
+        self.on_advance(tag)
+
+    def _end_crossfade(self):
+        self._fading.cleanup()
+        self._fading = None
+        self._clear_ring()
+
+    def _apply_gain(self, frame: np.ndarray, start: float, end: float, out: np.ndarray, accumulate: bool = False):
+        """Multiply a frame by a gain ramping from ``start`` to ``end`` across it."""
+        gain = self._gain
+        np.multiply(self._unit, end - start, out=gain)
+        gain += start
+        if accumulate:
+            np.multiply(frame, gain, out=self._scratch)
+            out += self._scratch
+        else:
+            np.multiply(frame, gain, out=out)
+
+    def _can_pass_through(self) -> bool:
+        """True when Opus packets can go out untouched: unity gain, nothing to mix."""
+        return (
+            self.crossfade_frames == 0 and self._ring_len == 0 and self._fading is None and
+            self.current.is_opus() and
+            self._volume.value == self._volume.target == 1.0 and
+            self._duck.value == self._duck.target == 1.0
+        )
+
+    def _direct_packet(self) -> Optional[bytes]:
+        """Next Opus packet, swapping tracks on the frame boundary; None if the new track is PCM."""
+        packet = b'' if self._skip else self.current.read()
+        if not packet:
+            self._skip = False
+            upcoming = self._take_next()
+            if upcoming is None:
+                return b''
+            self._switch(upcoming, fade=False)
+            if not self.current.is_opus():
+                return None
+            packet = self.current.read()
+        return packet
+
+    def _direct_frame(self) -> Optional[np.ndarray]:
+        """Next frame without read-ahead, swapping tracks on the frame boundary."""
+        frame = None if self._skip else self._read_frame(self.current)
+        if frame is None:
+            self._skip = False
+            upcoming = self._take_next()
+            if upcoming is None:
+                return None
+            self._switch(upcoming, fade=False)
+            frame = self._read_frame(self.current)
+        return frame
+
+    def _buffered_frame(self) -> Optional[np.ndarray]:
+        """Next frame through the read-ahead; may start a crossfade instead."""
+        if self._skip:
+            self._skip = False
+            if self._fading is not None:
+                self._end_crossfade()
+            self._exhausted = True
+            if not self.has_next:
+                self._clear_ring()
+                return None
+
+        if self._fading is None:
+            self._top_up_ring()
+            if self._exhausted:
+                upcoming = self._take_next()
+                if upcoming is not None:
+                    self._switch(upcoming, fade=self._ring_len > 0)
+                    if self._fading is None:
+                        self._top_up_ring()
+
+        if self._fading is not None or self._ring_len == 0:
+            return None
+        return self._pop_ring()
+
+    def read(self) -> bytes:
+        mix = self._mix
+        volume_start, volume_end = self._volume.advance()
+        duck_start, duck_end = self._duck.advance()
+        master_start, master_end = volume_start * duck_start, volume_end * duck_end
+
+        if self._pending_crossfade is not None:
+            self._apply_crossfade_change()
+
+        if self._can_pass_through():
+            packet = self._direct_packet()
+            if packet is not None:
+                self._opus = True
+                if packet:
+                    self.frames += 1
+                return packet
+        self._opus = False
+
+        # Frames already read ahead are drained even after crossfading was turned off
+        if self.crossfade_frames == 0 and self._ring_len == 0 and self._fading is None:
+            frame = self._direct_frame()
+        else:
+            frame = self._buffered_frame()
+
+        if frame is not None:
+            self._apply_gain(frame, master_start, master_end, mix)
+        elif self._fading is not None:
+            # Equal-power crossfade from the buffered tail into the new track
+            t0 = self._fade_pos / self._fade_len
+            t1 = (self._fade_pos + 1) / self._fade_len
+            self._apply_gain(self._pop_ring(), math.cos(t0 * math.pi / 2), math.cos(t1 * math.pi / 2), mix)
+            incoming = self._read_frame(self.current)
+            if incoming is not None:
+                self._apply_gain(incoming, math.sin(t0 * math.pi / 2), math.sin(t1 * math.pi / 2), mix, accumulate=True)
+            self._fade_pos += 1
+            if self._ring_len == 0:
+                self._end_crossfade()
+
+            np.multiply(self._unit, master_end - master_start, out=self._gain)
+            self._gain += master_start
+            mix *= self._gain
+        else:
+            return b''
+
+        np.clip(mix, -32768, 32767, out=mix)
+        np.copyto(self._out, mix, casting='unsafe')
+        self.frames += 1
+        return self._out.tobytes()
+
+    def is_opus(self) -> bool:
+        # Checked by the voice client after every read
+        return self._opus
+
+    def cleanup(self):
+        self.current.cleanup()
+        if self._fading is not None:
+            self._fading.cleanup()
+            self._fading = None
+        self.clear_next()
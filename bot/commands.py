@@ -1,6 +1,7 @@
 """Discord bot commands for SNOWLANDER."""
 
 import os
+import asyncio
 from discord.ext import commands
 from discord import VoiceChannel
 from sqlalchemy import select, func
@@ -8,6 +9,17 @@ from sqlalchemy.orm import selectinload
 
 from web.database import db
 from web.models import Track, QueueItem
+from web.queue import BULK_ENQUEUE_LIMIT, append_to_queue, enqueue_tracks, guild_queue, load_queue_item, queue_index, queue_length, queue_item_payload
+from library.scanner import scanner
+from library.loudness import loudness_analyzer, track_gain
+from library.search import apply_search
+from library.selection import matching_names, select_tracks
+from library.ranking import rank_tracks
+from bot.player import MAX_CROSSFADE_SECONDS
+from bot.events import ScanProgress, event_bus, publish_queue_change
+
+# Seconds to wait for a reply when !play has to offer choices
+CHOICE_TIMEOUT = 30
 
 
 class MusicCommands(commands.Cog):
@@ -16,6 +28,10 @@ class MusicCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
+    async def cog_check(self, ctx):
+        """Playback commands act on the guild's own player, so DMs are not supported."""
+        return ctx.guild is not None
+    
     @commands.command(name='join')
     async def join(self, ctx):
         """Join the user's voice channel."""
@@ -24,26 +40,28 @@ class MusicCommands(commands.Cog):
             return
         
         channel = ctx.author.voice.channel
-        await self.bot.join_voice_channel(channel)
+        await self.bot.player_for(ctx.guild).join(channel)
         await ctx.send(f"Joined {channel.name}")
     
     @commands.command(name='leave')
     async def leave(self, ctx):
         """Leave the current voice channel."""
-        if not self.bot.voice_client:
+        player = self.bot.player_for(ctx.guild)
+        if not player.voice_client:
             await ctx.send("I'm not connected to a voice channel!")
             return
         
-        await self.bot.leave_voice_channel()
+        await player.leave()
         await ctx.send("Left the voice channel")
     
     @commands.command(name='play')
     async def play(self, ctx, *, search_term: str = None):
         """Play a track or add it to the queue."""
+        player = self.bot.player_for(ctx.guild)
         if not search_term:
             # Resume playback if paused
-            if self.bot.voice_client and self.bot.voice_client.is_paused():
-                await self.bot.resume_playback()
+            if player.is_paused:
+                await player.resume()
                 await ctx.send("▶️ Resumed playback")
                 return
             else:
@@ -51,94 +69,158 @@ class MusicCommands(commands.Cog):
                 return
         
         # Ensure bot is in a voice channel
-        if not self.bot.voice_client:
+        if not player.voice_client:
             if ctx.author.voice:
-                await self.bot.join_voice_channel(ctx.author.voice.channel)
+                await player.join(ctx.author.voice.channel)
             else:
                 await ctx.send("You need to be in a voice channel!")
                 return
         
-        # Search for the track in the database
-        async with db.get_session() as session:
-            # Search by title, artist, filename
-            search_filter = f"%{search_term}%"
-            result = await session.execute(
-                select(Track).where(
-                    (Track.title.ilike(search_filter)) |
-                    (Track.artist.ilike(search_filter)) |
-                    (Track.filename.ilike(search_filter))
-                ).limit(1)
-            )
-            
-            track = result.scalar_one_or_none()
-            
+        # Rank library matches for the request
+        async with db.read_session() as session:
+            ranking = await rank_tracks(session, search_term)
+        
+        track = ranking.best
+        if not track:
+            await ctx.send(f"No tracks found matching '{search_term}'")
+            return
+        
+        # Let the user pick when several tracks match about equally well
+        if ranking.is_ambiguous:
+            track = await self._choose_match(ctx, ranking)
             if not track:
-                await ctx.send(f"No tracks found matching '{search_term}'")
                 return
-            
+        
+        async with db.session() as session:
             # If nothing is currently playing, play immediately
-            if not self.bot.voice_client.is_playing():
+            if not player.is_playing:
                 try:
-                    await self.bot.play_track(track.filepath, track.id)
-                    await ctx.send(f"🎵 Now playing: **{track.title or track.filename}** by {track.artist or 'Unknown Artist'}")
+                    await player.play_track(
+                        track.filepath, track.id, requested_by=str(ctx.author.id), gain_db=track_gain(track)
+                    )
+                    await ctx.send(f"🎵 Now playing: **{track.display_name}** by {track.artist or 'Unknown Artist'}")
                 except Exception as e:
                     await ctx.send(f"Error playing track: {e}")
             else:
                 # Add to queue
-                # Get next position in queue
-                position_result = await session.execute(
-                    select(func.coalesce(func.max(QueueItem.position), 0) + 1)
-                    .where(QueueItem.played == False)
-                )
-                next_position = position_result.scalar()
-                
-                # Create queue item
-                queue_item = QueueItem(
-                    track_id=track.id,
-                    position=next_position,
-                    requested_by=str(ctx.author.id)
-                )
-                
-                session.add(queue_item)
+                queue_item_id = await append_to_queue(session, player.guild_id, track.id, str(ctx.author.id))
+                next_position = await queue_index(session, player.guild_id, queue_item_id)
+                item = queue_item_payload(await load_queue_item(session, queue_item_id))
                 await session.commit()
+                publish_queue_change(player.guild_id, "added", item=item)
                 
-                await ctx.send(f"➕ Added to queue: **{track.title or track.filename}** (Position #{next_position})")
+                await ctx.send(f"➕ Added to queue: **{track.display_name}** (Position #{next_position})")
+    
+    @commands.command(name='playalbum')
+    async def play_album(self, ctx, *, album: str):
+        """Queue a whole album in track order."""
+        await self._play_selection(ctx, "album", album)
+    
+    @commands.command(name='playartist')
+    async def play_artist(self, ctx, *, artist: str):
+        """Queue every track by an artist, album by album."""
+        await self._play_selection(ctx, "artist", artist)
+    
+    async def _play_selection(self, ctx, facet: str, name: str):
+        """Queue all tracks of an album or artist in one go and start playing if idle."""
+        player = self.bot.player_for(ctx.guild)
+        if not player.voice_client:
+            if ctx.author.voice:
+                await player.join(ctx.author.voice.channel)
+            else:
+                await ctx.send("You need to be in a voice channel!")
+                return
+        
+        suggestions = []
+        async with db.read_session() as session:
+            tracks = await select_tracks(session, limit=BULK_ENQUEUE_LIMIT, **{facet: name})
+            if not tracks:
+                # Fall back to the one name containing the request, if it is unambiguous
+                suggestions = await matching_names(session, facet, name)
+                if len(suggestions) == 1:
+                    name = suggestions[0]
+                    tracks = await select_tracks(session, limit=BULK_ENQUEUE_LIMIT, **{facet: name})
+        
+        if not tracks:
+            if suggestions:
+                await ctx.send(f"No {facet} named '{name}'. Did you mean: " + ", ".join(f"**{s}**" for s in suggestions))
+            else:
+                await ctx.send(f"No {facet} found matching '{name}'")
+            return
+        
+        async with db.session() as session:
+            await enqueue_tracks(session, player.guild_id, tracks, str(ctx.author.id))
+        await ctx.send(f"➕ Queued **{len(tracks)}** tracks from **{name}**")
+        
+        if not player.is_playing:
+            try:
+                await player.play_next()
+            except Exception as e:
+                await ctx.send(f"Error playing track: {e}")
+    
+    async def _choose_match(self, ctx, ranking):
+        """Ask the requester to pick one of several close matches."""
+        choices_text = f"🤔 **Several tracks match '{ranking.query}':**\n"
+        for i, match in enumerate(ranking.matches, 1):
+            choices_text += f"{i}. **{match.display_name}** by {match.artist or 'Unknown Artist'}\n"
+        choices_text += f"\n💡 Reply with a number (1-{len(ranking.matches)}) within {CHOICE_TIMEOUT} seconds"
+        await ctx.send(choices_text)
+        
+        def check(message):
+            return (
+                message.author == ctx.author and
+                message.channel == ctx.channel and
+                message.content.strip().isdigit() and
+                1 <= int(message.content.strip()) <= len(ranking.matches)
+            )
+        
+        try:
+            reply = await self.bot.wait_for('message', check=check, timeout=CHOICE_TIMEOUT)
+        except asyncio.TimeoutError:
+            await ctx.send("⌛ No track selected")
+            return None
+        
+        return ranking.matches[int(reply.content.strip()) - 1]
     
     @commands.command(name='pause')
     async def pause(self, ctx):
         """Pause the current playback."""
-        if not self.bot.voice_client or not self.bot.voice_client.is_playing():
+        player = self.bot.player_for(ctx.guild)
+        if not player.is_playing:
             await ctx.send("Nothing is currently playing!")
             return
         
-        await self.bot.pause_playback()
+        await player.pause()
         await ctx.send("⏸️ Paused playback")
     
     @commands.command(name='resume')
     async def resume(self, ctx):
         """Resume the current playback."""
-        if not self.bot.voice_client or not self.bot.voice_client.is_paused():
+        player = self.bot.player_for(ctx.guild)
+        if not player.is_paused:
             await ctx.send("Nothing is currently paused!")
             return
         
-        await self.bot.resume_playback()
+        await player.resume()
         await ctx.send("▶️ Resumed playback")
     
     @commands.command(name='stop')
     async def stop(self, ctx):
         """Stop the current playback."""
-        if not self.bot.voice_client:
+        player = self.bot.player_for(ctx.guild)
+        if not player.voice_client:
             await ctx.send("I'm not connected to a voice channel!")
             return
         
-        await self.bot.stop_playback()
+        await player.stop()
         await ctx.send("⏹️ Stopped playback")
     
     @commands.command(name='volume')
     async def volume(self, ctx, volume: float = None):
         """Set or display the current volume."""
+        player = self.bot.player_for(ctx.guild)
         if volume is None:
-            await ctx.send(f"🔊 Current volume: {int(self.bot.volume * 100)}%")
+            await ctx.send(f"🔊 Current volume: {int(player.volume * 100)}%")
             return
         
         if not 0 <= volume <= 100:
@@ -146,17 +228,31 @@ class MusicCommands(commands.Cog):
             return
         
         volume_decimal = volume / 100
-        await self.bot.set_volume(volume_decimal)
+        await player.set_volume(volume_decimal)
         await ctx.send(f"🔊 Volume set to {int(volume)}%")
     
+    @commands.command(name='crossfade')
+    async def crossfade(self, ctx, seconds: float = None):
+        """Set or display how many seconds consecutive tracks overlap."""
+        player = self.bot.player_for(ctx.guild)
+        if seconds is None:
+            await ctx.send(f"🎚️ Crossfade: {player.crossfade:g}s")
+            return
+        
+        if not 0 <= seconds <= MAX_CROSSFADE_SECONDS:
+            await ctx.send(f"Crossfade must be between 0 and {MAX_CROSSFADE_SECONDS:g} seconds")
+            return
+        
+        await player.set_crossfade(seconds)
+        await ctx.send(f"🎚️ Crossfade set to {seconds:g}s" if seconds else "🎚️ Crossfade off")
+    
     @commands.command(name='queue')
     async def queue(self, ctx):
         """Display the current queue."""
-        async with db.get_session() as session:
+        async with db.read_session() as session:
             result = await session.execute(
-                select(QueueItem)
+                guild_queue(select(QueueItem), str(ctx.guild.id))
                 .options(selectinload(QueueItem.track))
-                .where(QueueItem.played == False)
                 .order_by(QueueItem.position)
                 .limit(10)
             )
@@ -168,9 +264,9 @@ class MusicCommands(commands.Cog):
                 return
             
             queue_text = "📋 **Current Queue:**\n"
-            for item in queue_items:
+            for index, item in enumerate(queue_items, 1):
                 track = item.track
-                queue_text += f"{item.position}. **{track.title or track.filename}** by {track.artist or 'Unknown Artist'}\n"
+                queue_text += f"{index}. **{track.title or track.filename}** by {track.artist or 'Unknown Artist'}\n"
             
             if len(queue_items) == 10:
                 queue_text += "...(showing first 10 items)"
@@ -180,23 +276,24 @@ class MusicCommands(commands.Cog):
     @commands.command(name='skip')
     async def skip(self, ctx):
         """Skip the current track."""
-        if not self.bot.voice_client or not self.bot.voice_client.is_playing():
+        player = self.bot.player_for(ctx.guild)
+        if not await player.skip():
             await ctx.send("Nothing is currently playing!")
             return
         
-        self.bot.voice_client.stop()
         await ctx.send("⏭️ Skipped track")
     
     @commands.command(name='nowplaying', aliases=['np'])
     async def now_playing(self, ctx):
         """Display information about the currently playing track."""
-        if not self.bot.current_track:
+        player = self.bot.player_for(ctx.guild)
+        if not player.current_track:
             await ctx.send("Nothing is currently playing!")
             return
         
-        track_id = self.bot.current_track.get('id')
+        track_id = player.current_track.get('id')
         if track_id:
-            async with db.get_session() as session:
+            async with db.read_session() as session:
                 result = await session.execute(select(Track).where(Track.id == track_id))
                 track = result.scalar_one_or_none()
                 
@@ -217,15 +314,9 @@ class MusicCommands(commands.Cog):
     @commands.command(name='search')
     async def search(self, ctx, *, search_term: str):
         """Search for tracks in the music library."""
-        async with db.get_session() as session:
-            search_filter = f"%{search_term}%"
+        async with db.read_session() as session:
             result = await session.execute(
-                select(Track).where(
-                    (Track.title.ilike(search_filter)) |
-                    (Track.artist.ilike(search_filter)) |
-                    (Track.album.ilike(search_filter)) |
-                    (Track.filename.ilike(search_filter))
-                ).limit(10)
+                apply_search(select(Track), search_term).limit(10)
             )
             
             tracks = result.scalars().all()
@@ -253,42 +344,86 @@ class AdminCommands(commands.Cog):
     
     @commands.command(name='scan')
     @commands.has_permissions(administrator=True)
-    async def scan_library(self, ctx):
-        """Scan the music library for new tracks."""
-        await ctx.send("🔄 Starting library scan... (This may take a while)")
+    async def scan_library(self, ctx, mode: str = None):
+        """Scan the music library for new tracks. Use `!scan full` to re-read every file."""
+        incremental = mode != 'full'
+
+        if scanner.is_running:
+            await ctx.send("🔄 A library scan is already running")
+            return
+
+        scan_type = "incremental" if incremental else "full"
+        message = await ctx.send(f"🔄 Starting {scan_type} library scan... (This may take a while)")
+
+        async def report_progress(progress):
+            event_bus.publish(ScanProgress(progress=progress.to_dict()))
+            if not progress.finished:
+                await message.edit(
+                    content=f"🔄 Scanning library: {progress.processed + progress.unchanged}/{progress.discovered} files "
+                            f"({progress.elapsed:.0f}s)"
+                )
+
+        try:
+            progress = await scanner.scan(progress_callback=report_progress, incremental=incremental)
+        except Exception as e:
+            await message.edit(content=f"❌ Library scan failed: {e}")
+            return
+
+        await message.edit(
+            content=f"📁 Library scan completed! {progress.written} tracks indexed, "
+                    f"{progress.unchanged} unchanged, {progress.renamed} renamed, {progress.removed} removed, "
+                    f"{progress.failed} unreadable files in {progress.elapsed:.1f}s"
+        )
         
-        # TODO: Implement library scanning
-        # This would involve:
-        # 1. Walking through the music directory
-        # 2. Reading metadata from audio files
-        # 3. Adding/updating tracks in the database
+        # New and changed tracks still need their loudness measured
+        self.bot.start_loudness_analysis()
+    
+    @commands.command(name='loudness')
+    @commands.has_permissions(administrator=True)
+    async def loudness(self, ctx):
+        """Show loudness analysis progress, starting a run if tracks are pending."""
+        progress = loudness_analyzer.progress
+        if loudness_analyzer.is_running and progress:
+            await ctx.send(
+                f"🔊 Measuring loudness: {progress.processed}/{progress.pending} tracks "
+                f"({progress.failed} failed, {progress.elapsed:.0f}s)"
+            )
+            return
         
-        await ctx.send("📁 Library scan completed!")
+        pending = await loudness_analyzer.count_pending()
+        if not pending:
+            await ctx.send("🔊 Every track has been analysed")
+        elif self.bot.start_loudness_analysis():
+            await ctx.send(f"🔊 Measuring loudness of {pending} tracks in the background")
+        else:
+            await ctx.send("❌ Loudness analysis needs `ffmpeg`")
     
     @commands.command(name='status')
-    async def bot_status(self, ctx):
+    async def show_status(self, ctx):
         """Display bot status and statistics."""
-        async with db.get_session() as session:
+        async with db.read_session() as session:
             # Get track count
             track_count_result = await session.execute(select(func.count(Track.id)))
             track_count = track_count_result.scalar()
             
-            # Get queue length
-            queue_count_result = await session.execute(
-                select(func.count(QueueItem.id)).where(QueueItem.played == False)
-            )
-            queue_count = queue_count_result.scalar()
+            # Get this guild's queue length
+            guild_id = str(ctx.guild.id) if ctx.guild else None
+            queue_count = await queue_length(session, guild_id)
+            
+            player = self.bot.players.find(ctx.guild) if ctx.guild else None
+            volume = player.volume if player else self.bot.volume
             
             status_text = f"📊 **SNOWLANDER Bot Status**\n"
             status_text += f"🎵 **Music Library:** {track_count} tracks\n"
             status_text += f"📋 **Queue Length:** {queue_count} items\n"
-            status_text += f"🔊 **Volume:** {int(self.bot.volume * 100)}%\n"
+            status_text += f"🔊 **Volume:** {int(volume * 100)}%\n"
+            status_text += f"🛰️ **Active Guilds:** {sum(1 for p in self.bot.players if p.voice_client)}\n"
             
-            if self.bot.voice_client:
-                status_text += f"🎙️ **Voice Channel:** {self.bot.voice_client.channel.name}\n"
-                if self.bot.voice_client.is_playing():
+            if player and player.voice_client:
+                status_text += f"🎙️ **Voice Channel:** {player.voice_client.channel.name}\n"
+                if player.is_playing:
                     status_text += "▶️ **Status:** Playing\n"
-                elif self.bot.voice_client.is_paused():
+                elif player.is_paused:
                     status_text += "⏸️ **Status:** Paused\n"
                 else:
                     status_text += "⏹️ **Status:** Stopped\n"
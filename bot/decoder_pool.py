@@ -0,0 +1,322 @@
+"""Pre-started FFmpeg decoders that receive their track over stdin."""
+
+import os
+import time
+import select
+import threading
+import subprocess
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import discord
+import numpy as np
+
+from .audio import FRAME_SIZE, FRAME_SAMPLES
+
+
+FFMPEG = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+# MP4 keeps its index at the end of the file, which FFmpeg cannot seek to in a pipe
+SEEKING_EXTENSIONS = {".m4a", ".mp4"}
+
+PIPE_CHUNK_SIZE = 64 * 1024
+
+
+def _percentiles(samples) -> Dict[str, Optional[float]]:
+    """p50, p95 and max of a sample window, in milliseconds."""
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class DecoderMetrics:
+    """Rolling windows of decoder start-up timings.
+
+    ``spawn`` is the time spent starting an FFmpeg process, which a warm
+    start skips; ``first_frame`` runs from asking for a decoder to its first
+    PCM frame; ``playback_start`` is the player's whole start of a track,
+    from the command to audio being handed to the voice client.
+    """
+
+    def __init__(self, window: int = 256):
+        self.warm_starts = 0
+        self.cold_starts = 0
+        self.timeouts = 0
+        self.spawn: Deque[float] = deque(maxlen=window)
+        self.slot_wait: Deque[float] = deque(maxlen=window)
+        self.first_frame: Deque[float] = deque(maxlen=window)
+        self.playback_start: Deque[float] = deque(maxlen=window)
+
+    def record_playback_start(self, seconds: float):
+        self.playback_start.append(seconds)
+
+    def to_dict(self) -> Dict:
+        return {
+            "warm_starts": self.warm_starts,
+            "cold_starts": self.cold_starts,
+            "timeouts": self.timeouts,
+            "spawn": _percentiles(list(self.spawn)),
+            "slot_wait": _percentiles(list(self.slot_wait)),
+            "first_frame": _percentiles(list(self.first_frame)),
+            "playback_start": _percentiles(list(self.playback_start)),
+        }
+
+
+class PooledDecoderSource(discord.AudioSource):
+    """48 kHz stereo PCM from a pooled FFmpeg decoder.
+
+    Piped decoders get the file from a writer thread. The loudness gain is
+    applied to each frame here, since a decoder started ahead of time cannot
+    know the track's gain.
+    """
+
+    def __init__(self, pool: "DecoderPool", process: subprocess.Popen, track_path: str, piped: bool, gain_db: float, opened_at: float):
+        self.pool = pool
+        self.process = process
+        self.track_path = track_path
+        self._opened_at = opened_at
+        self._first_frame = False
+        self._gain = 10 ** (gain_db / 20) if gain_db else None
+        if self._gain is not None:
+            self._scratch = np.empty(FRAME_SAMPLES, dtype=np.float32)
+            self._out = np.empty(FRAME_SAMPLES, dtype=np.int16)
+        self._writer: Optional[threading.Thread] = None
+        if piped:
+            self._writer = threading.Thread(
+                target=self._feed, name=f"decoder-stdin-writer:{process.pid}", daemon=True
+            )
+            self._writer.start()
+
+    def _feed(self):
+        stdin = self.process.stdin
+        try:
+            with open(self.track_path, "rb") as f:
+                while True:
+                    chunk = f.read(PIPE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    stdin.write(chunk)
+        except (OSError, ValueError):
+            # The file vanished, or the decoder was killed mid-track
+            pass
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def wait_first_frame(self, timeout: float) -> bool:
+        """Block until FFmpeg has output (or exited), at most ``timeout`` seconds."""
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        return bool(readable)
+
+    def read(self) -> bytes:
+        data = self.process.stdout.read(FRAME_SIZE)
+        if len(data) != FRAME_SIZE:
+            return b''
+        if not self._first_frame:
+            self._first_frame = True
+            self.pool.metrics.first_frame.append(time.perf_counter() - self._opened_at)
+        if self._gain is None:
+            return data
+        np.multiply(np.frombuffer(data, dtype=np.int16), self._gain, out=self._scratch)
+        np.clip(self._scratch, -32768, 32767, out=self._scratch)
+        np.copyto(self._out, self._scratch, casting='unsafe')
+        return self._out.tobytes()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self):
+        process, self.process = self.process, None
+        if process is not None:
+            self.pool.release(process)
+
+
+class DecoderPool:
+    """Keeps FFmpeg decoders started ahead of time, under a cap on decoder processes.
+
+    A warm decoder has already been exec'd and loaded its codecs and waits
+    on stdin, so starting a track skips process start-up: the file is piped
+    in and the first frame appears as soon as FFmpeg has probed it. MP4
+    files need seeking and get a decoder started on the file instead. Every
+    decoder, warm or playing, counts towards ``max_processes``; callers wait
+    at most ``start_timeout`` seconds for a free slot and again for the
+    first frame. Blocking; call from a worker thread.
+    """
+
+    def __init__(self, warm: int = 2, max_processes: int = 16, start_timeout: float = 5.0):
+        self.warm = warm
+        self.max_processes = max(1, max_processes)
+        self.start_timeout = start_timeout
+        self.metrics = DecoderMetrics()
+        self._idle: Deque[subprocess.Popen] = deque()
+        self._live = 0
+        self._refilling = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _command(track_path: Optional[str]):
+        return [
+            FFMPEG, "-hide_banner", "-loglevel", "warning",
+            "-i", track_path or "pipe:0", "-vn",
+            "-f", "s16le", "-ar", "48000", "-ac", "2", "pipe:1",
+        ]
+
+    def _spawn(self, track_path: Optional[str] = None) -> subprocess.Popen:
+        """Start a decoder reading ``track_path``, or stdin when None. Caller holds a slot."""
+        started = time.perf_counter()
+        try:
+            process = subprocess.Popen(
+                self._command(track_path),
+                stdin=subprocess.PIPE if track_path is None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise discord.ClientException(f"{FFMPEG} was not found.") from None
+        except subprocess.SubprocessError as e:
+            raise discord.ClientException(f"Popen failed: {e.__class__.__name__}: {e}") from e
+        self.metrics.spawn.append(time.perf_counter() - started)
+        return process
+
+    @staticmethod
+    def _kill(process: subprocess.Popen):
+        try:
+            process.kill()
+        except OSError:
+            pass
+        process.wait()
+        for pipe in (process.stdin, process.stdout):
+            if pipe:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+    def _take_slot(self, piped: bool) -> Optional[subprocess.Popen]:
+        """Return a warm decoder, or reserve a slot for a new one (None)."""
+        deadline = time.monotonic() + self.start_timeout
+        with self._cond:
+            while True:
+                while piped and self._idle:
+                    process = self._idle.popleft()
+                    if process.poll() is None:
+                        return process
+                    self._live -= 1
+                if self._live < self.max_processes:
+                    self._live += 1
+                    return None
+                if self._idle:
+                    # A file that cannot be piped takes over a warm decoder's slot
+                    self._kill(self._idle.popleft())
+                    self._live -= 1
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.timeouts += 1
+                    raise TimeoutError(f"All {self.max_processes} decoders are busy")
+                self._cond.wait(remaining)
+
+    def open(self, track_path: str, gain_db: float = 0.0) -> PooledDecoderSource:
+        """Start decoding a track, on a warm decoder when possible."""
+        opened_at = time.perf_counter()
+        piped = os.path.splitext(track_path)[1].lower() not in SEEKING_EXTENSIONS
+        process = self._take_slot(piped)
+        self.metrics.slot_wait.append(time.perf_counter() - opened_at)
+
+        if process is None:
+            try:
+                process = self._spawn(None if piped else track_path)
+            except Exception:
+                self._free_slot()
+                raise
+            self.metrics.cold_starts += 1
+        else:
+            self.metrics.warm_starts += 1
+        self.refill()
+
+        source = PooledDecoderSource(self, process, track_path, piped, gain_db, opened_at)
+        if not source.wait_first_frame(self.start_timeout):
+            source.cleanup()
+            self.metrics.timeouts += 1
+            raise TimeoutError(f"No audio from {os.path.basename(track_path)} within {self.start_timeout:g}s")
+        return source
+
+    def _free_slot(self):
+        with self._cond:
+            self._live -= 1
+            self._cond.notify_all()
+
+    def release(self, process: subprocess.Popen):
+        """Stop a decoder and hand its slot to a waiting track or a new warm decoder."""
+        self._kill(process)
+        self._free_slot()
+        self.refill()
+
+    def refill(self):
+        """Top the warm decoders back up in the background."""
+        with self._cond:
+            if self._refilling or self._closed or len(self._idle) >= self.warm:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="decoder-pool-refill", daemon=True).start()
+
+    def _refill(self):
+        try:
+            while True:
+                with self._cond:
+                    if self._closed or len(self._idle) >= self.warm or self._live >= self.max_processes:
+                        return
+                    self._live += 1
+                try:
+                    process = self._spawn()
+                except Exception as e:
+                    print(f"Error starting a warm decoder: {e}")
+                    self._free_slot()
+                    return
+                with self._cond:
+                    if self._closed:
+                        self._kill(process)
+                        self._live -= 1
+                        return
+                    self._idle.append(process)
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._refilling = False
+
+    def stats(self) -> Dict:
+        """Pool occupancy plus start-up timings."""
+        with self._cond:
+            occupancy = {
+                "warm_idle": len(self._idle),
+                "processes": self._live,
+                "max_processes": self.max_processes,
+                "warm_target": self.warm,
+            }
+        return {**occupancy, **self.metrics.to_dict()}
+
+    def close(self):
+        """Stop the warm decoders; playing ones are stopped by their sources."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._live -= len(idle)
+            self._cond.notify_all()
+        for process in idle:
+            self._kill(process)
+
+
+# Global decoder pool instance
+decoder_pool = DecoderPool(
+    warm=int(os.getenv("DECODER_POOL_WARM", 2)),
+    max_processes=int(os.getenv("DECODER_POOL_MAX", 16)),
+    start_timeout=float(os.getenv("DECODER_START_TIMEOUT", 5))
+)
@@ -5,10 +5,14 @@ import asyncio
 import discord
 from discord.ext import commands
 from typing import Optional
-from datetime import datetime
 
-from web.database import db
-from web.models import BotStatus
+from .state import bot_state
+from .history import play_history
+from .player import GuildPlayer, PlayerRegistry
+from .opus_cache import opus_cache
+from .decoder_pool import decoder_pool
+from library.loudness import loudness_analyzer
+from .events import PositionsUpdated, event_bus
 
 
 class SnowlanderBot(commands.Bot):
@@ -25,18 +29,23 @@ class SnowlanderBot(commands.Bot):
             description="SNOWLANDER - Local Music Discord Bot"
         )
         
-        self.voice_client: Optional[discord.VoiceClient] = None
-        self.current_track = None
-        self.queue = []
         self.volume = float(os.getenv("DEFAULT_VOLUME", 0.5))
+        self.players = PlayerRegistry(default_volume=self.volume)
+        self._rollup_task: Optional[asyncio.Task] = None
+        self._loudness_task: Optional[asyncio.Task] = None
+        self._position_task: Optional[asyncio.Task] = None
+        self.position_push_interval = int(os.getenv("POSITION_PUSH_MS", 1000)) / 1000
+        
+        # Status requests read live positions from the players
+        bot_state.position_source = self.players.position
         
     async def on_ready(self):
         """Called when the bot is ready."""
         print(f'{self.user} has connected to Discord!')
         print(f'Bot is in {len(self.guilds)} guilds')
         
-        # Update bot status in database
-        await self._update_bot_status()
+        # Take ownership of the shared bot status
+        bot_state.activate(volume=self.volume)
         
         # Load extensions (commands)
         await self.load_extension('bot.commands')
@@ -44,149 +53,78 @@ class SnowlanderBot(commands.Bot):
     async def on_voice_state_update(self, member, before, after):
         """Handle voice state updates."""
         if member == self.user:
+            player = self.players.find(member.guild)
+            if not player:
+                return
+            
             # Bot's voice state changed
             if after.channel is None:
                 # Bot was disconnected from voice
-                self.voice_client = None
-                await self._update_bot_status(is_connected=False)
+                player.disconnected()
             elif before.channel != after.channel:
                 # Bot moved to a different voice channel
-                await self._update_bot_status(
-                    channel_id=str(after.channel.id),
-                    is_connected=True
-                )
+                player.moved(after.channel)
     
-    async def join_voice_channel(self, channel: discord.VoiceChannel):
-        """Join a voice channel."""
-        if self.voice_client:
-            if self.voice_client.channel == channel:
-                return self.voice_client
-            await self.voice_client.move_to(channel)
-        else:
-            self.voice_client = await channel.connect()
-        
-        await self._update_bot_status(
-            guild_id=str(channel.guild.id),
-            channel_id=str(channel.id),
-            is_connected=True
-        )
-        
-        return self.voice_client
+    async def on_guild_remove(self, guild):
+        """Drop the player of a guild the bot was removed from."""
+        self.players.remove(guild)
     
-    async def leave_voice_channel(self):
-        """Leave the current voice channel."""
-        if self.voice_client:
-            await self.voice_client.disconnect()
-            self.voice_client = None
-            
-        await self._update_bot_status(
-            is_connected=False,
-            is_playing=False,
-            current_track_id=None
-        )
+    def player_for(self, guild) -> GuildPlayer:
+        """Return the player for a guild."""
+        return self.players.get(guild)
     
-    async def play_track(self, track_path: str, track_id: int = None):
-        """Play a track from the local filesystem."""
-        if not self.voice_client:
-            raise ValueError("Not connected to a voice channel")
-        
-        if self.voice_client.is_playing():
-            self.voice_client.stop()
-        
-        # Create FFmpeg audio source
-        ffmpeg_options = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-            'options': f'-vn -filter:a "volume={self.volume}"'
-        }
-        
-        audio_source = discord.FFmpegPCMAudio(track_path, **ffmpeg_options)
-        
-        # Play the track
-        self.voice_client.play(
-            audio_source,
-            after=lambda e: asyncio.create_task(self._on_track_finished(e))
-        )
-        
-        self.current_track = {
-            'path': track_path,
-            'id': track_id
-        }
-        
-        await self._update_bot_status(
-            is_playing=True,
-            current_track_id=track_id,
-            position=0.0
-        )
-    
-    async def pause_playback(self):
-        """Pause the current playback."""
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.pause()
-            await self._update_bot_status(is_playing=False)
+    def start_loudness_analysis(self) -> bool:
+        """Measure tracks without loudness data in the background. Returns False if already running."""
+        if loudness_analyzer.is_running or not loudness_analyzer.available:
+            return False
+        self._loudness_task = asyncio.create_task(self._run_loudness_analysis())
+        return True
     
-    async def resume_playback(self):
-        """Resume the current playback."""
-        if self.voice_client and self.voice_client.is_paused():
-            self.voice_client.resume()
-            await self._update_bot_status(is_playing=True)
-    
-    async def stop_playback(self):
-        """Stop the current playback."""
-        if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
-            self.voice_client.stop()
-            
-        self.current_track = None
-        await self._update_bot_status(
-            is_playing=False,
-            current_track_id=None,
-            position=0.0
-        )
-    
-    async def set_volume(self, volume: float):
-        """Set the playback volume (0.0 to 1.0)."""
-        self.volume = max(0.0, min(1.0, volume))
-        await self._update_bot_status(volume=self.volume)
-        
-        # If currently playing, the volume change will apply to the next track
-        # Real-time volume adjustment would require a different audio source implementation
+    async def _push_positions(self):
+        """Publish live playback positions every ``position_push_interval``."""
+        while True:
+            await asyncio.sleep(self.position_push_interval)
+            try:
+                positions = self.players.positions()
+                if positions:
+                    event_bus.publish(PositionsUpdated(positions=positions))
+            except Exception as e:
+                print(f"Error pushing playback positions: {e}")
     
-    async def _on_track_finished(self, error):
-        """Called when a track finishes playing."""
-        if error:
-            print(f'Player error: {error}')
-        
-        self.current_track = None
-        await self._update_bot_status(
-            is_playing=False,
-            current_track_id=None,
-            position=0.0
-        )
-        
-        # TODO: Auto-play next track in queue
-    
-    async def _update_bot_status(self, **kwargs):
-        """Update bot status in the database."""
+    async def _run_loudness_analysis(self):
         try:
-            async with db.get_session() as session:
-                # Get or create bot status record
-                from sqlalchemy import select
-                result = await session.execute(select(BotStatus).limit(1))
-                status = result.scalar_one_or_none()
-                
-                if not status:
-                    status = BotStatus()
-                    session.add(status)
-                
-                # Update fields
-                for key, value in kwargs.items():
-                    if hasattr(status, key):
-                        setattr(status, key, value)
-                
-                status.last_updated = datetime.utcnow()
-                await session.commit()
-                
+            progress = await loudness_analyzer.run()
+            if progress.processed:
+                print(f"Loudness analysis: {progress.analyzed} tracks measured, {progress.failed} failed")
         except Exception as e:
-            print(f"Error updating bot status: {e}")
+            print(f"Error analysing loudness: {e}")
+    
+    async def setup_hook(self):
+        """Start background jobs once the bot's event loop is running."""
+        await event_bus.connect()
+        self._rollup_task = asyncio.create_task(play_history.run_rollups())
+        decoder_pool.refill()
+        self._position_task = asyncio.create_task(self._push_positions())
+        if os.getenv("LOUDNESS_ANALYSIS", "True").lower() == "true":
+            self.start_loudness_analysis()
+        # Cached tracks are only played from the cache at full volume without crossfade
+        if self.volume == 1.0 and self.players.default_crossfade == 0:
+            await opus_cache.warm_popular(int(os.getenv("OPUS_CACHE_WARM_TOP", 100)))
+    
+    async def close(self):
+        """Leave voice and flush pending status changes and play history before shutting down."""
+        if self._rollup_task:
+            self._rollup_task.cancel()
+        if self._loudness_task:
+            self._loudness_task.cancel()
+        if self._position_task:
+            self._position_task.cancel()
+        await self.players.disconnect_all()
+        await opus_cache.close()
+        await asyncio.to_thread(decoder_pool.close)
+        await play_history.close()
+        await bot_state.close()
+        await super().close()
 
 
 async def run_bot():
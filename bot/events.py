@@ -0,0 +1,296 @@
+"""Typed in-process event bus from the bot to the web layer, with pluggable transports."""
+
+import os
+import json
+import time
+import inspect
+import asyncio
+from collections import defaultdict, deque
+from dataclasses import dataclass, field, asdict
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Type, Union
+
+
+@dataclass(frozen=True, kw_only=True)
+class Event:
+    """Base class of bus events; subscribing to it receives every event."""
+    guild_id: Optional[str] = None
+    # Wall clock, so delivery latency can be measured across processes
+    published_at: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True, kw_only=True)
+class StatusChanged(Event):
+    """A guild's connection or playback status changed; ``status`` holds every status field."""
+    status: Dict[str, Any]
+
+
+@dataclass(frozen=True, kw_only=True)
+class TrackStarted(Event):
+    """A track became audible in a guild."""
+    track_id: Optional[int]
+    requested_by: Optional[str] = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class QueueChanged(Event):
+    """A committed queue mutation; see ``web.queue_log`` for the operations."""
+    op: str
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True, kw_only=True)
+class PositionsUpdated(Event):
+    """Live playback positions of every guild with a track loaded."""
+    positions: List[Dict[str, Any]]
+
+
+@dataclass(frozen=True, kw_only=True)
+class ScanProgress(Event):
+    """Running totals of a library scan; ``progress`` holds ``library.scanner.ScanProgress`` as a dict."""
+    progress: Dict[str, Any]
+
+
+@dataclass(frozen=True, kw_only=True)
+class TracksChanged(Event):
+    """Track rows were written: a library scan, loudness measurements or play counts."""
+
+
+@dataclass(frozen=True, kw_only=True)
+class PlaylistsChanged(Event):
+    """Playlists or their items were written."""
+
+
+EVENT_TYPES: Dict[str, Type[Event]] = {
+    cls.__name__: cls
+    for cls in (
+        StatusChanged, TrackStarted, QueueChanged, PositionsUpdated, ScanProgress, TracksChanged, PlaylistsChanged
+    )
+}
+
+Handler = Callable[[Event], Union[None, Awaitable[None]]]
+
+
+class EventMetrics:
+    """Subscriber counting events per type and timing publish-to-delivery latency."""
+
+    def __init__(self, window: int = 512):
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def observe(self, event: Event):
+        self.counts[type(event).__name__] += 1
+        self.latencies.append(time.time() - event.published_at)
+
+    def to_dict(self) -> Dict:
+        ordered = sorted(self.latencies)
+        latency = None
+        if ordered:
+            latency = {
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return {"counts": dict(self.counts), "latency": latency}
+
+
+class EventTransport:
+    """Carries events between processes. The default does nothing: bot and web share the bus."""
+
+    async def listen(self, bus: "EventBus"):
+        """Start receiving events published in other processes."""
+
+    async def connect(self):
+        """Start forwarding this process's events to a listener."""
+
+    def send(self, event: Event):
+        """Forward an event published in this process."""
+
+    async def close(self):
+        """Stop listening and forwarding."""
+
+
+def encode_event(event: Event) -> bytes:
+    return json.dumps({
+        "type": type(event).__name__,
+        "origin": os.getpid(),
+        "event": asdict(event),
+    }).encode("utf-8") + b"\n"
+
+
+def decode_event(line: bytes):
+    """Return (origin pid, event) for an encoded line."""
+    envelope = json.loads(line)
+    return envelope["origin"], EVENT_TYPES[envelope["type"]](**envelope["event"])
+
+
+class UnixSocketTransport(EventTransport):
+    """JSON lines over a Unix socket, for running the bot and the web server as separate processes.
+
+    The web process listens and republishes what it receives on its own
+    bus; the bot process connects and forwards everything it publishes,
+    reconnecting as needed. Up to ``max_pending`` events are kept while the
+    listener is away, oldest dropped first. Events a process receives from
+    itself are ignored, so running both roles in one process is harmless.
+    """
+
+    def __init__(self, path: str, max_pending: int = 1000, retry_seconds: float = 1.0):
+        self.path = path
+        self.retry_seconds = retry_seconds
+        self._pending: Deque[bytes] = deque(maxlen=max_pending)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    async def listen(self, bus: "EventBus"):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                while line := await reader.readline():
+                    try:
+                        origin, event = decode_event(line)
+                    except Exception as e:
+                        print(f"Ignoring malformed event: {e}")
+                        continue
+                    if origin != os.getpid():
+                        bus.deliver(event)
+            finally:
+                writer.close()
+
+        self._server = await asyncio.start_unix_server(handle, path=self.path)
+
+    async def connect(self):
+        self._wakeup = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._forward())
+
+    def send(self, event: Event):
+        if self._wakeup is None:
+            return
+        self._pending.append(encode_event(event))
+        self._wakeup.set()
+
+    async def _forward(self):
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.retry_seconds)
+                continue
+            try:
+                while True:
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+                    while self._pending:
+                        writer.write(self._pending[0])
+                        await writer.drain()
+                        self._pending.popleft()
+            except (OSError, ConnectionError) as e:
+                print(f"Event bus connection lost: {e}")
+                writer.close()
+                self._wakeup.set()
+
+    async def close(self):
+        if self._writer_task:
+            self._writer_task.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+class EventBus:
+    """Publish/subscribe between the bot and its in-process consumers.
+
+    ``publish`` never blocks: events are queued and handed to subscribers by
+    one dispatcher task in publish order, so a status change reaches the
+    WebSocket clients within milliseconds without touching the database.
+    Handlers subscribe to an event class and receive its subclasses too;
+    they may be plain functions or coroutines. ``immediate`` handlers are
+    plain functions called inside ``publish`` itself, for cache
+    invalidation that must not lag behind the write that caused it.
+    """
+
+    def __init__(self, transport: Optional[EventTransport] = None):
+        self.transport = transport or EventTransport()
+        self.metrics = EventMetrics()
+        self._handlers: Dict[Type[Event], List[Handler]] = defaultdict(list)
+        self._immediate: Dict[Type[Event], List[Callable[[Event], None]]] = defaultdict(list)
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.subscribe(Event, self.metrics.observe)
+
+    async def listen(self):
+        """Receive events published in other processes (the web side)."""
+        await self.transport.listen(self)
+
+    async def connect(self):
+        """Forward events published here to another process (the bot side)."""
+        await self.transport.connect()
+
+    def subscribe(self, event_type: Type[Event], handler: Handler, immediate: bool = False):
+        """Call ``handler`` for every published event of ``event_type``."""
+        (self._immediate if immediate else self._handlers)[event_type].append(handler)
+
+    def publish(self, event: Event):
+        """Deliver an event to local subscribers and forward it through the transport."""
+        self.deliver(event)
+        self.transport.send(event)
+
+    def deliver(self, event: Event):
+        """Queue an event for local subscribers only."""
+        for event_type in type(event).__mro__:
+            for handler in self._immediate.get(event_type, ()):
+                try:
+                    handler(event)
+                except Exception as e:
+                    print(f"Error handling {type(event).__name__}: {e}")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No running loop (e.g. during shutdown); nobody is listening
+            return
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._dispatcher = loop.create_task(self._dispatch(self._queue))
+        self._queue.put_nowait(event)
+
+    async def _dispatch(self, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            for event_type in type(event).__mro__:
+                for handler in self._handlers.get(event_type, ()):
+                    try:
+                        result = handler(event)
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        print(f"Error handling {type(event).__name__}: {e}")
+
+    async def close(self):
+        """Stop the transport and the dispatcher."""
+        await self.transport.close()
+        if self._dispatcher:
+            self._dispatcher.cancel()
+
+
+def transport_from_env() -> EventTransport:
+    """Pick the event transport named by EVENT_BUS_TRANSPORT."""
+    name = os.getenv("EVENT_BUS_TRANSPORT", "local").lower()
+    if name == "unix":
+        return UnixSocketTransport(os.getenv("EVENT_BUS_SOCKET", "data/snowlander-events.sock"))
+    if name != "local":
+        print(f"Unknown EVENT_BUS_TRANSPORT {name!r}; using local")
+    return EventTransport()
+
+
+# Global event bus instance
+event_bus = EventBus(transport=transport_from_env())
+
+
+def publish_queue_change(guild_id: Optional[str], op: str, **data):
+    """Publish a committed queue change.
+
+    Call right after the commit, before awaiting anything else, so the
+    changes are versioned in commit order.
+    """
+    event_bus.publish(QueueChanged(guild_id=guild_id, op=op, data=data))
@@ -0,0 +1,169 @@
+"""Buffered play-history logging and periodic rollups into track statistics."""
+
+import os
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from web.database import db
+from web.models import Track, PlayEvent, RollupState, DailyTrackPlays, DailyUserPlays
+from .events import TracksChanged, event_bus
+
+
+ROLLUP_NAME = "play_events"
+
+
+class PlayHistory:
+    """Collects play events in memory and bulk-inserts them into play_events.
+
+    A separate rollup folds new events into ``Track.play_count``,
+    ``Track.last_played`` and the daily aggregate tables in one transaction,
+    so playback never updates the tracks table row by row.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_buffer: int = 500, rollup_interval: float = 60.0):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.rollup_interval = rollup_interval
+        self._buffer: List[Dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._rollup_lock = asyncio.Lock()
+
+    def record(self, track_id: int, guild_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Buffer a play event."""
+        self._buffer.append({
+            "track_id": track_id,
+            "guild_id": guild_id,
+            "user_id": user_id,
+            "played_at": datetime.utcnow(),
+        })
+
+        if len(self._buffer) >= self.max_buffer:
+            asyncio.get_running_loop().create_task(self.flush())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """Bulk-insert buffered events."""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            events, self._buffer = self._buffer, []
+
+            try:
+                if not db.engine:
+                    await db.initialize()
+                async with db.engine.begin() as conn:
+                    await conn.execute(insert(PlayEvent), events)
+            except Exception as e:
+                print(f"Error writing play history: {e}")
+                self._buffer = events + self._buffer
+
+    async def rollup(self) -> int:
+        """Fold events logged since the last rollup into statistics.
+
+        Returns the number of events processed.
+        """
+        async with self._rollup_lock:
+            if not db.engine:
+                await db.initialize()
+
+            async with db.engine.begin() as conn:
+                last_id = (await conn.execute(
+                    select(RollupState.last_id).where(RollupState.name == ROLLUP_NAME)
+                )).scalar() or 0
+                max_id = (await conn.execute(select(func.max(PlayEvent.id)))).scalar()
+                if not max_id or max_id <= last_id:
+                    return 0
+
+                in_window = (PlayEvent.id > last_id) & (PlayEvent.id <= max_id)
+                day = func.date(PlayEvent.played_at)
+
+                # play_count and last_played via a single UPDATE ... FROM
+                per_track = (
+                    select(
+                        PlayEvent.track_id,
+                        func.count().label("plays"),
+                        func.max(PlayEvent.played_at).label("last_played")
+                    )
+                    .where(in_window)
+                    .group_by(PlayEvent.track_id)
+                    .subquery()
+                )
+                await conn.execute(
+                    update(Track)
+                    .where(Track.id == per_track.c.track_id)
+                    .values(
+                        play_count=func.coalesce(Track.play_count, 0) + per_track.c.plays,
+                        last_played=per_track.c.last_played
+                    )
+                )
+
+                daily_tracks = sqlite_insert(DailyTrackPlays).from_select(
+                    ["day", "track_id", "play_count"],
+                    select(day, PlayEvent.track_id, func.count())
+                    .where(in_window)
+                    .group_by(day, PlayEvent.track_id)
+                )
+                await conn.execute(daily_tracks.on_conflict_do_update(
+                    index_elements=["day", "track_id"],
+                    set_={"play_count": DailyTrackPlays.play_count + daily_tracks.excluded.play_count}
+                ))
+
+                daily_users = sqlite_insert(DailyUserPlays).from_select(
+                    ["day", "user_id", "play_count"],
+                    select(day, PlayEvent.user_id, func.count())
+                    .where(in_window & PlayEvent.user_id.is_not(None))
+                    .group_by(day, PlayEvent.user_id)
+                )
+                await conn.execute(daily_users.on_conflict_do_update(
+                    index_elements=["day", "user_id"],
+                    set_={"play_count": DailyUserPlays.play_count + daily_users.excluded.play_count}
+                ))
+
+                state = sqlite_insert(RollupState).values(
+                    name=ROLLUP_NAME, last_id=max_id, updated_at=datetime.utcnow()
+                )
+                await conn.execute(state.on_conflict_do_update(
+                    index_elements=["name"],
+                    set_={"last_id": state.excluded.last_id, "updated_at": state.excluded.updated_at}
+                ))
+
+            # After the commit: play counts and last played times changed
+            event_bus.publish(TracksChanged())
+            return max_id - last_id
+
+    async def run_rollups(self):
+        """Flush and roll up play history periodically until cancelled."""
+        while True:
+            await asyncio.sleep(self.rollup_interval)
+            try:
+                await self.flush()
+                await self.rollup()
+            except Exception as e:
+                print(f"Error rolling up play history: {e}")
+
+    async def close(self):
+        """Persist buffered events and fold them into statistics."""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        try:
+            await self.rollup()
+        except Exception as e:
+            print(f"Error rolling up play history: {e}")
+
+
+# Global play history instance
+play_history = PlayHistory(
+    flush_interval=float(os.getenv("PLAY_HISTORY_FLUSH_SECONDS", 5)),
+    rollup_interval=float(os.getenv("PLAY_HISTORY_ROLLUP_SECONDS", 60))
+)
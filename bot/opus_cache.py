@@ -0,0 +1,246 @@
+"""On-disk cache of tracks pre-transcoded to 48 kHz Opus for passthrough playback."""
+
+import os
+import asyncio
+import hashlib
+import shutil
+from typing import Dict, Optional, Set, Tuple
+
+import discord
+from discord.oggparse import OggStream
+from sqlalchemy import select
+
+from web.database import db
+from web.models import Track
+from library.loudness import normalization_gain
+
+
+FFMPEG = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+
+def opus_cache_enabled() -> bool:
+    """Check whether the Opus cache is enabled in the environment."""
+    return os.getenv("OPUS_CACHE", "True").lower() == "true"
+
+
+class CachedOpusSource(discord.AudioSource):
+    """Reads Opus packets straight from a cached Ogg file.
+
+    The voice client sends the packets as they are, so playback needs
+    neither FFmpeg nor an encoder. ``read_pcm`` decodes a packet for the
+    mixer when volume or crossfades have to be applied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._packets = OggStream(self._file).iter_packets()
+        self._decoder = None
+
+    def read(self) -> bytes:
+        for packet in self._packets:
+            # Skip the identification and comment headers
+            if not packet.startswith((b"OpusHead", b"OpusTags")):
+                return packet
+        return b""
+
+    def read_pcm(self) -> bytes:
+        packet = self.read()
+        if not packet:
+            return b""
+        if self._decoder is None:
+            self._decoder = discord.opus.Decoder()
+        return self._decoder.decode(packet)
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        self._packets.close()
+        self._file.close()
+
+
+class OpusCache:
+    """Transcodes tracks once to Ogg Opus and serves them within a size budget.
+
+    Entries are named after the source path, its size and mtime and the
+    loudness gain baked into the audio, so an edited or re-measured file
+    simply misses and is transcoded again; the stale entry is removed when
+    the new one is written. Each hit touches the entry's mtime,
+    which is what least-recently-used eviction orders by.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, workers: int = 1, bitrate: str = "128k"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bitrate = bitrate
+        self._workers = asyncio.Semaphore(workers)
+        self._in_flight: Set[Tuple[str, float]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._sizes: Optional[Dict[str, int]] = None
+
+    @property
+    def available(self) -> bool:
+        return opus_cache_enabled() and shutil.which(FFMPEG) is not None
+
+    @staticmethod
+    def _key(track_path: str) -> str:
+        return hashlib.sha1(os.path.abspath(track_path).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, track_path: str, gain_db: float) -> Optional[str]:
+        try:
+            stat = os.stat(track_path)
+        except OSError:
+            return None
+        # Gain in tenths of a dB, as rounded by normalization_gain
+        name = f"{self._key(track_path)}-{stat.st_size}-{stat.st_mtime_ns}-{round(gain_db * 10)}.opus"
+        return os.path.join(self.directory, name)
+
+    def lookup(self, track_path: str, gain_db: float = 0.0) -> Optional[str]:
+        """Return the cached Opus file for a track, or None. Blocking; touches the entry."""
+        entry = self._entry_path(track_path, gain_db)
+        if not entry:
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            return None
+        return entry
+
+    def open(self, track_path: str, gain_db: float = 0.0) -> Optional[CachedOpusSource]:
+        """Open a passthrough source for a cached track, or None on a miss. Blocking."""
+        entry = self.lookup(track_path, gain_db)
+        if not entry:
+            return None
+        try:
+            return CachedOpusSource(entry)
+        except OSError:
+            return None
+
+    def warm(self, track_path: str, gain_db: float = 0.0):
+        """Transcode a track in the background unless cached or already in progress."""
+        key = (track_path, gain_db)
+        if not track_path or key in self._in_flight or not self.available:
+            return
+        self._in_flight.add(key)
+        task = asyncio.get_running_loop().create_task(self._transcode(track_path, gain_db))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _transcode(self, track_path: str, gain_db: float):
+        try:
+            async with self._workers:
+                entry = await asyncio.to_thread(self._entry_path, track_path, gain_db)
+                if not entry or await asyncio.to_thread(os.path.exists, entry):
+                    return
+
+                os.makedirs(self.directory, exist_ok=True)
+                partial = f"{entry}.part"
+                process = await asyncio.create_subprocess_exec(
+                    FFMPEG, "-nostdin", "-loglevel", "error", "-y",
+                    "-i", track_path, "-vn", "-map", "0:a:0",
+                    "-af", f"volume={gain_db}dB",
+                    "-c:a", "libopus", "-b:a", self.bitrate, "-ar", "48000", "-ac", "2",
+                    "-frame_duration", "20", "-application", "audio",
+                    "-f", "ogg", partial,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    _, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    await process.wait()
+                    await asyncio.to_thread(self._discard, partial)
+                    raise
+                if process.returncode != 0:
+                    print(f"Error transcoding {track_path} for the Opus cache: {stderr.decode(errors='replace').strip()}")
+                    await asyncio.to_thread(self._discard, partial)
+                    return
+
+                await asyncio.to_thread(self._store, track_path, partial, entry)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error caching {track_path}: {e}")
+        finally:
+            self._in_flight.discard((track_path, gain_db))
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _load_sizes(self) -> Dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            if os.path.isdir(self.directory):
+                with os.scandir(self.directory) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(".opus"):
+                            self._sizes[entry.path] = entry.stat().st_size
+        return self._sizes
+
+    def _store(self, track_path: str, partial: str, entry: str):
+        """Publish a finished transcode, drop stale versions and enforce the budget."""
+        sizes = self._load_sizes()
+        os.replace(partial, entry)
+        sizes[entry] = os.path.getsize(entry)
+
+        prefix = os.path.join(self.directory, self._key(track_path) + "-")
+        for path in [p for p in sizes if p.startswith(prefix) and p != entry]:
+            self._discard(path)
+            sizes.pop(path, None)
+
+        self._evict(keep=entry)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Delete least recently used entries until the cache fits its budget."""
+        sizes = self._load_sizes()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        def last_used(path):
+            try:
+                return os.stat(path).st_mtime
+            except OSError:
+                return 0.0
+
+        for path in sorted(sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._discard(path)
+            total -= sizes.pop(path)
+
+    async def warm_popular(self, limit: int = 100):
+        """Transcode the most played tracks in the background."""
+        if not self.available or limit <= 0:
+            return
+        async with db.read_session() as session:
+            result = await session.execute(
+                select(Track.filepath, Track.loudness, Track.true_peak)
+                .where(Track.play_count > 0)
+                .order_by(Track.play_count.desc())
+                .limit(limit)
+            )
+            for filepath, loudness, true_peak in result:
+                self.warm(filepath, normalization_gain(loudness, true_peak))
+
+    async def close(self):
+        """Cancel background transcodes."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Global Opus cache instance
+opus_cache = OpusCache(
+    directory=os.getenv("OPUS_CACHE_DIR", "data/cache/opus"),
+    max_bytes=int(os.getenv("OPUS_CACHE_MAX_MB", 2048)) * 1024 * 1024,
+    workers=int(os.getenv("OPUS_CACHE_WORKERS", 1))
+)
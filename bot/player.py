@@ -0,0 +1,491 @@
+"""Per-guild playback: one player, voice client and FFmpeg pipeline per server."""
+
+import os
+import time
+import asyncio
+import discord
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from web.database import db
+from web.models import Track
+from web.queue import mark_played, next_in_queue, upcoming_tracks
+from library.loudness import track_gain
+from .audio import FRAMES_PER_SECOND, MixerSource, PrebufferedSource
+from .state import bot_state
+from .events import QueueChanged, TrackStarted, event_bus, publish_queue_change
+from .history import play_history
+from .opus_cache import opus_cache
+from .decoder_pool import decoder_pool
+
+
+# Upper bound on FFmpeg processes being spawned at once across all guilds
+SPAWN_CONCURRENCY = int(os.getenv("PLAYER_SPAWN_CONCURRENCY", 4))
+
+# Seconds before a track ends at which the next queued track is opened
+PRELOAD_SECONDS = float(os.getenv("GAPLESS_PRELOAD_SECONDS", 5))
+
+# Default overlap between consecutive tracks, and the most a guild may choose
+CROSSFADE_SECONDS = float(os.getenv("CROSSFADE_SECONDS", 0))
+MAX_CROSSFADE_SECONDS = 12.0
+
+# Upcoming queue items transcoded into the Opus cache ahead of playback
+WARM_AHEAD = 5
+
+
+class GuildPlayer:
+    """Playback state and voice connection for a single guild.
+
+    Operations on one guild are serialized by ``lock`` while different
+    guilds proceed concurrently. Blocking work such as starting FFmpeg runs
+    in a worker thread, so a guild that is busy switching tracks never
+    stalls the event loop for the others.
+
+    Queued tracks play back to back: shortly before a track ends the next
+    queue item is opened and pre-buffered, and the ``MixerSource`` switches
+    to it on the frame where the current one runs out, or crossfades into
+    it. A queue edit that changes the head in the meantime swaps the
+    pre-buffered item for the new head. Volume is applied by the mixer, so
+    changes are heard immediately.
+
+    Each track's loudness-normalisation gain comes from the batch analysis
+    in ``library.loudness`` and is applied to the decoded PCM by
+    ``PooledDecoderSource``, or baked into the Opus cache entry, so playback
+    never measures anything.
+
+    Opus cache entries are only used while they can be sent untouched, at
+    full volume without crossfading; otherwise the mixer would decode them
+    and encode the result again, so tracks go to a pooled decoder instead.
+    The next ``WARM_AHEAD`` queue items are transcoded by the player when
+    the queue changes and when a track starts, never by the web server.
+    """
+
+    def __init__(self, registry: "PlayerRegistry", guild_id: str):
+        self.registry = registry
+        self.guild_id = guild_id
+        self.voice_client: Optional[discord.VoiceClient] = None
+        self.current_track = None
+        self.volume = registry.default_volume
+        self.crossfade = registry.default_crossfade
+        self.lock = asyncio.Lock()
+        # Source the voice client is playing; follow-up tracks are chained onto it
+        self.chain: Optional[MixerSource] = None
+        self._preload_task: Optional[asyncio.Task] = None
+        self._preload_lock = asyncio.Lock()
+
+    @property
+    def is_playing(self) -> bool:
+        return bool(self.voice_client and self.voice_client.is_playing())
+
+    @property
+    def is_paused(self) -> bool:
+        return bool(self.voice_client and self.voice_client.is_paused())
+
+    @property
+    def position(self) -> float:
+        """Seconds of the current track delivered to Discord."""
+        return self.chain.position if self.chain else 0.0
+
+    def _update_status(self, **kwargs):
+        bot_state.update(self.guild_id, **kwargs)
+
+    async def join(self, channel: discord.VoiceChannel):
+        """Join or move to a voice channel."""
+        async with self.lock:
+            if self.voice_client:
+                if self.voice_client.channel == channel:
+                    return self.voice_client
+                await self.voice_client.move_to(channel)
+            else:
+                self.voice_client = await channel.connect()
+
+            self._update_status(channel_id=str(channel.id), is_connected=True, volume=self.volume)
+            return self.voice_client
+
+    async def leave(self):
+        """Disconnect from voice."""
+        async with self.lock:
+            self.chain = None
+            self._cancel_preload()
+            if self.voice_client:
+                await self.voice_client.disconnect()
+                self.voice_client = None
+            self.current_track = None
+
+            self._update_status(is_connected=False, is_playing=False, current_track_id=None)
+
+    def disconnected(self):
+        """Forget the voice client after Discord dropped the connection."""
+        self.voice_client = None
+        self.chain = None
+        self._cancel_preload()
+        self.current_track = None
+        self._update_status(is_connected=False, is_playing=False, current_track_id=None)
+
+    def moved(self, channel):
+        """Record that the bot was moved to another channel."""
+        self._update_status(channel_id=str(channel.id), is_connected=True)
+
+    @property
+    def passes_through(self) -> bool:
+        """True when cached Opus can go out as-is: full volume and no crossfade."""
+        return self.volume == 1.0 and self.crossfade == 0
+
+    def warm(self, track_path: str, gain_db: float = 0.0):
+        """Transcode a track into the Opus cache if this player would send it as-is."""
+        if self.passes_through:
+            opus_cache.warm(track_path, gain_db)
+
+    async def _warm_upcoming(self):
+        """Transcode the next few queued tracks so they play from the Opus cache."""
+        if not self.passes_through:
+            return
+        try:
+            async with db.read_session() as session:
+                tracks = await upcoming_tracks(session, self.guild_id, WARM_AHEAD)
+            for track in tracks:
+                self.warm(track.filepath, track_gain(track))
+        except Exception as e:
+            print(f"Error warming upcoming tracks in guild {self.guild_id}: {e}")
+
+    def _create_source(self, track_path: str, gain_db: float = 0.0):
+        """Start decoding a track on a warm FFmpeg decoder. Runs in a worker thread."""
+        return decoder_pool.open(track_path, gain_db)
+
+    def _open_source(self, track_path: str, gain_db: float = 0.0) -> discord.AudioSource:
+        """Open a track for playback. Runs in a worker thread.
+
+        Tracks in the Opus cache are read directly when they can be passed
+        through; others go to a pooled FFmpeg decoder and have their first
+        second of audio decoded.
+        """
+        cached = opus_cache.open(track_path, gain_db) if self.passes_through else None
+        if cached:
+            return cached
+        return PrebufferedSource(self._create_source(track_path, gain_db)).prebuffer()
+
+    async def play_track(self, track_path: str, track_id: int = None, requested_by: str = None, gain_db: float = 0.0):
+        """Play a track from the local filesystem, replacing whatever is playing.
+
+        ``gain_db`` is the track's loudness-normalisation gain, see ``track_gain``.
+        """
+        started = time.perf_counter()
+        async with self.lock:
+            if not self.voice_client:
+                raise ValueError("Not connected to a voice channel")
+
+            # Popen blocks; keep it off the event loop and cap concurrent spawns
+            async with self.registry.spawn_slots:
+                audio_source = await asyncio.to_thread(self._open_source, track_path, gain_db)
+
+            self.chain = None
+            if self.voice_client.is_playing() or self.voice_client.is_paused():
+                self.voice_client.stop()
+
+            # Both callbacks arrive on the voice client's audio thread
+            loop = asyncio.get_running_loop()
+            chain = MixerSource(
+                audio_source,
+                on_advance=lambda tag: loop.call_soon_threadsafe(self._advanced, chain, tag),
+                volume=self.volume,
+                crossfade_frames=round(self.crossfade * FRAMES_PER_SECOND)
+            )
+            self.chain = chain
+            self.voice_client.play(
+                chain,
+                after=lambda e: loop.call_soon_threadsafe(self._schedule_finished, chain, e)
+            )
+            decoder_pool.metrics.record_playback_start(time.perf_counter() - started)
+
+            self._started(track_path, track_id, requested_by, gain_db=gain_db)
+
+    def _started(
+        self,
+        track_path: str,
+        track_id: Optional[int],
+        requested_by: Optional[str],
+        played_item_id: int = None,
+        gain_db: float = 0.0
+    ):
+        """Record a newly started track and start preparing its successor."""
+        self.current_track = {
+            'path': track_path,
+            'id': track_id
+        }
+
+        self._update_status(is_playing=True, current_track_id=track_id, position=0.0)
+        event_bus.publish(TrackStarted(guild_id=self.guild_id, track_id=track_id, requested_by=requested_by))
+
+        if track_id:
+            play_history.record(track_id, guild_id=self.guild_id, user_id=requested_by)
+
+        # Played tracks are likely to be played again
+        self.warm(track_path, gain_db)
+
+        self._cancel_preload()
+        self._preload_task = asyncio.get_running_loop().create_task(
+            self._preload_next(self.chain, track_id, played_item_id)
+        )
+
+    def _advanced(self, chain: MixerSource, tag):
+        """The chain moved on to the preloaded queue item."""
+        if chain is not self.chain:
+            return
+        item_id, track_id, track_path, requested_by, gain_db = tag
+        self._started(track_path, track_id, requested_by, played_item_id=item_id, gain_db=gain_db)
+
+    def _cancel_preload(self):
+        if self._preload_task and not self._preload_task.done():
+            self._preload_task.cancel()
+        self._preload_task = None
+
+    async def _preload_next(self, chain: MixerSource, track_id: Optional[int], played_item_id: Optional[int]):
+        """Open the next queued track shortly before the current one ends."""
+        try:
+            # The started item must leave the queue before its successor is looked up
+            if played_item_id:
+                await asyncio.shield(self._mark_played(played_item_id))
+            await self._warm_upcoming()
+
+            await asyncio.sleep(await self._preload_delay(track_id))
+            # Shielded so a newer preload cancelling this one never orphans an FFmpeg process
+            await asyncio.shield(self._load_next(chain))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error preparing next track in guild {self.guild_id}: {e}")
+
+    async def _preload_delay(self, track_id: Optional[int]) -> float:
+        if not track_id:
+            return 0.0
+        async with db.read_session() as session:
+            result = await session.execute(select(Track.duration).where(Track.id == track_id))
+            duration = result.scalar()
+        # With crossfading the current track is read that much earlier
+        return max(0.0, (duration or 0.0) - PRELOAD_SECONDS - self.crossfade)
+
+    async def _mark_played(self, item_id: int):
+        async with db.session() as session:
+            marked = await mark_played(session, item_id)
+            await session.commit()
+        if marked:
+            publish_queue_change(self.guild_id, "played", id=item_id)
+
+    async def _load_next(self, chain: MixerSource):
+        """Resolve the next queue item and hand its pre-buffered source to the chain."""
+        async with self._preload_lock:
+            if chain is not self.chain or chain.has_next:
+                return
+
+            async with db.read_session() as session:
+                item = await next_in_queue(session, self.guild_id)
+            if not item:
+                return
+
+            gain_db = track_gain(item.track)
+            async with self.registry.spawn_slots:
+                source = await asyncio.to_thread(self._open_source, item.track.filepath, gain_db)
+
+            if chain is not self.chain:
+                source.cleanup()
+                return
+            chain.set_next(source, (item.id, item.track_id, item.track.filepath, item.requested_by, gain_db))
+
+    def queue_changed(self, event: QueueChanged):
+        """Warm newly queued tracks and re-check a preloaded follow-up after the queue was edited."""
+        # Our own "played" marks never change which item is next
+        if event.op == "played":
+            return
+        loop = asyncio.get_running_loop()
+        if event.op != "removed":
+            loop.create_task(self._warm_upcoming())
+        if self.chain and self.chain.has_next:
+            loop.create_task(self._revalidate_next(self.chain))
+
+    async def _revalidate_next(self, chain: MixerSource):
+        """Drop the preloaded item if it is no longer the queue head and load the new head."""
+        try:
+            async with self._preload_lock:
+                tag = chain.next_tag
+                if chain is not self.chain or tag is None:
+                    return
+                async with db.read_session() as session:
+                    item = await next_in_queue(session, self.guild_id)
+                if item is not None and item.id == tag[0]:
+                    return
+                chain.clear_next()
+            await asyncio.shield(self._load_next(chain))
+        except Exception as e:
+            print(f"Error preparing next track in guild {self.guild_id}: {e}")
+
+    async def play_next(self) -> bool:
+        """Start the first queued item from scratch. Returns False if the queue is empty."""
+        if not self.voice_client:
+            return False
+
+        async with db.session() as session:
+            item = await next_in_queue(session, self.guild_id)
+            if not item:
+                return False
+            await mark_played(session, item.id)
+            await session.commit()
+            publish_queue_change(self.guild_id, "played", id=item.id)
+
+        try:
+            await self.play_track(item.track.filepath, item.track_id, item.requested_by, gain_db=track_gain(item.track))
+        except Exception as e:
+            print(f"Error playing next track in guild {self.guild_id}: {e}")
+            return False
+        return True
+
+    def _schedule_finished(self, chain, error):
+        asyncio.get_running_loop().create_task(self._on_track_finished(chain, error))
+
+    async def skip(self) -> bool:
+        """Skip to the next queued track without a gap. Returns False if nothing was playing."""
+        chain = self.chain
+        if not chain or not (self.is_playing or self.is_paused):
+            return False
+
+        # Make sure the follow-up is ready so the switch happens on the next frame
+        try:
+            await self._load_next(chain)
+        except Exception as e:
+            print(f"Error preparing next track in guild {self.guild_id}: {e}")
+        chain.skip()
+        if self.is_paused:
+            self.voice_client.resume()
+        return True
+
+    async def pause(self):
+        """Pause the current playback."""
+        if self.voice_client and self.voice_client.is_playing():
+            self.voice_client.pause()
+            self._update_status(is_playing=False, position=self.position)
+
+    async def resume(self):
+        """Resume the current playback."""
+        if self.voice_client and self.voice_client.is_paused():
+            self.voice_client.resume()
+            self._update_status(is_playing=True, position=self.position)
+
+    async def stop(self):
+        """Stop the current playback."""
+        async with self.lock:
+            self.chain = None
+            self._cancel_preload()
+            if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+                self.voice_client.stop()
+
+            self.current_track = None
+            self._update_status(is_playing=False, current_track_id=None, position=0.0)
+
+    async def set_volume(self, volume: float):
+        """Set the playback volume (0.0 to 1.0); a playing track fades to it."""
+        self.volume = max(0.0, min(1.0, volume))
+        if self.chain:
+            self.chain.set_volume(self.volume)
+        self._update_status(volume=self.volume)
+
+    async def set_crossfade(self, seconds: float):
+        """Set how long consecutive tracks overlap; 0 plays them back to back."""
+        self.crossfade = max(0.0, min(MAX_CROSSFADE_SECONDS, seconds))
+        if self.chain:
+            self.chain.set_crossfade(round(self.crossfade * FRAMES_PER_SECOND))
+
+    def duck(self, level: float = 0.3):
+        """Temporarily lower playback to ``level`` of the volume; ``duck(1.0)`` restores it."""
+        if self.chain:
+            self.chain.duck(max(0.0, min(1.0, level)))
+
+    async def _on_track_finished(self, chain, error):
+        """Called when playback ran out of audio with nothing preloaded."""
+        if error:
+            print(f'Player error in guild {self.guild_id}: {error}')
+
+        # Stopped or replaced by a newer track
+        if chain is not self.chain:
+            return
+
+        self.chain = None
+        self._cancel_preload()
+        self.current_track = None
+        self._update_status(is_playing=False, current_track_id=None, position=0.0)
+
+        # Items queued after the last preload still play, just without gapless start
+        await self.play_next()
+
+
+class PlayerRegistry:
+    """Creates and tracks one ``GuildPlayer`` per guild."""
+
+    def __init__(
+        self,
+        default_volume: float = 0.5,
+        default_crossfade: float = CROSSFADE_SECONDS,
+        spawn_concurrency: int = SPAWN_CONCURRENCY,
+        player_class: type = GuildPlayer
+    ):
+        self.default_volume = default_volume
+        self.default_crossfade = default_crossfade
+        self.player_class = player_class
+        self.players: Dict[str, GuildPlayer] = {}
+        self.spawn_slots = asyncio.Semaphore(spawn_concurrency)
+        event_bus.subscribe(QueueChanged, self._queue_changed)
+
+    def _queue_changed(self, event: QueueChanged):
+        player = self.players.get(event.guild_id)
+        if player is not None:
+            player.queue_changed(event)
+
+    def get(self, guild) -> GuildPlayer:
+        """Return the player for a guild (object or id), creating it on first use."""
+        guild_id = str(getattr(guild, "id", guild))
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = self.player_class(self, guild_id)
+        return player
+
+    def find(self, guild) -> Optional[GuildPlayer]:
+        """Return the player for a guild if one exists."""
+        return self.players.get(str(getattr(guild, "id", guild)))
+
+    def position(self, guild_id: str) -> Optional[float]:
+        """Live playback position of a guild, or None if it has no track loaded."""
+        player = self.players.get(guild_id)
+        if player is None or player.chain is None:
+            return None
+        return player.position
+
+    def positions(self) -> List[Dict]:
+        """Live position of every guild with a track loaded."""
+        return [
+            {
+                "guild_id": player.guild_id,
+                "track_id": player.current_track["id"] if player.current_track else None,
+                "position": round(player.position, 3),
+                "is_playing": player.is_playing,
+            }
+            for player in self
+            if player.chain is not None
+        ]
+
+    def remove(self, guild):
+        """Drop a guild's player, e.g. after the bot left the server."""
+        guild_id = str(getattr(guild, "id", guild))
+        self.players.pop(guild_id, None)
+        bot_state.forget(guild_id)
+
+    def __iter__(self):
+        return iter(list(self.players.values()))
+
+    def __len__(self):
+        return len(self.players)
+
+    async def disconnect_all(self):
+        """Leave every voice channel."""
+        await asyncio.gather(
+            *(player.leave() for player in self if player.voice_client),
+            return_exceptions=True
+        )
@@ -0,0 +1,182 @@
+"""In-memory bot state with write-behind persistence to the bot_status table."""
+
+import os
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update, insert
+
+from web.database import db
+from web.models import BotStatus
+from .events import StatusChanged, event_bus
+
+
+class BotStateStore:
+    """Authoritative per-guild bot status, held in memory and flushed to SQLite in batches.
+
+    Each ``update`` merges into a pending change set for its guild; a single
+    flush writes the pending fields of every guild in one transaction at
+    most every ``flush_interval`` seconds, so a burst of skips or volume
+    changes across any number of guilds costs one commit.
+
+    The playback position is only written when playback state changes
+    (start, pause, resume, stop). While a track plays, ``snapshot`` reads the
+    live position from ``position_source`` instead.
+
+    Every update is also published on the event bus as ``StatusChanged``,
+    so the web layer learns of it without reading the table.
+    """
+
+    FIELDS = (
+        "channel_id", "is_connected", "is_playing",
+        "current_track_id", "volume", "position",
+    )
+
+    def __init__(self, flush_interval: float = 0.5):
+        self.flush_interval = flush_interval
+        self.defaults: Dict[str, Any] = {
+            "channel_id": None,
+            "is_connected": False,
+            "is_playing": False,
+            "current_track_id": None,
+            "volume": 0.5,
+            "position": 0.0,
+        }
+        self.guilds: Dict[str, Dict[str, Any]] = {}
+        # Guild touched most recently; the web UI shows it when no guild is given
+        self.last_guild_id: Optional[str] = None
+        # True once a bot in this process owns the state; readers fall back to the DB otherwise
+        self.active = False
+        # Returns a guild's live playback position, or None; set by the bot
+        self.position_source: Optional[Callable[[str], Optional[float]]] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._reset_rows = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._row_ids: Dict[str, int] = {}
+
+    def activate(self, **defaults):
+        """Mark the in-memory state as authoritative and set per-guild defaults."""
+        self.active = True
+        self.defaults.update((key, value) for key, value in defaults.items() if key in self.FIELDS)
+        # Rows left by a previous run describe connections that no longer exist
+        self._reset_rows = True
+        self._schedule_flush()
+
+    def guild_ids(self) -> List[str]:
+        """Guilds with in-memory state."""
+        return list(self.guilds)
+
+    def get(self, guild_id: str) -> Dict[str, Any]:
+        """Return the live state dict for a guild, creating it from the defaults."""
+        state = self.guilds.get(guild_id)
+        if state is None:
+            state = self.guilds[guild_id] = dict(self.defaults, last_updated=datetime.utcnow())
+        return state
+
+    def snapshot(self, guild_id: Optional[str] = None) -> Dict[str, Any]:
+        """Return a copy of a guild's state, defaulting to the last active guild."""
+        guild_id = guild_id or self.last_guild_id
+        if guild_id is None or guild_id not in self.guilds:
+            return dict(self.defaults, guild_id=guild_id, last_updated=None)
+        state = dict(self.guilds[guild_id], guild_id=guild_id)
+        if self.position_source and state["current_track_id"] is not None:
+            position = self.position_source(guild_id)
+            if position is not None:
+                state["position"] = position
+        return state
+
+    def update(self, guild_id: str, **kwargs):
+        """Apply field changes for a guild in memory and schedule a coalesced flush."""
+        state = self.get(guild_id)
+        changes = {key: value for key, value in kwargs.items() if key in self.FIELDS}
+        state.update(changes)
+        state["last_updated"] = datetime.utcnow()
+        self.last_guild_id = guild_id
+
+        pending = self._pending.setdefault(guild_id, {})
+        pending.update(changes)
+        # Even an empty update refreshes last_updated in the row
+        pending["last_updated"] = state["last_updated"]
+        self._schedule_flush()
+
+        status = self.snapshot(guild_id)
+        del status["last_updated"]
+        event_bus.publish(StatusChanged(guild_id=guild_id, status=status))
+
+    def forget(self, guild_id: str):
+        """Drop in-memory state for a guild the bot has left."""
+        self.guilds.pop(guild_id, None)
+        if self.last_guild_id == guild_id:
+            self.last_guild_id = next(iter(self.guilds), None)
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+            except RuntimeError:
+                # No running loop (e.g. during shutdown); close() will flush
+                self._flush_task = None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # Shielded so close() cancelling the timer never interrupts a write
+        await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """Persist all pending changes of every guild in one transaction."""
+        async with self._flush_lock:
+            if not self._pending and not self._reset_rows:
+                return
+            pending, self._pending = self._pending, {}
+            reset_rows, self._reset_rows = self._reset_rows, False
+
+            try:
+                if not db.engine:
+                    await db.initialize()
+
+                async with db.engine.begin() as conn:
+                    if reset_rows:
+                        await conn.execute(
+                            update(BotStatus).values(is_connected=False, is_playing=False, current_track_id=None)
+                        )
+
+                    missing = [guild_id for guild_id in pending if guild_id not in self._row_ids]
+                    if missing:
+                        result = await conn.execute(
+                            select(BotStatus.guild_id, BotStatus.id).where(BotStatus.guild_id.in_(missing))
+                        )
+                        self._row_ids.update(result.all())
+
+                    for guild_id, changes in pending.items():
+                        row_id = self._row_ids.get(guild_id)
+                        if row_id is None:
+                            state = self.guilds.get(guild_id, self.defaults)
+                            values = {key: state[key] for key in self.FIELDS}
+                            result = await conn.execute(
+                                insert(BotStatus).values(
+                                    guild_id=guild_id, last_updated=changes["last_updated"], **values
+                                )
+                            )
+                            self._row_ids[guild_id] = result.inserted_primary_key[0]
+                        else:
+                            await conn.execute(
+                                update(BotStatus).where(BotStatus.id == row_id).values(**changes)
+                            )
+            except Exception as e:
+                print(f"Error updating bot status: {e}")
+                # Keep the changes for the next flush, newer values winning
+                for guild_id, changes in pending.items():
+                    self._pending[guild_id] = {**changes, **self._pending.get(guild_id, {})}
+                self._reset_rows = self._reset_rows or reset_rows
+
+    async def close(self):
+        """Cancel the pending timer and flush immediately."""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+
+# Global bot state instance
+bot_state = BotStateStore(flush_interval=int(os.getenv("BOT_STATUS_FLUSH_MS", 500)) / 1000)
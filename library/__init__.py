@@ -0,0 +1 @@
+# SNOWLANDER Library Package
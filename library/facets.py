@@ -0,0 +1,98 @@
+"""Artist, album and genre facet counts for library browsing."""
+
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+
+from web.models import Track, TrackFacet
+from .search import apply_search
+
+
+FACETS = ("artist", "album", "genre")
+
+_FACET_KEY = "coalesce({row}.artist, ''), coalesce({row}.album, ''), coalesce({row}.genre, '')"
+_FACET_MATCH = (
+    "artist = coalesce({row}.artist, '') AND album = coalesce({row}.album, '') "
+    "AND genre = coalesce({row}.genre, '')"
+)
+
+
+def _trigger_statements():
+    add_new = f"""
+        INSERT INTO track_facets (artist, album, genre, track_count)
+        VALUES ({_FACET_KEY.format(row="new")}, 1)
+        ON CONFLICT (artist, album, genre) DO UPDATE SET track_count = track_count + 1;
+    """
+    remove_old = f"""
+        UPDATE track_facets SET track_count = track_count - 1 WHERE {_FACET_MATCH.format(row="old")};
+        DELETE FROM track_facets WHERE track_count <= 0 AND {_FACET_MATCH.format(row="old")};
+    """
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS track_facets_insert AFTER INSERT ON tracks BEGIN {add_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS track_facets_delete AFTER DELETE ON tracks BEGIN {remove_old} END",
+        f"""CREATE TRIGGER IF NOT EXISTS track_facets_update AFTER UPDATE OF artist, album, genre ON tracks
+            BEGIN {remove_old} {add_new} END""",
+    ]
+
+
+def setup_facet_index(connection):
+    """Create the triggers that keep track_facets in step with tracks.
+
+    Runs through ``AsyncConnection.run_sync`` during database initialization.
+    The aggregate is rebuilt the first time the triggers are installed.
+    """
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'track_facets_insert'"
+    ).first() is not None
+
+    for statement in _trigger_statements():
+        connection.exec_driver_sql(statement)
+
+    if not exists:
+        connection.exec_driver_sql("DELETE FROM track_facets")
+        connection.exec_driver_sql(f"""
+            INSERT INTO track_facets (artist, album, genre, track_count)
+            SELECT {_FACET_KEY.format(row="tracks")}, count(*)
+            FROM tracks
+            GROUP BY 1, 2, 3
+        """)
+
+
+async def get_facet_counts(
+    session,
+    facet: str,
+    search: Optional[str] = None,
+    artist: Optional[str] = None,
+    album: Optional[str] = None,
+    genre: Optional[str] = None,
+    limit: int = 500
+) -> List[Dict]:
+    """Count tracks per artist, album or genre under the /api/tracks filters.
+
+    Served from the track_facets aggregate; only free-text searches fall
+    back to grouping the matching tracks themselves.
+    """
+    if facet not in FACETS:
+        raise ValueError(f"Unknown facet: {facet}")
+
+    if search:
+        column = func.coalesce(getattr(Track, facet), "")
+        query = apply_search(select(column, func.count(Track.id)), search, ranked=False)
+        filters = {"artist": Track.artist, "album": Track.album, "genre": Track.genre}
+    else:
+        column = getattr(TrackFacet, facet)
+        query = select(column, func.sum(TrackFacet.track_count))
+        filters = {"artist": TrackFacet.artist, "album": TrackFacet.album, "genre": TrackFacet.genre}
+
+    for name, value in (("artist", artist), ("album", album), ("genre", genre)):
+        if value:
+            # SQLite LIKE is already case-insensitive for ASCII; skipping lower() halves the scan cost
+            query = query.where(filters[name].like(f"%{value}%"))
+
+    query = query.group_by(column).order_by(column).limit(limit)
+    result = await session.execute(query)
+
+    return [
+        {"value": value or None, "track_count": count}
+        for value, count in result
+    ]
@@ -0,0 +1,311 @@
+"""Batch EBU R128 loudness analysis and the playback gain derived from it."""
+
+import os
+import re
+import math
+import time
+import shutil
+import asyncio
+import subprocess
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, func, bindparam
+
+from web.database import db
+from web.models import Track
+from bot.events import TracksChanged, event_bus
+
+
+FFMPEG = os.getenv("FFMPEG_PATH", "ffmpeg")
+
+# Tracks are normalised towards this integrated loudness, keeping true peaks below the ceiling
+TARGET_LUFS = float(os.getenv("LOUDNESS_TARGET_LUFS", -14))
+TRUE_PEAK_CEILING = -1.0
+MAX_GAIN_DB = 12.0
+
+_INTEGRATED = re.compile(r"^\s*I:\s+(-?inf|-?[\d.]+) LUFS", re.MULTILINE)
+_TRUE_PEAK = re.compile(r"^\s*Peak:\s+(-?inf|-?[\d.]+) dBFS", re.MULTILINE)
+
+
+def loudness_normalization_enabled() -> bool:
+    """Check whether playback applies the measured loudness gain."""
+    return os.getenv("LOUDNESS_NORMALIZATION", "True").lower() == "true"
+
+
+def normalization_gain(loudness: Optional[float], true_peak: Optional[float]) -> float:
+    """Gain in dB that brings a track to the target loudness; 0 if it was never measured.
+
+    Rounded to 0.1 dB so the same track always maps to the same Opus cache entry.
+    """
+    if loudness is None or not loudness_normalization_enabled():
+        return 0.0
+    gain = TARGET_LUFS - loudness
+    if true_peak is not None:
+        # Never boost a track into clipping
+        gain = min(gain, TRUE_PEAK_CEILING - true_peak)
+    gain = max(-MAX_GAIN_DB, min(MAX_GAIN_DB, gain))
+    return round(gain, 1)
+
+
+def track_gain(track: Track) -> float:
+    """Playback gain in dB for a track row."""
+    return normalization_gain(track.loudness, track.true_peak)
+
+
+def _finite(value: str) -> Optional[float]:
+    number = float(value)
+    return number if math.isfinite(number) else None
+
+
+def _lower_priority():
+    """Worker initializer: run analysis at idle CPU priority so playback is never starved."""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def measure_loudness(path: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """Measure integrated loudness (LUFS) and true peak (dBTP) with FFmpeg's ebur128 filter.
+
+    Runs inside an analysis worker process. Returns None if the file is
+    missing, so it is retried by a later run, and (None, None) if FFmpeg
+    could not measure it.
+    """
+    if not os.path.exists(path):
+        return None
+
+    command = [
+        FFMPEG, "-nostdin", "-hide_banner", "-nostats", "-loglevel", "info",
+        "-i", path, "-vn", "-map", "0:a:0",
+        # Per-frame measurements go to the verbose level; only the summary is printed
+        "-af", "ebur128=peak=true:framelog=verbose",
+        "-f", "null", "-",
+    ]
+    # Idle I/O class so analysis only reads the disk when nothing else does
+    if shutil.which("ionice"):
+        command = ["ionice", "-c", "3"] + command
+
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+    except OSError as e:
+        print(f"Error measuring loudness of {path}: {e}")
+        return None, None
+
+    output = result.stderr.decode(errors="replace")
+    summary = output[output.rfind("Summary:"):]
+    integrated = _INTEGRATED.search(summary)
+    if result.returncode != 0 or "Summary:" not in output or not integrated:
+        print(f"Error measuring loudness of {path}: {output.strip()[-200:]}")
+        return None, None
+
+    true_peak = _TRUE_PEAK.search(summary)
+    return _finite(integrated.group(1)), _finite(true_peak.group(1)) if true_peak else None
+
+
+def measure_loudness_batch(tracks: List[Tuple[int, str]]) -> List[Tuple[int, Optional[float], Optional[float]]]:
+    """Measure a chunk of (track id, path) pairs in one worker round-trip."""
+    rows = []
+    for track_id, path in tracks:
+        measured = measure_loudness(path)
+        if measured is not None:
+            rows.append((track_id, *measured))
+    return rows
+
+
+async def store_loudness(rows: List[Tuple[int, Optional[float], Optional[float]]]):
+    """Write measurements in one transaction; failed tracks are stored without values."""
+    if not rows:
+        return
+
+    if not db.engine:
+        await db.initialize()
+
+    scanned_at = datetime.utcnow()
+    async with db.engine.begin() as conn:
+        await conn.execute(
+            update(Track.__table__)
+            .where(Track.__table__.c.id == bindparam("track_id"))
+            .values(
+                loudness=bindparam("measured_loudness"),
+                true_peak=bindparam("measured_true_peak"),
+                loudness_scanned_at=bindparam("scanned_at")
+            ),
+            [
+                {
+                    "track_id": track_id, "measured_loudness": loudness,
+                    "measured_true_peak": true_peak, "scanned_at": scanned_at
+                }
+                for track_id, loudness, true_peak in rows
+            ]
+        )
+    event_bus.publish(TracksChanged())
+
+
+@dataclass
+class LoudnessProgress:
+    """Running totals for a loudness analysis run."""
+    pending: int = 0
+    processed: int = 0
+    analyzed: int = 0
+    failed: int = 0
+    missing: int = 0
+    finished: bool = False
+    started_at: float = field(default_factory=time.monotonic)
+    elapsed: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+ProgressCallback = Callable[[LoudnessProgress], Awaitable[None]]
+
+
+class LoudnessAnalyzer:
+    """Measures the loudness of every track not analysed yet.
+
+    FFmpeg runs from a small process pool at idle CPU and I/O priority, and
+    results are committed every ``batch_size`` tracks. Pending tracks are the
+    ones without ``loudness_scanned_at``, so an interrupted run picks up where
+    it stopped; the scanner clears the column when a file's audio changes.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        chunk_size: int = 4,
+        batch_size: int = 50,
+        progress_interval: float = 5.0
+    ):
+        self.workers = workers or int(os.getenv("LOUDNESS_WORKERS", 0)) or max(1, (os.cpu_count() or 2) // 2)
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.progress: Optional[LoudnessProgress] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._lock.locked()
+
+    @property
+    def available(self) -> bool:
+        return shutil.which(FFMPEG) is not None
+
+    async def count_pending(self) -> int:
+        """Number of tracks still to be analysed."""
+        if not db.engine:
+            await db.initialize()
+
+        async with db.read_engine.connect() as conn:
+            result = await conn.execute(
+                select(func.count(Track.id)).where(Track.loudness_scanned_at.is_(None))
+            )
+            return result.scalar()
+
+    async def _pending_page(self, after_id: int, limit: int) -> List[Tuple[int, str]]:
+        async with db.read_engine.connect() as conn:
+            result = await conn.execute(
+                select(Track.id, Track.filepath)
+                .where(Track.loudness_scanned_at.is_(None), Track.id > after_id)
+                .order_by(Track.id)
+                .limit(limit)
+            )
+            return [tuple(row) for row in result]
+
+    async def run(self, progress_callback: Optional[ProgressCallback] = None) -> LoudnessProgress:
+        """Analyse all pending tracks."""
+        if self.is_running:
+            raise RuntimeError("Loudness analysis is already running")
+
+        async with self._lock:
+            progress = self.progress = LoudnessProgress(pending=await self.count_pending())
+            last_report = 0.0
+
+            async def report(force: bool = False):
+                nonlocal last_report
+                progress.elapsed = time.monotonic() - progress.started_at
+                now = time.monotonic()
+                if progress_callback and (force or now - last_report >= self.progress_interval):
+                    last_report = now
+                    try:
+                        await progress_callback(progress)
+                    except Exception as e:
+                        print(f"Error reporting loudness progress: {e}")
+
+            await report(force=True)
+            if progress.pending:
+                # Spawned workers avoid forking the event loop and Discord threads
+                context = multiprocessing.get_context("spawn")
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=_lower_priority
+                )
+                try:
+                    await self._analyze(executor, progress, report)
+                finally:
+                    # A cancelled run must not block the event loop on workers still measuring
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+            progress.finished = True
+            await report(force=True)
+            return progress
+
+    async def _analyze(self, executor, progress: LoudnessProgress, report):
+        loop = asyncio.get_running_loop()
+        max_in_flight = self.workers * 2
+        in_flight: Dict[asyncio.Future, int] = {}
+        pending_rows: List[Tuple[int, Optional[float], Optional[float]]] = []
+        # Keyset over track ids, so tracks left pending (missing files) are not picked up twice
+        last_id = 0
+        page: List[Tuple[int, str]] = []
+        exhausted = False
+
+        try:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    if not page and not exhausted:
+                        page = await self._pending_page(last_id, self.batch_size)
+                        exhausted = len(page) < self.batch_size
+                        if page:
+                            last_id = page[-1][0]
+                    if not page:
+                        break
+                    chunk, page = page[:self.chunk_size], page[self.chunk_size:]
+                    future = loop.run_in_executor(executor, measure_loudness_batch, chunk)
+                    in_flight[future] = len(chunk)
+
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    size = in_flight.pop(future)
+                    progress.processed += size
+                    try:
+                        rows = future.result()
+                    except Exception as e:
+                        print(f"Loudness worker error: {e}")
+                        progress.failed += size
+                        continue
+                    progress.missing += size - len(rows)
+                    progress.analyzed += sum(1 for row in rows if row[1] is not None)
+                    progress.failed += sum(1 for row in rows if row[1] is None)
+                    pending_rows.extend(rows)
+
+                # Committing often is what makes an interrupted run resumable
+                if len(pending_rows) >= self.batch_size:
+                    await store_loudness(pending_rows)
+                    pending_rows = []
+
+                await report()
+        finally:
+            # Keep finished measurements even when the run is cancelled
+            await store_loudness(pending_rows)
+
+
+# Global loudness analyzer instance
+loudness_analyzer = LoudnessAnalyzer()
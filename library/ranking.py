@@ -0,0 +1,182 @@
+"""Ranked fuzzy matching of free-text requests to library tracks."""
+
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from sqlalchemy import select
+
+from web.models import Track
+from .search import apply_search, tokenize
+
+
+# Candidates pulled from the index before fuzzy scoring
+CANDIDATE_LIMIT = 50
+
+# Relative weight of each signal in the final score
+WEIGHT_FUZZY = 0.40
+WEIGHT_OVERLAP = 0.20
+WEIGHT_COMBINED = 0.15
+WEIGHT_EXACT = 0.15
+WEIGHT_POPULARITY = 0.10
+
+# A top score at or above this is a strong match on its own
+CONFIDENT_SCORE = 0.6
+
+# Below this confidence the bot asks the user to pick
+AMBIGUOUS_CONFIDENCE = 0.6
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two short strings."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        previous = current
+    return previous[-1]
+
+
+def token_similarity(query_token: str, candidate_token: str) -> float:
+    """Similarity of two words, treating a prefix match as exact."""
+    if candidate_token.startswith(query_token):
+        return 1.0
+    longest = max(len(query_token), len(candidate_token))
+    return 1.0 - edit_distance(query_token, candidate_token) / longest
+
+
+@dataclass
+class TrackMatch:
+    """A scored candidate track."""
+    id: int
+    filepath: str
+    filename: str
+    title: Optional[str]
+    artist: Optional[str]
+    album: Optional[str]
+    play_count: int = 0
+    # Carried along so ``track_gain`` works on a match as on a ``Track``
+    loudness: Optional[float] = None
+    true_peak: Optional[float] = None
+    score: float = 0.0
+
+    @property
+    def display_name(self) -> str:
+        return self.title or self.filename
+
+
+@dataclass
+class MatchResult:
+    """Ranked matches for a query plus how sure we are about the top one."""
+    query: str
+    matches: List[TrackMatch] = field(default_factory=list)
+    confidence: float = 0.0
+
+    @property
+    def best(self) -> Optional[TrackMatch]:
+        return self.matches[0] if self.matches else None
+
+    @property
+    def is_ambiguous(self) -> bool:
+        return len(self.matches) > 1 and self.confidence < AMBIGUOUS_CONFIDENCE
+
+
+def score_candidate(query_tokens: List[str], query_text: str, match: TrackMatch, max_plays: int) -> float:
+    """Combine token overlap, edit distance, artist+title coverage and popularity."""
+    title_tokens = tokenize(match.title) or tokenize(match.filename)
+    artist_tokens = tokenize(match.artist)
+    field_tokens = title_tokens + artist_tokens + tokenize(match.album)
+    if not field_tokens:
+        return 0.0
+
+    # Best fuzzy similarity of each query word against any word of the track
+    similarities = [
+        max(token_similarity(token, candidate) for candidate in field_tokens)
+        for token in query_tokens
+    ]
+    fuzzy = sum(similarities) / len(similarities)
+    overlap = sum(1 for similarity in similarities if similarity >= 1.0) / len(query_tokens)
+
+    # Queries like "queen bohemian" should hit both the artist and the title
+    hits_title = any(max((token_similarity(t, c) for c in title_tokens), default=0) >= 0.8 for t in query_tokens)
+    hits_artist = any(max((token_similarity(t, c) for c in artist_tokens), default=0) >= 0.8 for t in query_tokens)
+    combined = 1.0 if hits_title and hits_artist else 0.5 if hits_title else 0.0
+
+    title_text = " ".join(title_tokens)
+    artist_title = " ".join(artist_tokens + title_tokens)
+    title_artist = " ".join(title_tokens + artist_tokens)
+    exact = 1.0 if query_text in (title_text, artist_title, title_artist) else 0.0
+
+    popularity = math.log1p(match.play_count) / math.log1p(max_plays) if max_plays else 0.0
+
+    return (
+        WEIGHT_FUZZY * fuzzy +
+        WEIGHT_OVERLAP * overlap +
+        WEIGHT_COMBINED * combined +
+        WEIGHT_EXACT * exact +
+        WEIGHT_POPULARITY * popularity
+    )
+
+
+def match_confidence(matches: List[TrackMatch]) -> float:
+    """Confidence in the top match from its score and its lead over the runner-up."""
+    if not matches:
+        return 0.0
+    strength = min(1.0, matches[0].score / CONFIDENT_SCORE)
+    if len(matches) == 1:
+        return strength
+    margin = matches[0].score - matches[1].score
+    return strength * min(1.0, 0.4 + margin * 4)
+
+
+async def _fetch_candidates(session, term: str, match_any: bool) -> List[TrackMatch]:
+    query = select(
+        Track.id, Track.filepath, Track.filename, Track.title,
+        Track.artist, Track.album, Track.play_count, Track.loudness, Track.true_peak
+    )
+    result = await session.execute(apply_search(query, term, match_any).limit(CANDIDATE_LIMIT))
+    return [
+        TrackMatch(
+            id=row.id, filepath=row.filepath, filename=row.filename, title=row.title,
+            artist=row.artist, album=row.album, play_count=row.play_count or 0,
+            loudness=row.loudness, true_peak=row.true_peak
+        )
+        for row in result
+    ]
+
+
+async def rank_tracks(session, term: str, limit: int = 5) -> MatchResult:
+    """Find and rank the tracks that best match a free-text request.
+
+    Candidates come from the full-text index, first requiring every word
+    and then, for misspelled requests, any word stem.
+    """
+    query_tokens = tokenize(term)
+    result = MatchResult(query=term)
+    if not query_tokens:
+        return result
+
+    candidates = await _fetch_candidates(session, term, match_any=False)
+    if not candidates:
+        candidates = await _fetch_candidates(session, term, match_any=True)
+    if not candidates:
+        return result
+
+    query_text = " ".join(query_tokens)
+    max_plays = max(candidate.play_count for candidate in candidates)
+    for candidate in candidates:
+        candidate.score = score_candidate(query_tokens, query_text, candidate, max_plays)
+
+    candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+    result.matches = candidates[:limit]
+    result.confidence = match_confidence(candidates)
+    return result
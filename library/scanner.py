@@ -0,0 +1,549 @@
+"""Music library scanner for SNOWLANDER."""
+
+import os
+import time
+import asyncio
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, delete, update, func, case, or_, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from web.database import db
+from web.models import Track, QueueItem, PlaylistItem, LibraryFile
+from bot.events import PlaylistsChanged, TracksChanged, event_bus, publish_queue_change
+
+
+# Audio formats FFmpeg can play that mutagen can read tags from
+SUPPORTED_EXTENSIONS = {
+    ".mp3", ".flac", ".ogg", ".oga", ".opus", ".m4a", ".mp4",
+    ".aac", ".wav", ".wma", ".aiff", ".aif", ".ape", ".wv",
+}
+
+# Columns refreshed from the file on every scan; play statistics are kept
+UPSERT_COLUMNS = (
+    "filepath", "title", "artist", "album", "genre", "year", "duration",
+    "file_size", "format", "bitrate", "sample_rate",
+)
+
+# Keep IN (...) lists well under SQLite's bound parameter limit
+DELETE_BATCH_SIZE = 500
+
+
+def get_music_directory() -> str:
+    """Return the configured music library root."""
+    return os.getenv("MUSIC_DIRECTORY", os.getenv("MUSIC_DIR", "data/music"))
+
+
+def is_audio_file(path: str) -> bool:
+    """Check whether a path has a supported audio extension."""
+    return os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def iter_audio_files(root: str) -> Iterator[os.DirEntry]:
+    """Walk the library with os.scandir, yielding supported audio files."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and is_audio_file(entry.name):
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Error scanning directory {directory}: {e}")
+
+
+class FileStat(NamedTuple):
+    """Manifest entry for one audio file."""
+    path: str
+    filename: str
+    size: int
+    mtime_ns: int
+    inode: int
+
+    def manifest_row(self) -> Dict:
+        return {
+            "filename": self.filename,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "inode": self.inode,
+        }
+
+
+def stat_file(path: str, root: str) -> Optional[FileStat]:
+    """Stat a single audio file, returning None if it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return FileStat(
+        path=path,
+        filename=os.path.relpath(path, root),
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        inode=stat.st_ino,
+    )
+
+
+def stat_audio_files(root: str, directory: Optional[str] = None) -> List[FileStat]:
+    """Stat every audio file under the library root, or one directory inside it."""
+    stats = []
+    for entry in iter_audio_files(directory or root):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        stats.append(FileStat(
+            path=entry.path,
+            filename=os.path.relpath(entry.path, root),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            inode=stat.st_ino,
+        ))
+    return stats
+
+
+def _first_tag(tags, key: str) -> Optional[str]:
+    """Return the first value of an easy tag, if present."""
+    if not tags:
+        return None
+    values = tags.get(key)
+    if not values:
+        return None
+    value = str(values[0]).strip()
+    return value or None
+
+
+def _parse_year(value: Optional[str]) -> Optional[int]:
+    """Extract a year from a date tag such as '2023' or '2023-04-01'."""
+    if value and len(value) >= 4 and value[:4].isdigit():
+        return int(value[:4])
+    return None
+
+
+def read_metadata(path: str, root: str) -> Optional[Dict]:
+    """Read tags and stream info for a single file.
+
+    Runs inside a scanner worker process, so it must stay a plain
+    module-level function returning picklable data.
+    """
+    import mutagen
+
+    try:
+        stat = os.stat(path)
+        audio = mutagen.File(path, easy=True)
+    except Exception as e:
+        print(f"Error reading metadata from {path}: {e}")
+        return None
+
+    info = getattr(audio, "info", None) if audio is not None else None
+    tags = getattr(audio, "tags", None) if audio is not None else None
+    bitrate = getattr(info, "bitrate", None)
+
+    return {
+        # Relative paths keep the unique filename column unambiguous across albums
+        "filename": os.path.relpath(path, root),
+        "filepath": os.path.abspath(path),
+        "title": _first_tag(tags, "title"),
+        "artist": _first_tag(tags, "artist"),
+        "album": _first_tag(tags, "album"),
+        "genre": _first_tag(tags, "genre"),
+        "year": _parse_year(_first_tag(tags, "date")),
+        "duration": getattr(info, "length", None),
+        "file_size": stat.st_size,
+        "format": os.path.splitext(path)[1].lstrip(".").lower(),
+        "bitrate": int(bitrate // 1000) if bitrate else None,
+        "sample_rate": getattr(info, "sample_rate", None),
+    }
+
+
+def read_metadata_batch(paths: List[str], root: str) -> List[Dict]:
+    """Read a chunk of files in one worker round-trip."""
+    rows = []
+    for path in paths:
+        row = read_metadata(path, root)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+async def upsert_tracks(rows: List[Dict], manifest_rows: Optional[List[Dict]] = None):
+    """Insert or update track rows and their manifest entries in one transaction."""
+    if not rows and not manifest_rows:
+        return
+
+    if not db.engine:
+        await db.initialize()
+
+    async with db.engine.begin() as conn:
+        if rows:
+            stmt = sqlite_insert(Track)
+            # Loudness is measured again only when the audio looks different
+            audio_changed = or_(
+                Track.file_size.is_distinct_from(stmt.excluded.file_size),
+                Track.duration.is_distinct_from(stmt.excluded.duration)
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Track.filename],
+                set_={
+                    **{column: stmt.excluded[column] for column in UPSERT_COLUMNS},
+                    "loudness_scanned_at": case((audio_changed, None), else_=Track.loudness_scanned_at),
+                }
+            )
+            await conn.execute(stmt, rows)
+
+        if manifest_rows:
+            stmt = sqlite_insert(LibraryFile)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[LibraryFile.filename],
+                set_={
+                    "size": stmt.excluded.size,
+                    "mtime_ns": stmt.excluded.mtime_ns,
+                    "inode": stmt.excluded.inode,
+                    "scanned_at": stmt.excluded.scanned_at,
+                }
+            )
+            await conn.execute(stmt, manifest_rows)
+
+    if rows:
+        event_bus.publish(TracksChanged())
+
+
+async def remove_tracks(filenames: Iterable[str]) -> int:
+    """Delete tracks whose files are gone, with their queue and playlist entries."""
+    filenames = list(filenames)
+    if not filenames:
+        return 0
+
+    if not db.engine:
+        await db.initialize()
+
+    affected_queues = set()
+    async with db.engine.begin() as conn:
+        for i in range(0, len(filenames), DELETE_BATCH_SIZE):
+            batch = filenames[i:i + DELETE_BATCH_SIZE]
+            track_ids = select(Track.id).where(Track.filename.in_(batch)).scalar_subquery()
+            result = await conn.execute(
+                delete(QueueItem).where(QueueItem.track_id.in_(track_ids)).returning(QueueItem.guild_id)
+            )
+            affected_queues.update(result.scalars())
+            await conn.execute(delete(PlaylistItem).where(PlaylistItem.track_id.in_(track_ids)))
+            await conn.execute(delete(Track).where(Track.filename.in_(batch)))
+            await conn.execute(delete(LibraryFile).where(LibraryFile.filename.in_(batch)))
+
+    event_bus.publish(TracksChanged())
+    event_bus.publish(PlaylistsChanged())
+    for guild_id in affected_queues:
+        publish_queue_change(guild_id, "reset")
+    return len(filenames)
+
+
+def match_renames(missing: Dict[str, Tuple[int, int, int]], new: Iterable[FileStat]) -> Dict[str, FileStat]:
+    """Pair vanished manifest entries with new files of the same (size, mtime_ns, inode).
+
+    A move or rename within the library keeps all three, so the pair is the
+    same file under a new name rather than a deletion and an addition.
+    """
+    vanished: Dict[Tuple[int, int, int], List[str]] = {}
+    for filename, identity in missing.items():
+        # Some filesystems report no inode numbers
+        if identity[2]:
+            vanished.setdefault(identity, []).append(filename)
+
+    renames = {}
+    for stat in new:
+        candidates = vanished.get((stat.size, stat.mtime_ns, stat.inode))
+        if candidates:
+            renames[candidates.pop()] = stat
+    return renames
+
+
+async def rename_tracks(renames: Dict[str, FileStat]) -> Dict[str, FileStat]:
+    """Move tracks and their manifest entries to new filenames in place.
+
+    Keeping the row keeps its id, so play counts, playlist entries and queue
+    items follow the file. Renames onto a filename that already has a track
+    are skipped and left to the usual delete and insert. Returns the
+    renames applied, keyed by old filename.
+    """
+    if not renames:
+        return {}
+
+    if not db.engine:
+        await db.initialize()
+
+    applied = {}
+    async with db.engine.begin() as conn:
+        old_names = list(renames)
+        for i in range(0, len(old_names), DELETE_BATCH_SIZE):
+            batch = {old: renames[old] for old in old_names[i:i + DELETE_BATCH_SIZE]}
+            taken = set((await conn.execute(
+                select(Track.filename).where(Track.filename.in_([stat.filename for stat in batch.values()]))
+            )).scalars())
+            applied.update((old, stat) for old, stat in batch.items() if stat.filename not in taken)
+
+        if applied:
+            params = [
+                {
+                    "old_filename": old,
+                    "new_filename": stat.filename,
+                    "new_filepath": os.path.abspath(stat.path),
+                    "new_format": os.path.splitext(stat.filename)[1].lstrip(".").lower(),
+                }
+                for old, stat in applied.items()
+            ]
+            await conn.execute(
+                update(Track)
+                .where(Track.filename == bindparam("old_filename"))
+                .values(
+                    filename=bindparam("new_filename"),
+                    filepath=bindparam("new_filepath"),
+                    format=bindparam("new_format")
+                ),
+                params
+            )
+            await conn.execute(
+                update(LibraryFile)
+                .where(LibraryFile.filename == bindparam("old_filename"))
+                .values(filename=bindparam("new_filename")),
+                params
+            )
+
+    if applied:
+        event_bus.publish(TracksChanged())
+    return applied
+
+
+async def filenames_under(directory: str) -> List[str]:
+    """List manifest filenames inside a library-relative directory."""
+    if not db.engine:
+        await db.initialize()
+
+    prefix = directory.rstrip(os.sep) + os.sep
+    async with db.read_engine.connect() as conn:
+        result = await conn.execute(
+            select(LibraryFile.filename).where(
+                func.substr(LibraryFile.filename, 1, len(prefix)) == prefix
+            )
+        )
+        return list(result.scalars())
+
+
+async def load_manifest(filenames: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, int, int]]:
+    """Load the file manifest, or the entries for ``filenames``, as filename -> (size, mtime_ns, inode)."""
+    if not db.engine:
+        await db.initialize()
+
+    query = select(LibraryFile.filename, LibraryFile.size, LibraryFile.mtime_ns, LibraryFile.inode)
+    async with db.read_engine.connect() as conn:
+        if filenames is None:
+            result = await conn.execute(query)
+            return {filename: (size, mtime_ns, inode) for filename, size, mtime_ns, inode in result}
+
+        filenames = list(filenames)
+        manifest = {}
+        for i in range(0, len(filenames), DELETE_BATCH_SIZE):
+            result = await conn.execute(
+                query.where(LibraryFile.filename.in_(filenames[i:i + DELETE_BATCH_SIZE]))
+            )
+            manifest.update((filename, (size, mtime_ns, inode)) for filename, size, mtime_ns, inode in result)
+        return manifest
+
+
+@dataclass
+class ScanProgress:
+    """Running totals for a library scan."""
+    discovered: int = 0
+    processed: int = 0
+    written: int = 0
+    failed: int = 0
+    unchanged: int = 0
+    renamed: int = 0  # Also counted as unchanged
+    removed: int = 0
+    incremental: bool = False
+    finished: bool = False
+    started_at: float = field(default_factory=time.monotonic)
+    elapsed: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+ProgressCallback = Callable[[ScanProgress], Awaitable[None]]
+
+
+class LibraryScanner:
+    """Walks the music directory and bulk-loads tracks into the database.
+
+    Directory walking runs in a thread, tag reading is spread over a process
+    pool and rows are written in large batched upserts. Incremental scans
+    compare each file against the (size, mtime_ns, inode) manifest and only
+    re-read tags for new or changed files; a file that vanished under one
+    name and appeared under another with the same manifest entry is renamed
+    in place instead.
+    """
+
+    def __init__(
+        self,
+        music_directory: Optional[str] = None,
+        workers: Optional[int] = None,
+        chunk_size: int = 64,
+        batch_size: int = 2000,
+        progress_interval: float = 2.0
+    ):
+        self.music_directory = music_directory or get_music_directory()
+        self.workers = workers or int(os.getenv("SCAN_WORKERS", 0)) or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._lock.locked()
+
+    async def scan(
+        self,
+        progress_callback: Optional[ProgressCallback] = None,
+        incremental: bool = True
+    ) -> ScanProgress:
+        """Scan the music directory, re-reading only changed files when incremental."""
+        if self.is_running:
+            raise RuntimeError("A library scan is already running")
+
+        async with self._lock:
+            progress = ScanProgress(incremental=incremental)
+            last_report = 0.0
+
+            async def report(force: bool = False):
+                nonlocal last_report
+                progress.elapsed = time.monotonic() - progress.started_at
+                now = time.monotonic()
+                if progress_callback and (force or now - last_report >= self.progress_interval):
+                    last_report = now
+                    try:
+                        await progress_callback(progress)
+                    except Exception as e:
+                        print(f"Error reporting scan progress: {e}")
+
+            if not os.path.isdir(self.music_directory):
+                raise FileNotFoundError(f"Music directory not found: {self.music_directory}")
+
+            manifest = await load_manifest()
+            stats = await asyncio.to_thread(stat_audio_files, self.music_directory)
+            progress.discovered = len(stats)
+
+            if incremental:
+                changed = [
+                    stat for stat in stats
+                    if manifest.get(stat.filename) != (stat.size, stat.mtime_ns, stat.inode)
+                ]
+            else:
+                changed = stats
+
+            seen = {stat.filename for stat in stats}
+            missing = {filename: identity for filename, identity in manifest.items() if filename not in seen}
+            renamed = await rename_tracks(
+                match_renames(missing, (stat for stat in changed if stat.filename not in manifest))
+            )
+            if renamed:
+                moved = {stat.filename for stat in renamed.values()}
+                changed = [stat for stat in changed if stat.filename not in moved]
+                for filename in renamed:
+                    del missing[filename]
+            progress.renamed = len(renamed)
+            progress.unchanged = len(stats) - len(changed)
+            await report(force=True)
+
+            if changed and len(changed) <= self.chunk_size:
+                # Not worth starting worker processes for a handful of files
+                await self.index_files(changed, None, progress, report)
+            elif changed:
+                # Spawned workers avoid forking the event loop and Discord threads
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+                    await self.index_files(changed, executor, progress, report)
+
+            if missing and not stats:
+                # An empty walk usually means an unmounted volume, not a deleted library
+                print(f"Music directory {self.music_directory} is empty; keeping {len(missing)} tracks")
+            else:
+                progress.removed = await remove_tracks(missing)
+
+            progress.finished = True
+            await report(force=True)
+
+            return progress
+
+    async def index_files(
+        self,
+        stats: List[FileStat],
+        executor=None,
+        progress: Optional[ScanProgress] = None,
+        report: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> ScanProgress:
+        """Read metadata for the given files and upsert tracks plus manifest rows.
+
+        Uses the default thread executor when no process pool is supplied,
+        which suits small batches.
+        """
+        progress = progress or ScanProgress()
+        chunks = [stats[i:i + self.chunk_size] for i in range(0, len(stats), self.chunk_size)]
+        loop = asyncio.get_running_loop()
+        pending_rows: List[Dict] = []
+        pending_manifest: List[Dict] = []
+        max_in_flight = self.workers * 4
+        in_flight: Dict[asyncio.Future, List[FileStat]] = {}
+        next_chunk = 0
+
+        async def flush():
+            nonlocal pending_rows, pending_manifest
+            await upsert_tracks(pending_rows, pending_manifest)
+            progress.written += len(pending_rows)
+            pending_rows, pending_manifest = [], []
+
+        while next_chunk < len(chunks) or in_flight:
+            while next_chunk < len(chunks) and len(in_flight) < max_in_flight:
+                chunk = chunks[next_chunk]
+                paths = [stat.path for stat in chunk]
+                future = loop.run_in_executor(executor, read_metadata_batch, paths, self.music_directory)
+                in_flight[future] = chunk
+                next_chunk += 1
+
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                progress.processed += len(chunk)
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    print(f"Scanner worker error: {e}")
+                    progress.failed += len(chunk)
+                    continue
+                progress.failed += len(chunk) - len(rows)
+                pending_rows.extend(rows)
+                # Unreadable files are recorded too so unchanged ones are not retried
+                scanned_at = datetime.utcnow()
+                pending_manifest.extend({**stat.manifest_row(), "scanned_at": scanned_at} for stat in chunk)
+
+            if len(pending_manifest) >= self.batch_size:
+                await flush()
+
+            if report:
+                await report()
+
+        await flush()
+        return progress
+
+
+# Global scanner instance
+scanner = LibraryScanner()
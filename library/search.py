@@ -0,0 +1,130 @@
+"""Full-text track search backed by SQLite FTS5."""
+
+import re
+from typing import List, Optional
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, func, literal_column
+from sqlalchemy.exc import OperationalError
+
+from web.models import Track
+
+
+# Columns indexed for search, in bm25 weight order
+FTS_COLUMNS = ("title", "artist", "album", "genre", "filename")
+FTS_WEIGHTS = (10.0, 6.0, 3.0, 1.0, 1.0)
+
+# Kept out of Base.metadata so create_all never tries to build the virtual table
+tracks_fts = Table(
+    "tracks_fts",
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    *(Column(name, String) for name in FTS_COLUMNS)
+)
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Stem length used when OR-matching possibly misspelled words
+MATCH_ANY_STEM = 4
+
+# Set by setup_search_index once the database has been inspected
+fts_available = False
+
+
+def _create_statements():
+    columns = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{name}" for name in FTS_COLUMNS)
+    old_values = ", ".join(f"old.{name}" for name in FTS_COLUMNS)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+            {columns},
+            content='tracks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+            INSERT INTO tracks_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+            INSERT INTO tracks_fts(tracks_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END""",
+        # Only indexed columns; play statistics updates skip the index entirely
+        f"""CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF {columns} ON tracks BEGIN
+            INSERT INTO tracks_fts(tracks_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO tracks_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+    ]
+
+
+def setup_search_index(connection) -> bool:
+    """Create the FTS5 index and sync triggers if SQLite supports them.
+
+    Runs through ``AsyncConnection.run_sync`` during database initialization.
+    Existing rows are indexed the first time the table is created.
+    """
+    global fts_available
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tracks_fts'"
+    ).first() is not None
+
+    try:
+        for statement in _create_statements():
+            connection.exec_driver_sql(statement)
+    except OperationalError as e:
+        print(f"SQLite FTS5 unavailable, falling back to LIKE search: {e}")
+        fts_available = False
+        return False
+
+    if not exists:
+        connection.exec_driver_sql("INSERT INTO tracks_fts(tracks_fts) VALUES ('rebuild')")
+
+    fts_available = True
+    return True
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase word tokens."""
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+def build_match_query(term: str, match_any: bool = False) -> Optional[str]:
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    With ``match_any`` the words are OR-ed and cut to short stems, which
+    widens the net for misspelled queries.
+    """
+    tokens = tokenize(term)
+    if not tokens:
+        return None
+    if match_any:
+        stems = dict.fromkeys(token[:MATCH_ANY_STEM] for token in tokens)
+        return " OR ".join(f'"{stem}"*' for stem in stems)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def apply_search(query, term: str, match_any: bool = False, ranked: bool = True):
+    """Filter and rank a ``select(Track)`` query by a search term.
+
+    Uses bm25 over the FTS5 index when available and falls back to
+    ``LIKE`` matching across the searchable columns otherwise. Pass
+    ``ranked=False`` to only filter and keep the caller's ordering.
+    """
+    match_query = build_match_query(term, match_any) if fts_available else None
+
+    if match_query:
+        fts = literal_column("tracks_fts")
+        query = (
+            query.join(tracks_fts, tracks_fts.c.rowid == Track.id)
+            .where(fts.op("MATCH")(match_query))
+        )
+        return query.order_by(func.bm25(fts, *FTS_WEIGHTS)) if ranked else query
+
+    search_filter = f"%{term}%"
+    return query.where(
+        (Track.title.ilike(search_filter)) |
+        (Track.artist.ilike(search_filter)) |
+        (Track.album.ilike(search_filter)) |
+        (Track.genre.ilike(search_filter)) |
+        (Track.filename.ilike(search_filter))
+    )
+
@@ -0,0 +1,73 @@
+"""Track selections for bulk enqueueing: explicit ids, an album, an artist, a playlist or a search."""
+
+from typing import List, Optional
+
+from sqlalchemy import func, select
+
+from web.models import Track, PlaylistItem
+from web.pagination import BROWSE_ORDER
+from .search import apply_search
+
+
+# Albums play in file order, which follows track numbers in the usual naming schemes
+ALBUM_ORDER = (func.coalesce(Track.album, ""), Track.filepath)
+
+
+class InvalidSelection(ValueError):
+    """Raised when a selection names no source of tracks, or more than one."""
+
+
+async def select_tracks(
+    session,
+    track_ids: Optional[List[int]] = None,
+    album: Optional[str] = None,
+    artist: Optional[str] = None,
+    playlist_id: Optional[int] = None,
+    search: Optional[str] = None,
+    limit: int = 1000
+) -> List[Track]:
+    """Resolve a selection to at most ``limit`` tracks, in the order they should play.
+
+    Exactly one source is used: ``track_ids`` (in the given order; unknown
+    ids are skipped), ``playlist_id`` (playlist order), ``search`` (best
+    matches first) or ``album`` and/or ``artist``, matched case-insensitively
+    and played album by album in file order.
+    """
+    sources = [track_ids is not None, playlist_id is not None, bool(search), bool(album or artist)]
+    if sum(sources) != 1:
+        raise InvalidSelection("Select tracks by exactly one of: track ids, playlist, search, album/artist")
+
+    if track_ids is not None:
+        track_ids = track_ids[:limit]
+        result = await session.execute(select(Track).where(Track.id.in_(set(track_ids))))
+        by_id = {track.id: track for track in result.scalars()}
+        return [by_id[track_id] for track_id in track_ids if track_id in by_id]
+
+    if playlist_id is not None:
+        query = (
+            select(Track)
+            .join(PlaylistItem, PlaylistItem.track_id == Track.id)
+            .where(PlaylistItem.playlist_id == playlist_id)
+            .order_by(PlaylistItem.position)
+        )
+    elif search:
+        query = apply_search(select(Track), search).order_by(*BROWSE_ORDER)
+    else:
+        query = select(Track)
+        if album:
+            query = query.where(func.lower(Track.album) == album.lower())
+        if artist:
+            query = query.where(func.lower(Track.artist) == artist.lower())
+        query = query.order_by(*ALBUM_ORDER)
+
+    result = await session.execute(query.limit(limit))
+    return list(result.scalars())
+
+
+async def matching_names(session, facet: str, term: str, limit: int = 5) -> List[str]:
+    """Album or artist names containing ``term``, for suggesting what a request meant."""
+    column = getattr(Track, facet)
+    result = await session.execute(
+        select(column).where(column.ilike(f"%{term}%")).distinct().order_by(column).limit(limit)
+    )
+    return list(result.scalars())
@@ -0,0 +1,219 @@
+"""Streaming NDJSON export and import of the track library.
+
+Both directions work in fixed-size batches so a library of any size moves
+through in constant memory: the export reads from a server-side cursor on
+a read connection, and the import parses the request body line by line
+and upserts each batch of rows in its own short write transaction.
+"""
+
+import json
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import Column, MetaData, Table, delete, func, insert, or_, select, true
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from web.database import db
+from web.models import Track
+from web.serialization import dumps, orjson
+from bot.events import TracksChanged, event_bus
+
+
+# Every stored column; ``id`` is exported for tools that refer to tracks by id but ignored on import
+EXPORT_FIELDS = (
+    "id", "filename", "filepath", "title", "artist", "album", "genre", "year",
+    "duration", "file_size", "format", "bitrate", "sample_rate", "created_at",
+    "last_played", "play_count", "loudness", "true_peak", "loudness_scanned_at",
+)
+
+# Types accepted on import; rows are matched to existing tracks by filename
+IMPORT_FIELDS = {
+    "filename": str, "filepath": str, "title": str, "artist": str, "album": str,
+    "genre": str, "year": int, "duration": float, "file_size": int, "format": str,
+    "bitrate": int, "sample_rate": int, "created_at": datetime, "last_played": datetime,
+    "play_count": int, "loudness": float, "true_peak": float, "loudness_scanned_at": datetime,
+}
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+# Per-connection staging table each import batch is loaded into; kept out of Base.metadata
+track_import = Table(
+    "track_import",
+    MetaData(),
+    *(Column(name, Track.__table__.c[name].type) for name in IMPORT_FIELDS),
+    prefixes=["TEMPORARY"]
+)
+
+# A longer line is rejected without being buffered whole
+MAX_LINE_BYTES = 64 * 1024
+
+# Only the first few bad lines are reported back
+MAX_REPORTED_ERRORS = 20
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+@dataclass
+class ImportResult:
+    """Outcome of a library import."""
+    imported: int = 0  # Rows inserted or updated
+    unchanged: int = 0  # Valid rows that matched the stored track exactly
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def reject(self, line_number: int, reason: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_number}: {reason}")
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+async def export_tracks(batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Yield the whole library as NDJSON, ``batch_size`` lines per chunk, in id order.
+
+    Rows come from a server-side cursor, so only one batch is in memory at
+    a time, and the read connection sees a single consistent snapshot for
+    the whole export.
+    """
+    if not db.engine:
+        await db.initialize()
+
+    query = (
+        select(*(getattr(Track, name) for name in EXPORT_FIELDS))
+        .order_by(Track.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async with db.read_engine.connect() as conn:
+        result = await conn.stream(query)
+        async for rows in result.partitions():
+            yield b"".join(dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+
+
+def _coerce(name: str, value):
+    kind = IMPORT_FIELDS[name]
+    if kind is datetime:
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be an ISO 8601 string")
+        parsed = datetime.fromisoformat(value)
+        # Timestamps are stored as naive UTC
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else kind):
+        raise ValueError(f"{name} must be {'a number' if kind is float else kind.__name__}")
+    return float(value) if kind is float else value
+
+
+def track_row(record) -> Dict:
+    """Validate one imported JSON object into a row for ``tracks``."""
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    row = {}
+    for name in IMPORT_FIELDS:
+        value = record.get(name)
+        row[name] = None if value is None else _coerce(name, value)
+    if not row["filename"] or not row["filepath"]:
+        raise ValueError("filename and filepath are required")
+    if row["created_at"] is None:
+        row["created_at"] = datetime.utcnow()
+    return row
+
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[Optional[bytes]]:
+    """Split a byte stream into lines, yielding None in place of any over MAX_LINE_BYTES."""
+    buffer = b""
+    skipping = False
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            yield None if skipping or len(line) > MAX_LINE_BYTES else line
+            skipping = False
+        if len(buffer) > MAX_LINE_BYTES:
+            buffer = b""
+            skipping = True
+    if skipping:
+        yield None
+    elif buffer:
+        yield buffer
+
+
+async def _upsert_batch(rows: List[Dict]) -> int:
+    """Upsert one batch through the staging table, returning how many rows it wrote.
+
+    The batch is loaded into ``track_import`` and moved into ``tracks`` by a
+    single INSERT ... SELECT, so the FTS index triggers run inside one
+    statement; an executemany straight into ``tracks`` makes FTS5 flush a
+    new index segment for every row, which is several times slower.
+    """
+    stmt = sqlite_insert(Track).from_select(
+        list(IMPORT_FIELDS),
+        # The WHERE keeps SQLite from parsing ON CONFLICT as a join constraint
+        select(*track_import.c).where(true())
+    )
+    # Fields left out of a line keep their stored values
+    updated = {
+        name: func.coalesce(stmt.excluded[name], getattr(Track, name))
+        for name in IMPORT_FIELDS if name not in ("filename", "created_at")
+    }
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Track.filename],
+        set_={**updated, "created_at": func.coalesce(Track.created_at, stmt.excluded.created_at)},
+        # Rows that would not change are not rewritten, so re-importing a library is cheap
+        where=or_(*(getattr(Track, name).is_distinct_from(value) for name, value in updated.items()))
+    )
+
+    async with db.engine.begin() as conn:
+        await conn.run_sync(track_import.create, checkfirst=True)
+        await conn.execute(insert(track_import), rows)
+        written = (await conn.execute(stmt)).rowcount
+        await conn.execute(delete(track_import))
+    if written:
+        event_bus.publish(TracksChanged())
+    return written
+
+
+async def _import_batch(rows: List[Dict], result: ImportResult):
+    written = await _upsert_batch(rows)
+    result.imported += written
+    result.unchanged += len(rows) - written
+
+
+async def import_tracks(chunks: AsyncIterable[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    """Upsert tracks from an NDJSON byte stream, such as ``export_tracks`` produces.
+
+    Lines are matched to existing tracks by ``filename``; ``filename`` and
+    ``filepath`` are required and every other field is optional, with null
+    or missing fields keeping the stored value. Rows that would not change
+    are left alone and counted as unchanged, and invalid lines are counted
+    and skipped. Each batch commits on its own, so the writer is never held
+    for the whole import and a failed import keeps the batches before it.
+    """
+    if not db.engine:
+        await db.initialize()
+
+    result = ImportResult()
+    batch = []
+    line_number = 0
+    async for line in _lines(chunks):
+        line_number += 1
+        if line is None:
+            result.reject(line_number, f"longer than {MAX_LINE_BYTES} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            batch.append(track_row(_loads(line)))
+        except ValueError as e:
+            result.reject(line_number, str(e))
+            continue
+        if len(batch) >= batch_size:
+            await _import_batch(batch, result)
+            batch = []
+
+    if batch:
+        await _import_batch(batch, result)
+    return result
@@ -0,0 +1,167 @@
+"""Filesystem watcher that keeps the track index in sync with the music directory."""
+
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from .scanner import (
+    LibraryScanner, FileStat, scanner as default_scanner, is_audio_file,
+    stat_file, stat_audio_files, remove_tracks, filenames_under,
+    load_manifest, match_renames, rename_tracks,
+)
+
+try:
+    from watchfiles import awatch
+except ImportError:  # pragma: no cover - optional dependency
+    awatch = None
+
+
+def watcher_enabled() -> bool:
+    """Check whether the library watcher is enabled in the environment."""
+    return os.getenv("WATCH_LIBRARY", "False").lower() == "true"
+
+
+class LibraryWatcher:
+    """Watches the music directory via inotify and indexes changes in batches.
+
+    Events are coalesced per path and only applied once a path has been quiet
+    for ``settle`` seconds, so an album copy turns into a single metadata read
+    and upsert once the files are complete. ``max_delay`` bounds how long a
+    continuously changing path can be held back.
+    """
+
+    def __init__(
+        self,
+        scanner: Optional[LibraryScanner] = None,
+        settle: float = 2.0,
+        max_delay: float = 15.0
+    ):
+        self.scanner = scanner or default_scanner
+        self.settle = settle
+        self.max_delay = max_delay
+        # path -> (first event, last event) monotonic timestamps
+        self._pending: Dict[str, Tuple[float, float]] = {}
+        self._wakeup = asyncio.Event()
+
+    @property
+    def root(self) -> str:
+        return self.scanner.music_directory
+
+    def _watch_filter(self, change, path: str) -> bool:
+        # Directories and audio files matter; artwork, cue sheets etc. do not
+        return is_audio_file(path) or not os.path.isfile(path)
+
+    async def run(self):
+        """Watch the music directory until cancelled."""
+        if awatch is None:
+            print("watchfiles is not installed; library watcher disabled")
+            return
+
+        if not os.path.isdir(self.root):
+            print(f"Music directory not found, library watcher disabled: {self.root}")
+            return
+
+        print(f"Watching music library at {self.root}")
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            async for changes in awatch(
+                self.root,
+                watch_filter=self._watch_filter,
+                ignore_permission_denied=True
+            ):
+                now = time.monotonic()
+                for _, path in changes:
+                    first_seen, _ = self._pending.get(path, (now, now))
+                    self._pending[path] = (first_seen, now)
+                self._wakeup.set()
+        finally:
+            flusher.cancel()
+
+    def _due_paths(self) -> List[str]:
+        now = time.monotonic()
+        return [
+            path for path, (first_seen, last_seen) in self._pending.items()
+            if now - last_seen >= self.settle or now - first_seen >= self.max_delay
+        ]
+
+    async def _flush_loop(self):
+        while True:
+            if not self._pending:
+                # Idle until the next filesystem event
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            await asyncio.sleep(self.settle / 4)
+
+            # Leave the index alone while a full scan owns it
+            if self.scanner.is_running:
+                continue
+
+            due = self._due_paths()
+            if not due:
+                continue
+
+            for path in due:
+                self._pending.pop(path, None)
+
+            try:
+                await self.apply_changes(due)
+            except Exception as e:
+                print(f"Error indexing library changes: {e}")
+
+    def _classify(self, paths: List[str]) -> Tuple[List[FileStat], List[str], List[str]]:
+        """Split changed paths into files to index, removed files and removed directories."""
+        updated: Dict[str, FileStat] = {}
+        removed_files = []
+        removed_dirs = []
+
+        for path in paths:
+            if os.path.isdir(path):
+                for stat in stat_audio_files(self.root, path):
+                    updated[stat.filename] = stat
+            elif os.path.isfile(path):
+                if is_audio_file(path):
+                    stat = stat_file(path, self.root)
+                    if stat:
+                        updated[stat.filename] = stat
+            elif is_audio_file(path):
+                removed_files.append(os.path.relpath(path, self.root))
+            else:
+                removed_dirs.append(os.path.relpath(path, self.root))
+
+        return list(updated.values()), removed_files, removed_dirs
+
+    async def apply_changes(self, paths: List[str]):
+        """Index a coalesced batch of changed paths."""
+        updated, removed_files, removed_dirs = await asyncio.to_thread(self._classify, paths)
+
+        removed = set(removed_files)
+        for directory in removed_dirs:
+            removed.update(await filenames_under(directory))
+
+        # A move shows up as a removal plus an addition of the same file
+        if removed and updated:
+            renamed = await rename_tracks(match_renames(await load_manifest(removed), updated))
+            if renamed:
+                moved = {stat.filename for stat in renamed.values()}
+                updated = [stat for stat in updated if stat.filename not in moved]
+                removed.difference_update(renamed)
+                print(f"Library watcher renamed {len(renamed)} tracks")
+
+        if updated:
+            progress = await self.scanner.index_files(updated)
+            print(f"Library watcher indexed {progress.written} tracks")
+
+        if removed:
+            count = await remove_tracks(removed)
+            print(f"Library watcher removed {count} tracks")
+
+
+async def run_watcher():
+    """Run the library watcher if enabled."""
+    if not watcher_enabled():
+        return
+
+    await LibraryWatcher().run()
@@ -15,6 +15,7 @@ async def main():
     # Import after path setup
     from web.main import app
     from bot.discord_bot import run_bot
+    from library.watcher import run_watcher
     import uvicorn
     
     # Start web server in background
@@ -26,10 +27,11 @@ async def main():
     )
     server = uvicorn.Server(config)
     
-    # Run both server and bot concurrently
+    # Run server, bot and optional library watcher concurrently
     await asyncio.gather(
         server.serve(),
         run_bot(),
+        run_watcher(),
         return_exceptions=True
     )
 
@@ -0,0 +1,23 @@
+"""Shared fixtures: every test session runs against a throwaway database."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Never touch the real database
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="snowlander-test-"), "test.db")
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from web.main import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,23 @@
+"""NDJSON export and import of the track library."""
+
+import json
+
+
+def ndjson(*records):
+    return "\n".join(json.dumps(record) for record in records).encode()
+
+
+def test_import_counts_only_written_rows(client):
+    track = {"filename": "transfer/a.flac", "filepath": "/music/transfer/a.flac", "title": "A"}
+
+    first = client.post("/api/tracks/import", content=ndjson(track, {"filename": "no path"})).json()
+    assert (first["imported"], first["unchanged"], first["invalid"]) == (1, 0, 1)
+
+    again = client.post("/api/tracks/import", content=ndjson(track)).json()
+    assert (again["imported"], again["unchanged"]) == (0, 1)
+
+    retitled = client.post("/api/tracks/import", content=ndjson({**track, "title": "B"})).json()
+    assert (retitled["imported"], retitled["unchanged"]) == (1, 0)
+
+    exported = [json.loads(line) for line in client.get("/api/tracks/export").text.splitlines()]
+    assert [row["title"] for row in exported if row["filename"] == track["filename"]] == ["B"]
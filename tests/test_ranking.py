@@ -0,0 +1,35 @@
+"""Ranked matches for !play requests."""
+
+import asyncio
+
+from sqlalchemy import select, update
+
+from web.database import db
+from web.models import Track
+from library.loudness import track_gain
+from library.ranking import rank_tracks
+from library.scanner import upsert_tracks
+
+
+def test_ranked_match_has_the_track_gain():
+    async def run():
+        await upsert_tracks([{
+            "filename": "ranking/zanzibar.flac", "filepath": "/music/ranking/zanzibar.flac",
+            "title": "Zanzibar Nights", "artist": "Quillfeather", "album": None, "genre": None,
+            "year": None, "duration": 200.0, "file_size": 1, "format": "flac",
+            "bitrate": None, "sample_rate": None,
+        }])
+        async with db.session() as session:
+            await session.execute(
+                update(Track).where(Track.filename == "ranking/zanzibar.flac").values(loudness=-9.0, true_peak=-0.5)
+            )
+            await session.commit()
+
+        async with db.read_session() as session:
+            match = (await rank_tracks(session, "quillfeather zanzibar")).best
+            track = (await session.execute(select(Track).where(Track.id == match.id))).scalar_one()
+
+        # What !play passes to the player, whether it plays now or queues the match
+        assert track_gain(match) == track_gain(track) != 0.0
+
+    asyncio.run(run())
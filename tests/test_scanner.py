@@ -0,0 +1,54 @@
+"""Incremental scans of a throwaway music directory."""
+
+import asyncio
+import os
+import wave
+
+from sqlalchemy import select
+
+from web.database import db
+from web.models import Track
+from library.scanner import LibraryScanner
+
+
+def write_wav(path, frames=800):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\0\0" * frames)
+
+
+async def tracks_by_filename():
+    async with db.read_session() as session:
+        result = await session.execute(select(Track.filename, Track.id, Track.filepath, Track.play_count))
+        return {row.filename: row for row in result}
+
+
+def test_renamed_file_keeps_its_track(tmp_path):
+    async def run():
+        root = str(tmp_path)
+        scanner = LibraryScanner(music_directory=root)
+        write_wav(os.path.join(root, "old", "song.wav"))
+        write_wav(os.path.join(root, "other.wav"), frames=1600)
+        await scanner.scan()
+
+        before = (await tracks_by_filename())[os.path.join("old", "song.wav")]
+        async with db.session() as session:
+            track = await session.get(Track, before.id)
+            track.play_count = 7
+            await session.commit()
+
+        os.makedirs(os.path.join(root, "new"))
+        os.rename(os.path.join(root, "old", "song.wav"), os.path.join(root, "new", "song.wav"))
+        progress = await scanner.scan()
+
+        tracks = await tracks_by_filename()
+        after = tracks[os.path.join("new", "song.wav")]
+        assert os.path.join("old", "song.wav") not in tracks
+        assert (after.id, after.play_count) == (before.id, 7)
+        assert after.filepath == os.path.join(root, "new", "song.wav")
+        assert (progress.renamed, progress.removed, progress.written) == (1, 0, 0)
+
+    asyncio.run(run())
@@ -0,0 +1,15 @@
+"""Limits and paging of the track list endpoints."""
+
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/api/tracks", "/api/facets/artist", "/api/stats"])
+def test_zero_limit_is_rejected(client, path):
+    assert client.get(path, params={"limit": 0}).status_code == 422
+
+
+def test_empty_page_has_no_cursor(client):
+    response = client.get("/api/tracks", params={"search": "no such track anywhere", "cursor": ""})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,116 @@
+"""Round-trip benchmark of the streaming library export and import.
+
+Seeds a throwaway library, exports it to NDJSON, imports the file into a
+second, empty database (inserts), imports it again over the restored rows
+(no changes) and checks an export of the copy is byte-for-byte the first.
+With ``--memory`` the peak Python heap of each step is traced too, which
+shows it does not grow with the library (and makes every step slower).
+
+    python tools/bench_library_transfer.py --tracks 200000 [--memory]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# Never touch the real database
+workdir = tempfile.mkdtemp(prefix="snowlander-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+
+from web.database import db
+from library.scanner import upsert_tracks
+from library.transfer import export_tracks, import_tracks
+
+
+SEED_BATCH = 10000
+READ_CHUNK = 64 * 1024
+
+
+async def seed(tracks: int):
+    await db.initialize()
+    for start in range(0, tracks, SEED_BATCH):
+        await upsert_tracks([
+            {
+                "filename": f"{i:07d}.flac", "filepath": f"/music/{i:07d}.flac",
+                "title": f"Track {i}", "artist": f"Artist {i % 500}", "album": f"Album {i % 2000}",
+                "genre": ("Rock", "Jazz", "Ambient", "Techno")[i % 4], "year": 1970 + i % 50,
+                "duration": 180.0 + i % 240, "file_size": 30_000_000 + i, "format": "flac",
+                "bitrate": 900, "sample_rate": 44100,
+            }
+            for i in range(start, min(start + SEED_BATCH, tracks))
+        ])
+
+
+async def export_to(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "wb") as f:
+        async for chunk in export_tracks():
+            f.write(chunk)
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def read_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_CHUNK):
+            yield chunk
+
+
+async def timed(label: str, coro):
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    value = await coro
+    elapsed = time.perf_counter() - started
+    line = f"  {label:<22} {elapsed:8.2f} s"
+    if tracemalloc.is_tracing():
+        line += f" {tracemalloc.get_traced_memory()[1] / 1024 / 1024:8.1f} MB peak"
+    print(line)
+    return value
+
+
+async def run_benchmark(tracks: int, memory: bool):
+    await seed(tracks)
+    path = os.path.join(workdir, "tracks.ndjson")
+    print(f"{tracks} tracks\n")
+    if memory:
+        tracemalloc.start()
+
+    first = await timed("export", export_to(path))
+    print(f"  {'':<22} {os.path.getsize(path) / 1024 / 1024:8.1f} MB of NDJSON")
+
+    # Restore into an empty library, as from a backup
+    await db.close()
+    db.database_path = os.path.join(workdir, "restored.db")
+    await db.initialize()
+
+    inserted = await timed("import (inserts)", import_tracks(read_chunks(path)))
+    unchanged = await timed("import (unchanged)", import_tracks(read_chunks(path)))
+    second = await timed("export copy", export_to(path))
+
+    print(f"\n  written {inserted.imported}, then {unchanged.imported} ({unchanged.unchanged} unchanged the second time)")
+    print(f"  invalid lines: {inserted.invalid + unchanged.invalid}")
+    print(f"  identical export: {first == second}")
+
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=200000, help="Tracks in the throwaway library")
+    parser.add_argument("--memory", action="store_true", help="Trace the peak Python heap of each step")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.tracks, args.memory))
+
+
+if __name__ == "__main__":
+    main()
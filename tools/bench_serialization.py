@@ -0,0 +1,147 @@
+"""Benchmark of the track and queue list endpoints: ORM + Pydantic versus column tuples + orjson.
+
+Runs against a throwaway library. For each path it times the query plus
+the serialisation FastAPI would otherwise do for a ``response_model``, checks
+both produce the same JSON, and reports gzip sizes for the response bodies.
+
+    python tools/bench_serialization.py --tracks 20000 --page 200
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# Never touch the real database
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="snowlander-bench-"), "bench.db")
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from web.database import db
+from web.models import Track, QueueItem, TrackResponse, QueueItemResponse
+from web.pagination import BROWSE_ORDER
+from web.queue import append_to_queue, guild_queue
+from web.serialization import dumps, orjson, queue_item_dicts, queue_item_select, track_dicts, track_select
+from library.scanner import upsert_tracks
+
+
+GUILD_ID = "bench"
+
+
+def fastapi_body(adapter: TypeAdapter, models: list) -> bytes:
+    """What FastAPI does with a returned list of models and a ``response_model``."""
+    content = [model.model_dump() for model in models]
+    value = adapter.validate_python(content)
+    return JSONResponse(adapter.dump_python(value, mode="json")).body
+
+
+async def seed(tracks: int, queued: int):
+    await db.initialize()
+    await upsert_tracks([
+        {
+            "filename": f"{i:06d}.flac", "filepath": f"/music/{i:06d}.flac",
+            "title": f"Track {i}", "artist": f"Artist {i % 500}", "album": f"Album {i % 2000}",
+            "genre": ("Rock", "Jazz", "Ambient", "Techno")[i % 4], "year": 1970 + i % 50,
+            "duration": 180.0 + i % 240, "file_size": 30_000_000 + i, "format": "flac",
+            "bitrate": 900, "sample_rate": 44100,
+        }
+        for i in range(tracks)
+    ])
+    async with db.session() as session:
+        for i in range(queued):
+            await append_to_queue(session, GUILD_ID, 1 + i * 7 % tracks, "bench")
+        await session.commit()
+
+
+async def tracks_orm(page: int) -> bytes:
+    async with db.read_session() as session:
+        result = await session.execute(select(Track).order_by(*BROWSE_ORDER).offset(page).limit(page))
+        models = [TrackResponse.model_validate(track) for track in result.scalars().all()]
+    return fastapi_body(TypeAdapter(List[TrackResponse]), models)
+
+
+async def tracks_fast(page: int) -> bytes:
+    async with db.read_session() as session:
+        result = await session.execute(track_select().order_by(*BROWSE_ORDER).offset(page).limit(page))
+        return dumps(track_dicts(result.all()))
+
+
+async def queue_orm(_page: int) -> bytes:
+    async with db.read_session() as session:
+        result = await session.execute(
+            guild_queue(select(QueueItem), GUILD_ID)
+            .options(selectinload(QueueItem.track))
+            .order_by(QueueItem.position)
+        )
+        models = [QueueItemResponse.model_validate(item) for item in result.scalars().all()]
+    return fastapi_body(TypeAdapter(List[QueueItemResponse]), models)
+
+
+async def queue_fast(_page: int) -> bytes:
+    async with db.read_session() as session:
+        result = await session.execute(guild_queue(queue_item_select(), GUILD_ID).order_by(QueueItem.position))
+        return dumps(queue_item_dicts(result))
+
+
+async def measure(build, page: int, rounds: int):
+    timings = []
+    body = b""
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = await build(page)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.95))], body
+
+
+async def run_benchmark(tracks: int, page: int, queued: int, rounds: int):
+    await seed(tracks, queued)
+    print(f"{tracks} tracks, {page}-track pages, {queued} queued items, {rounds} rounds")
+    print(f"JSON encoder: {'orjson' if orjson else 'json (orjson not installed)'}\n")
+    print(f"  {'endpoint':<14} {'path':<16} {'p50 ms':>8} {'p95 ms':>8} {'bytes':>8} {'gzip':>8} {'gzip ms':>8}")
+
+    for name, slow, fast in (("/api/tracks", tracks_orm, tracks_fast), ("/api/queue", queue_orm, queue_fast)):
+        results = {}
+        for label, build in (("orm + pydantic", slow), ("tuples + orjson", fast)):
+            await build(page)  # warm up
+            p50, p95, body = await measure(build, page, rounds)
+            started = time.perf_counter()
+            compressed = gzip.compress(body, compresslevel=6, mtime=0)
+            gzip_ms = (time.perf_counter() - started) * 1000
+            results[label] = (p50, body)
+            print(
+                f"  {name:<14} {label:<16} {p50 * 1000:8.2f} {p95 * 1000:8.2f} "
+                f"{len(body):8d} {len(compressed):8d} {gzip_ms:8.2f}"
+            )
+        (slow_p50, slow_body), (fast_p50, fast_body) = results.values()
+        same = json.loads(slow_body) == json.loads(fast_body)
+        print(f"  {'':<14} {'speed-up':<16} {slow_p50 / fast_p50:7.1f}x   identical JSON: {same}\n")
+
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=20000, help="Tracks in the throwaway library")
+    parser.add_argument("--page", type=int, default=200, help="Tracks per page")
+    parser.add_argument("--queued", type=int, default=200, help="Items in the benchmark queue")
+    parser.add_argument("--rounds", type=int, default=200, help="Requests timed per path")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.tracks, args.page, args.queued, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
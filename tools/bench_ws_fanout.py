@@ -0,0 +1,111 @@
+"""Benchmark for WebSocket fan-out with many dashboard clients, some of them slow.
+
+Drives the real ``ConnectionManager`` with in-process fake sockets, so no
+server or browser is needed. Reports how long ``broadcast`` itself takes and
+how long fast clients wait for each message while slow ones lag behind.
+
+    python tools/bench_ws_fanout.py --clients 500 --slow 50 --messages 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from web.websocket_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    """Accepts everything; each send takes ``send_delay`` seconds, like a client on a slow link."""
+
+    def __init__(self, send_delay, latencies):
+        self.send_delay = send_delay
+        self.latencies = latencies
+        self.received = 0
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        else:
+            # Still yield, as a real socket write does
+            await asyncio.sleep(0)
+        self.received += 1
+        sent_at = float(text[text.index(":") + 1:text.index(",")])
+        self.latencies.append(time.perf_counter() - sent_at)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_benchmark(clients: int, slow: int, messages: int, interval: float, policy: str):
+    manager = ConnectionManager(max_queue=64, slow_client_policy=policy)
+    fast_latencies = []
+    sockets = []
+    broadcast_times = []
+    # The manager logs every connect and disconnect
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(clients):
+            is_slow = i < slow
+            socket = FakeWebSocket(0.5 if is_slow else 0.0, [] if is_slow else fast_latencies)
+            sockets.append(socket)
+            await manager.connect(socket)
+
+        for _ in range(messages):
+            started = time.perf_counter()
+            await manager.broadcast({"sent_at": started, "type": "position_update", "data": [{"position": 1.0}]})
+            broadcast_times.append(time.perf_counter() - started)
+            await asyncio.sleep(interval)
+        await asyncio.sleep(0.2)
+
+    stats = manager.stats()
+    delivered_fast = sum(socket.received for socket in sockets[slow:])
+    print(f"{clients} clients ({slow} slow, policy {policy}), {messages} broadcasts every {interval * 1000:.0f} ms")
+    print(
+        f"broadcast(): p50 {percentile(broadcast_times, 0.5) * 1000:.3f} ms, "
+        f"p99 {percentile(broadcast_times, 0.99) * 1000:.3f} ms, max {max(broadcast_times) * 1000:.3f} ms"
+    )
+    print(
+        f"fast clients: {delivered_fast}/{messages * (clients - slow)} delivered, latency "
+        f"p50 {percentile(fast_latencies, 0.5) * 1000:.2f} ms, p99 {percentile(fast_latencies, 0.99) * 1000:.2f} ms"
+    )
+    print(
+        f"slow clients: {sum(socket.closed for socket in sockets[:slow])} disconnected, "
+        f"{stats['dropped']} messages dropped, {stats['queued']} still queued"
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for socket in list(manager.active_connections):
+            manager.disconnect(socket)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=300, help="Connected dashboard clients")
+    parser.add_argument("--slow", type=int, default=30, help="Clients whose sends take 500 ms")
+    parser.add_argument("--messages", type=int, default=100, help="Broadcasts to send")
+    parser.add_argument("--interval", type=float, default=0.02, help="Seconds between broadcasts")
+    parser.add_argument("--policy", default="drop_oldest", help="drop_oldest or disconnect")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.clients, args.slow, args.messages, args.interval, args.policy))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Load test for the multi-guild player: many simulated guilds playing at once.
+
+Runs the real ``PlayerRegistry``, ``BotStateStore`` and queue code against a
+throwaway database, with voice connections and FFmpeg replaced by simulated
+ones (no Discord connection or ffmpeg binary is needed). One guild spams
+commands as fast as it can; the report shows whether the other guilds' command
+latency and the event loop's responsiveness hold up.
+
+    python tools/load_test_guilds.py --guilds 50 --duration 15
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import discord
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# Never touch the real database
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="snowlander-load-"), "load.db")
+
+from web.database import db
+from web.queue import append_to_queue, guild_queue, queue_length
+from web.models import Track, QueueItem
+from library.scanner import upsert_tracks
+from bot.state import bot_state
+from bot.player import GuildPlayer, PlayerRegistry
+from sqlalchemy import select
+
+
+# One 20 ms frame of 48 kHz stereo silence
+SILENCE = b"\x00" * 3840
+
+
+class SimulatedSource(discord.AudioSource):
+    """A track of silence lasting ``frames`` frames."""
+
+    def __init__(self, frames):
+        self.remaining = frames
+
+    def read(self):
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return SILENCE
+
+    def is_opus(self):
+        return False
+
+
+class SimulatedVoiceClient:
+    """Stands in for ``discord.VoiceClient``; reads its source in real time on a thread."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = channel.guild
+        self._thread = None
+        self._stopped = None
+        self._resumed = threading.Event()
+
+    def play(self, source, after=None):
+        self._stopped = threading.Event()
+        self._resumed.set()
+        self._thread = threading.Thread(target=self._run, args=(source, after, self._stopped), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after, stopped):
+        while not stopped.is_set():
+            if not self._resumed.is_set():
+                self._resumed.wait(0.05)
+                continue
+            if not source.read():
+                break
+            time.sleep(0.02)
+        source.cleanup()
+        if after:
+            after(None)
+
+    def stop(self):
+        if self._stopped:
+            self._stopped.set()
+        self._thread = None
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def is_playing(self):
+        return self._thread is not None and self._resumed.is_set()
+
+    def is_paused(self):
+        return self._thread is not None and not self._resumed.is_set()
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self):
+        self.stop()
+
+
+class SimulatedChannel:
+    def __init__(self, guild_id):
+        self.id = int(guild_id) * 10
+        self.name = f"voice-{guild_id}"
+        self.guild = type("Guild", (), {"id": int(guild_id)})()
+
+    async def connect(self):
+        await asyncio.sleep(0.01)
+        return SimulatedVoiceClient(self)
+
+
+class SimulatedPlayer(GuildPlayer):
+    """Guild player whose FFmpeg spawn is a short blocking sleep."""
+
+    spawn_seconds = 0.005
+    track_frames = (10, 75)
+    gapless_advances = 0
+    cold_starts = 0
+
+    def _create_source(self, track_path, gain_db=0.0):
+        time.sleep(self.spawn_seconds)
+        return SimulatedSource(random.randint(*self.track_frames))
+
+    def _advanced(self, chain, tag):
+        if chain is self.chain:
+            SimulatedPlayer.gapless_advances += 1
+        super()._advanced(chain, tag)
+
+    async def play_next(self):
+        started = await super().play_next()
+        SimulatedPlayer.cold_starts += started
+        return started
+
+
+async def monitor_loop_lag(samples, stop, interval=0.01):
+    """Record how late the event loop wakes up a sleeping task."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def run_guild(player, track_ids, deadline, latencies, pause):
+    """Issue a random mix of commands for one guild until the deadline."""
+    operations = ("play", "enqueue", "enqueue", "skip", "volume", "queue", "pause")
+    while time.perf_counter() < deadline:
+        operation = random.choice(operations)
+        started = time.perf_counter()
+        try:
+            if operation == "play":
+                track_id = random.choice(track_ids)
+                await player.play_track(f"/tmp/{track_id}.mp3", track_id, requested_by="load")
+            elif operation == "enqueue":
+                async with db.session() as session:
+                    await append_to_queue(session, player.guild_id, random.choice(track_ids), "load")
+                    await session.commit()
+            elif operation == "skip":
+                await player.skip()
+            elif operation == "volume":
+                await player.set_volume(random.random())
+            elif operation == "queue":
+                async with db.read_session() as session:
+                    await session.execute(
+                        guild_queue(select(QueueItem.id), player.guild_id)
+                        .order_by(QueueItem.position)
+                        .limit(10)
+                    )
+            elif operation == "pause":
+                if player.is_paused:
+                    await player.resume()
+                else:
+                    await player.pause()
+        except Exception as e:
+            print(f"Guild {player.guild_id}: {operation} failed: {e}")
+        latencies[operation].append(time.perf_counter() - started)
+        await asyncio.sleep(pause)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(title, latencies):
+    print(f"\n{title}")
+    print(f"  {'operation':<10} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for operation, values in sorted(latencies.items()):
+        print(
+            f"  {operation:<10} {len(values):>7} "
+            f"{percentile(values, 0.5) * 1000:>8.2f} {percentile(values, 0.95) * 1000:>8.2f} "
+            f"{percentile(values, 0.99) * 1000:>8.2f} {max(values) * 1000:>8.2f}"
+        )
+
+
+async def run_load_test(guilds: int, duration: float, tracks: int, pause: float):
+    """Simulate ``guilds`` concurrent guilds for ``duration`` seconds."""
+    await db.initialize()
+    await upsert_tracks([
+        {
+            "filename": f"load/{i}.mp3", "filepath": f"/tmp/{i}.mp3", "title": f"Track {i}",
+            "artist": f"Artist {i % 40}", "album": f"Album {i % 120}", "genre": "Load",
+            "year": None, "duration": 1.0, "file_size": 1, "format": "mp3",
+            "bitrate": 320, "sample_rate": 44100,
+        }
+        for i in range(tracks)
+    ])
+    async with db.read_session() as session:
+        track_ids = list((await session.execute(select(Track.id))).scalars())
+
+    bot_state.activate(volume=0.5)
+    registry = PlayerRegistry(player_class=SimulatedPlayer)
+    players = [registry.get(str(1000 + i)) for i in range(guilds)]
+    await asyncio.gather(*(
+        player.join(SimulatedChannel(player.guild_id)) for player in players
+    ))
+
+    lag_samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+
+    busy_latencies = defaultdict(list)
+    other_latencies = defaultdict(list)
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(
+        # The first guild spams commands back to back
+        run_guild(players[0], track_ids, deadline, busy_latencies, pause=0),
+        *(run_guild(player, track_ids, deadline, other_latencies, pause) for player in players[1:])
+    )
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    await registry.disconnect_all()
+    await bot_state.close()
+
+    # Each guild's persisted state must match its own player
+    async with db.read_session() as session:
+        mismatched = 0
+        for player in players:
+            snapshot = bot_state.snapshot(player.guild_id)
+            if snapshot["is_connected"] or snapshot["guild_id"] != player.guild_id:
+                mismatched += 1
+        queued = sum([await queue_length(session, player.guild_id) for player in players])
+
+    total_ops = sum(len(v) for v in busy_latencies.values()) + sum(len(v) for v in other_latencies.values())
+    print(f"Simulated {guilds} guilds for {elapsed:.1f}s: {total_ops} commands ({total_ops / elapsed:.0f}/s)")
+    print(f"Queued items across guilds: {queued}; guild states out of sync: {mismatched}")
+    print(
+        f"Queue advances: {SimulatedPlayer.gapless_advances} gapless, "
+        f"{SimulatedPlayer.cold_starts} cold starts (queue was empty when the track was preloaded)"
+    )
+    print(
+        f"Event loop lag: p50 {percentile(lag_samples, 0.5) * 1000:.2f} ms, "
+        f"p99 {percentile(lag_samples, 0.99) * 1000:.2f} ms, max {max(lag_samples) * 1000:.2f} ms"
+    )
+    report("Busy guild", busy_latencies)
+    report("Other guilds", other_latencies)
+
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=40, help="Number of simulated guilds")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--tracks", type=int, default=500, help="Tracks in the throwaway library")
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds between commands of a normal guild")
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args.guilds, args.duration, args.tracks, args.pause))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,202 @@
 """Database initialization and connection management."""
 
 import os
-import aiosqlite
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import List, Tuple
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from .models import Base
+from library.search import setup_search_index
+from library.facets import setup_facet_index
+
+
+@dataclass
+class EngineProfile:
+    """SQLite tuning applied to every pooled connection."""
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64 * 1024  # Negative values are KiB
+    busy_timeout: int = 5000  # Milliseconds
+    temp_store: str = "MEMORY"
+    read_pool_size: int = 4
+
+    @classmethod
+    def from_env(cls) -> "EngineProfile":
+        """Build a profile from SQLITE_* environment variables."""
+        defaults = cls()
+        return cls(
+            journal_mode=os.getenv("SQLITE_JOURNAL_MODE", defaults.journal_mode),
+            synchronous=os.getenv("SQLITE_SYNCHRONOUS", defaults.synchronous),
+            mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", defaults.mmap_size)),
+            cache_size=int(os.getenv("SQLITE_CACHE_SIZE", defaults.cache_size)),
+            busy_timeout=int(os.getenv("SQLITE_BUSY_TIMEOUT", defaults.busy_timeout)),
+            temp_store=os.getenv("SQLITE_TEMP_STORE", defaults.temp_store),
+            read_pool_size=int(os.getenv("SQLITE_READ_POOL_SIZE", defaults.read_pool_size)),
+        )
+
+    def pragmas(self, read_only: bool = False) -> List[Tuple[str, object]]:
+        """PRAGMA statements for a connection, in the order they must run."""
+        pragmas = [
+            ("busy_timeout", self.busy_timeout),
+            ("synchronous", self.synchronous),
+            ("mmap_size", self.mmap_size),
+            ("cache_size", self.cache_size),
+            ("temp_store", self.temp_store),
+        ]
+        if read_only:
+            pragmas.append(("query_only", 1))
+        else:
+            # The journal mode is persistent, so only the writer sets it
+            pragmas.insert(1, ("journal_mode", self.journal_mode))
+        return pragmas
+
+
+def _install_pragmas(engine, pragmas: List[Tuple[str, object]]):
+    """Run the profile's PRAGMAs on each new DBAPI connection."""
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
 
 class Database:
-    """Database connection manager."""
-    
-    def __init__(self, database_path: str):
+    """Database connection manager.
+
+    Writes go through ``engine``, which holds a single pooled connection so
+    writers are serialized in-process instead of fighting over SQLite's lock.
+    Reads use ``read_engine``, a pool of read-only connections that in WAL
+    mode never wait for a writer's commit.
+    """
+
+    def __init__(self, database_path: str, profile: EngineProfile = None):
         self.database_path = database_path
+        self.profile = profile or EngineProfile.from_env()
         self.engine = None
+        self.read_engine = None
         self.session_maker = None
-        
+        self.read_session_maker = None
+        self._init_lock = asyncio.Lock()
+
     async def initialize(self):
         """Initialize the database connection and create tables."""
-        # Ensure the database directory exists
-        os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
-        
-        # Create async engine
-        database_url = f"sqlite+aiosqlite:///{self.database_path}"
-        self.engine = create_async_engine(
-            database_url,
-            echo=False,
-            future=True
-        )
-        
-        # Create session maker
-        self.session_maker = sessionmaker(
-            self.engine,
-            class_=AsyncSession,
-            expire_on_commit=False
-        )
-        
-        # Create tables
-        async with self.engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-    
+        async with self._init_lock:
+            if self.engine:
+                return
+
+            # Ensure the database directory exists
+            os.makedirs(os.path.dirname(self.database_path) or ".", exist_ok=True)
+
+            # Single-connection writer engine
+            database_url = f"sqlite+aiosqlite:///{self.database_path}"
+            engine = create_async_engine(
+                database_url,
+                echo=False,
+                future=True,
+                pool_size=1,
+                max_overflow=0
+            )
+            _install_pragmas(engine, self.profile.pragmas())
+
+            # Create tables, the full-text search index and facet aggregates
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(self._add_missing_columns)
+                await conn.run_sync(self._create_missing_indexes)
+                await conn.run_sync(setup_search_index)
+                await conn.run_sync(setup_facet_index)
+
+            # Read-only engine; opened after the schema exists
+            read_url = f"sqlite+aiosqlite:///file:{os.path.abspath(self.database_path)}?mode=ro&uri=true"
+            read_engine = create_async_engine(
+                read_url,
+                echo=False,
+                future=True,
+                pool_size=self.profile.read_pool_size,
+                max_overflow=0
+            )
+            _install_pragmas(read_engine, self.profile.pragmas(read_only=True))
+
+            # Create session makers
+            self.session_maker = sessionmaker(
+                engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            )
+            self.read_session_maker = sessionmaker(
+                read_engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            )
+            self.read_engine = read_engine
+            self.engine = engine
+
+    @staticmethod
+    def _add_missing_columns(connection):
+        """Add nullable columns added to models after their tables already existed."""
+        for table in Base.metadata.sorted_tables:
+            existing = {
+                row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")
+            }
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+
+    @staticmethod
+    def _create_missing_indexes(connection):
+        """Create indexes added to models after their tables already existed."""
+        existing = {
+            row[0] for row in connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+
     async def get_session(self):
-        """Get a database session."""
+        """Get a database session for writes."""
         if not self.session_maker:
             await self.initialize()
         return self.session_maker()
-    
+
+    async def get_read_session(self):
+        """Get a read-only database session."""
+        if not self.read_session_maker:
+            await self.initialize()
+        return self.read_session_maker()
+
+    @asynccontextmanager
+    async def session(self):
+        """Context manager around a write session."""
+        session = await self.get_session()
+        async with session:
+            yield session
+
+    @asynccontextmanager
+    async def read_session(self):
+        """Context manager around a read-only session."""
+        session = await self.get_read_session()
+        async with session:
+            yield session
+
     async def close(self):
-        """Close the database connection."""
+        """Close the database connections."""
+        if self.read_engine:
+            await self.read_engine.dispose()
         if self.engine:
             await self.engine.dispose()
+        self.engine = self.read_engine = None
+        self.session_maker = self.read_session_maker = None
 
 
 # Global database instance
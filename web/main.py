@@ -1,20 +1,37 @@
 """FastAPI web server for SNOWLANDER Discord bot."""
 
 import os
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import List, Optional, Union
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 
 from .database import db
-from .models import Track, QueueItem, BotStatus, Playlist, PlaylistItem, TrackResponse, QueueItemResponse, BotStatusResponse, PlaylistResponse
+from .models import Track, QueueItem, BotStatus, Playlist, PlaylistItem, TrackResponse, QueueItemResponse, BotStatusResponse, PlaylistResponse, FacetResponse
+from .models import QueueSyncResponse, BulkEnqueueRequest, BulkEnqueueResponse, LibraryImportResponse
+from .models import DailyTrackPlays, DailyUserPlays, PlayStatsResponse, TrackPlaysResponse, UserPlaysResponse
 from .websocket_manager import ConnectionManager
+from .queue import QueueItemNotFound, append_to_queue, guild_queue, insert_after, load_queue_item, move_queue_item, queue_index, queue_length, queue_respaced
+from .queue import BULK_ENQUEUE_LIMIT, enqueue_tracks, queue_item_payload
+from .queue_log import queue_log
+from .response_cache import response_cache
+from .serialization import dumps, queue_item_dicts, queue_item_select, track_dicts, track_select
+from .pagination import BROWSE_ORDER, InvalidCursor, apply_cursor, encode_cursor
+from library.search import apply_search
+from bot.state import bot_state
+from bot.events import PlaylistsChanged, PositionsUpdated, QueueChanged, ScanProgress, StatusChanged, TrackStarted, TracksChanged
+from bot.events import event_bus, publish_queue_change
+from bot.decoder_pool import decoder_pool
+from library.facets import FACETS, get_facet_counts
+from library.selection import InvalidSelection, select_tracks
+from library.transfer import export_tracks, import_tracks
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -34,7 +51,11 @@ app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 templates = Jinja2Templates(directory=str(templates_dir))
 
 # WebSocket connection manager
-manager = ConnectionManager()
+manager = ConnectionManager(
+    max_queue=int(os.getenv("WS_SEND_QUEUE_SIZE", 64)),
+    slow_client_policy=os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest").lower(),
+    send_timeout=float(os.getenv("WS_SEND_TIMEOUT", 10))
+)
 
 
 # Dependency to get database session
@@ -46,15 +67,27 @@ async def get_db_session():
         await session.close()
 
 
+# Dependency to get a read-only session that never waits on writers
+async def get_read_db_session():
+    session = await db.get_read_session()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup."""
+    """Initialize database and start receiving events from a separate bot process."""
     await db.initialize()
+    await event_bus.listen()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close database on shutdown."""
+    """Flush pending bot status and close database on shutdown."""
+    await event_bus.close()
+    await bot_state.close()
     await db.close()
 
 
@@ -84,25 +117,58 @@ async def playlists_page(request: Request):
 
 
 # API Routes
-@app.get("/api/status", response_model=BotStatusResponse)
-async def get_bot_status(db_session: AsyncSession = Depends(get_db_session)):
-    """Get current bot status."""
+async def resolve_guild_id(guild_id: Optional[str], db_session: AsyncSession) -> Optional[str]:
+    """Pick the guild a request refers to, defaulting to the most recently active one."""
+    if guild_id:
+        return guild_id
+    if bot_state.active:
+        return bot_state.last_guild_id
+    if _live_status:
+        return next(reversed(_live_status))
+    
     result = await db_session.execute(
-        select(BotStatus)
-        .options(selectinload(BotStatus.current_track))
-        .order_by(BotStatus.last_updated.desc())
-        .limit(1)
+        select(BotStatus.guild_id).order_by(BotStatus.last_updated.desc()).limit(1)
+    )
+    return result.scalar()
+
+
+@app.get("/api/status", response_model=BotStatusResponse)
+async def get_bot_status(
+    request: Request,
+    guild_id: Optional[str] = Query(None, description="Guild to report on (default: most recently active)"),
+    db_session: AsyncSession = Depends(get_read_db_session)
+):
+    """Get current bot status for a guild.
+    
+    Served from the bot's in-memory state when the bot runs in this process,
+    or from the status it publishes over the event bus when it runs in
+    another, falling back to the persisted bot_status row otherwise. Cached
+    until the status, the queue or the tracks change; playing guilds publish
+    their position every POSITION_PUSH_MS.
+    """
+    return await response_cache.respond(
+        request, ("status", "queue", "tracks"),
+        lambda response: _bot_status(db_session, guild_id),
+        variant="memory" if bot_state.active else ""
     )
+
+
+async def _bot_status(db_session: AsyncSession, guild_id: Optional[str]) -> BotStatusResponse:
+    if bot_state.active:
+        return await _status_from_memory(db_session, bot_state.snapshot(guild_id))
+    
+    live = _live_status.get(await resolve_guild_id(guild_id, db_session)) if _live_status else None
+    if live:
+        return await _status_from_memory(db_session, live)
+    
+    query = select(BotStatus).options(selectinload(BotStatus.current_track))
+    if guild_id:
+        query = query.where(BotStatus.guild_id == guild_id)
+    result = await db_session.execute(query.order_by(BotStatus.last_updated.desc()).limit(1))
     status = result.scalar_one_or_none()
     
     if not status:
-        return BotStatusResponse()
-    
-    # Get queue length
-    queue_result = await db_session.execute(
-        select(func.count(QueueItem.id)).where(QueueItem.played == False)
-    )
-    queue_length = queue_result.scalar() or 0
+        return BotStatusResponse(guild_id=guild_id)
     
     return BotStatusResponse(
         guild_id=status.guild_id,
@@ -112,32 +178,97 @@ async def get_bot_status(db_session: AsyncSession = Depends(get_db_session)):
         current_track=TrackResponse.model_validate(status.current_track) if status.current_track else None,
         volume=status.volume,
         position=status.position,
-        queue_length=queue_length
+        queue_length=await queue_length(db_session, status.guild_id)
+    )
+
+
+# Current track responses, reused while the same tracks keep playing
+_current_track_cache = {}
+
+# Queue lengths per guild with the queue version they were counted at
+_queue_length_cache = {}
+
+
+async def _status_from_memory(db_session: AsyncSession, state: dict) -> BotStatusResponse:
+    guild_id = state["guild_id"]
+    track_id = state["current_track_id"]
+    
+    current_track = _current_track_cache.get(track_id)
+    if track_id and current_track is None:
+        track = await db_session.get(Track, track_id)
+        if track:
+            current_track = TrackResponse.model_validate(track)
+            # Bounded by the number of guilds playing at once
+            if len(_current_track_cache) > 4 * max(len(bot_state.guilds), len(_live_status), 1):
+                _current_track_cache.clear()
+            _current_track_cache[track_id] = current_track
+    
+    # Every queue change bumps the version, so a cached count is current while the version matches
+    version = queue_log.version(guild_id)
+    cached = _queue_length_cache.get(guild_id)
+    if cached and cached[0] == version:
+        length = cached[1]
+    else:
+        length = await queue_length(db_session, guild_id)
+        _queue_length_cache[guild_id] = (version, length)
+    
+    return BotStatusResponse(
+        guild_id=guild_id,
+        channel_id=state["channel_id"],
+        is_connected=state["is_connected"],
+        is_playing=state["is_playing"],
+        current_track=current_track,
+        volume=state["volume"],
+        position=state["position"],
+        queue_length=length
     )
 
 
 @app.get("/api/tracks", response_model=List[TrackResponse])
 async def get_tracks(
+    request: Request,
     search: Optional[str] = Query(None, description="Search query"),
     artist: Optional[str] = Query(None, description="Filter by artist"),
     album: Optional[str] = Query(None, description="Filter by album"),
     genre: Optional[str] = Query(None, description="Filter by genre"),
-    limit: int = Query(50, le=200, description="Number of tracks to return"),
+    limit: int = Query(50, ge=1, le=200, description="Number of tracks to return"),
     offset: int = Query(0, ge=0, description="Number of tracks to skip"),
-    db_session: AsyncSession = Depends(get_db_session)
+    cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor for keyset paging"),
+    db_session: AsyncSession = Depends(get_read_db_session)
 ):
-    """Get tracks with optional filtering."""
-    query = select(Track)
+    """Get tracks with optional filtering.
+    
+    Pages are returned in library browse order; searches without a cursor
+    are ranked by relevance instead. Full browse-ordered pages carry an
+    ``X-Next-Cursor`` header, and passing it back as ``cursor`` fetches the
+    next page with an index range scan, so deep pages cost the same as the
+    first. An empty ``cursor`` starts keyset paging from the beginning.
+    Pages are cached until the tracks change.
+    """
+    return await response_cache.respond(
+        request, ("tracks",),
+        lambda response: _tracks_page(response, search, artist, album, genre, limit, offset, cursor, db_session)
+    )
+
+
+async def _tracks_page(
+    response: Response,
+    search: Optional[str],
+    artist: Optional[str],
+    album: Optional[str],
+    genre: Optional[str],
+    limit: int,
+    offset: int,
+    cursor: Optional[str],
+    db_session: AsyncSession
+) -> bytes:
+    # Plain column tuples serialised directly; see web/serialization.py
+    query = track_select()
+    use_cursor = cursor is not None
     
-    # Apply filters
+    # Apply filters; full-text matches are ranked by relevance first
     if search:
-        search_filter = f"%{search}%"
-        query = query.where(
-            (Track.title.ilike(search_filter)) |
-            (Track.artist.ilike(search_filter)) |
-            (Track.album.ilike(search_filter)) |
-            (Track.filename.ilike(search_filter))
-        )
+        query = apply_search(query, search, ranked=not use_cursor)
     
     if artist:
         query = query.where(Track.artist.ilike(f"%{artist}%"))
@@ -149,32 +280,212 @@ async def get_tracks(
         query = query.where(Track.genre.ilike(f"%{genre}%"))
     
     # Apply pagination
-    query = query.offset(offset).limit(limit).order_by(Track.artist, Track.album, Track.title)
+    if use_cursor:
+        try:
+            query = apply_cursor(query, cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        query = query.offset(offset)
+    query = query.limit(limit).order_by(*BROWSE_ORDER)
     
     result = await db_session.execute(query)
-    tracks = result.scalars().all()
+    tracks = result.all()
+    
+    # Relevance-ranked pages have no browse position to resume from
+    if tracks and len(tracks) == limit and (use_cursor or not search):
+        response.headers["X-Next-Cursor"] = encode_cursor(tracks[-1])
+    
+    return dumps(track_dicts(tracks))
+
+
+@app.get("/api/tracks/export")
+async def export_library():
+    """Stream the whole library as NDJSON, one track per line.
+    
+    Rows are read from a server-side cursor in batches, so memory stays
+    constant however large the library is. The output is accepted as is
+    by ``POST /api/tracks/import``.
+    """
+    filename = f"snowlander-tracks-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson"
+    return StreamingResponse(
+        export_tracks(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.post("/api/tracks/import", response_model=LibraryImportResponse)
+async def import_library(request: Request):
+    """Bulk-upsert tracks from an NDJSON request body, matched by filename.
+    
+    The body is parsed as it arrives and written in batches, each in its
+    own transaction. Lines need ``filename`` and ``filepath``; any other
+    field that is missing or null keeps its stored value. Invalid lines are
+    skipped and counted.
+    """
+    result = await import_tracks(request.stream())
+    return result.to_dict()
+
+
+@app.get("/api/facets/{facet}", response_model=List[FacetResponse])
+async def get_facets(
+    facet: str,
+    search: Optional[str] = Query(None, description="Search query"),
+    artist: Optional[str] = Query(None, description="Filter by artist"),
+    album: Optional[str] = Query(None, description="Filter by album"),
+    genre: Optional[str] = Query(None, description="Filter by genre"),
+    limit: int = Query(500, ge=1, le=5000, description="Number of values to return"),
+    db_session: AsyncSession = Depends(get_read_db_session)
+):
+    """Get artists, albums or genres with track counts, using the /api/tracks filters."""
+    if facet not in FACETS:
+        raise HTTPException(status_code=404, detail="Unknown facet")
+    
+    return await get_facet_counts(
+        db_session, facet,
+        search=search, artist=artist, album=album, genre=genre, limit=limit
+    )
+
+
+# Bot events: forwarded to dashboard clients and kept for status requests.
+# Status published by a bot in another process, most recently updated guild last
+_live_status = {}
+
+
+def _cache_status(event: StatusChanged):
+    _live_status.pop(event.guild_id, None)
+    _live_status[event.guild_id] = dict(event.status)
+
+
+def _cache_positions(event: PositionsUpdated):
+    for update in event.positions:
+        state = _live_status.get(update["guild_id"])
+        if state is not None:
+            state["position"] = update["position"]
+
+
+async def _broadcast_status(event: StatusChanged):
+    await manager.broadcast_status_update(event.status)
+
+
+async def _broadcast_track(event: TrackStarted):
+    await manager.broadcast_track_update({
+        "guild_id": event.guild_id,
+        "track_id": event.track_id,
+        "requested_by": event.requested_by
+    })
+
+
+async def _broadcast_positions(event: PositionsUpdated):
+    await manager.broadcast_position_update(event.positions)
+
+
+async def _broadcast_scan_progress(event: ScanProgress):
+    await manager.broadcast({
+        "type": "scan_progress",
+        "data": event.progress
+    })
+
+
+async def _broadcast_queue_change(event: QueueChanged):
+    """Version a committed queue change and send it to dashboard clients as a delta."""
+    change = queue_log.record(event.guild_id, event.op, **event.data)
+    # Cached queues carry the version header; drop the ones built before it moved
+    response_cache.bump("queue")
+    await manager.broadcast({
+        "type": "queue_update",
+        "action": event.op,
+        "guild_id": event.guild_id,
+        "version": change["version"],
+        "data": change
+    })
+
+
+# Cached responses computed from what each event changed
+_INVALIDATES = {
+    StatusChanged: "status",
+    PositionsUpdated: "status",
+    QueueChanged: "queue",
+    TracksChanged: "tracks",
+    PlaylistsChanged: "playlists",
+}
+
+
+def _invalidate_responses(event):
+    response_cache.bump(_INVALIDATES[type(event)])
+    if isinstance(event, TracksChanged):
+        # Play counts and loudness of the playing tracks may have changed
+        _current_track_cache.clear()
+
+
+for event_type in _INVALIDATES:
+    event_bus.subscribe(event_type, _invalidate_responses, immediate=True)
+event_bus.subscribe(StatusChanged, _cache_status)
+event_bus.subscribe(StatusChanged, _broadcast_status)
+event_bus.subscribe(TrackStarted, _broadcast_track)
+event_bus.subscribe(PositionsUpdated, _cache_positions)
+event_bus.subscribe(PositionsUpdated, _broadcast_positions)
+event_bus.subscribe(QueueChanged, _broadcast_queue_change)
+event_bus.subscribe(ScanProgress, _broadcast_scan_progress)
+
+
+@app.get("/api/queue", response_model=Union[List[QueueItemResponse], QueueSyncResponse])
+async def get_queue(
+    request: Request,
+    guild_id: Optional[str] = Query(None, description="Guild whose queue to return (default: most recently active)"),
+    since: Optional[int] = Query(None, description="Queue version the client has; only later changes are returned"),
+    db_session: AsyncSession = Depends(get_read_db_session)
+):
+    """Get current queue.
     
-    return [TrackResponse.model_validate(track) for track in tracks]
+    The queue version is sent in the X-Queue-Version header. With ``since``,
+    the changes after that version are returned instead, or the whole queue
+    when they are no longer retained. Responses are cached until the queue
+    or the tracks change.
+    """
+    # Without a guild the answer also depends on which guild was active last
+    domains = ("queue", "tracks") if guild_id else ("queue", "tracks", "status")
+    return await response_cache.respond(
+        request, domains, lambda response: _queue_contents(response, guild_id, since, db_session)
+    )
 
 
-@app.get("/api/queue", response_model=List[QueueItemResponse])
-async def get_queue(db_session: AsyncSession = Depends(get_db_session)):
-    """Get current queue."""
+async def _queue_contents(
+    response: Response,
+    guild_id: Optional[str],
+    since: Optional[int],
+    db_session: AsyncSession
+) -> bytes:
+    guild_id = await resolve_guild_id(guild_id, db_session)
+    # Read before the queue: a change landing in between is replayed, never missed
+    version = queue_log.version(guild_id)
+    
+    if since is not None:
+        changes = queue_log.changes_since(guild_id, since)
+        if changes is not None:
+            return dumps({"guild_id": guild_id, "version": version, "changes": changes, "items": None})
+    
     result = await db_session.execute(
-        select(QueueItem)
-        .options(selectinload(QueueItem.track))
-        .where(QueueItem.played == False)
-        .order_by(QueueItem.position)
+        guild_queue(queue_item_select(), guild_id).order_by(QueueItem.position)
     )
-    queue_items = result.scalars().all()
+    queue_items = queue_item_dicts(result)
     
-    return [QueueItemResponse.model_validate(item) for item in queue_items]
+    if since is not None:
+        return dumps({"guild_id": guild_id, "version": version, "changes": None, "items": queue_items})
+    
+    response.headers["X-Queue-Version"] = str(version)
+    if guild_id:
+        response.headers["X-Queue-Guild"] = guild_id
+    return dumps(queue_items)
 
 
 @app.post("/api/queue/add/{track_id}")
 async def add_to_queue(
     track_id: int,
     requested_by: Optional[str] = None,
+    after: Optional[int] = Query(None, description="Queue item to insert after (default: end of queue)"),
+    guild_id: Optional[str] = Query(None, description="Guild whose queue to add to (default: most recently active)"),
     db_session: AsyncSession = Depends(get_db_session)
 ):
     """Add a track to the queue."""
@@ -185,31 +496,96 @@ async def add_to_queue(
     if not track:
         raise HTTPException(status_code=404, detail="Track not found")
     
-    # Get next position in queue
-    position_result = await db_session.execute(
-        select(func.coalesce(func.max(QueueItem.position), 0) + 1)
-        .where(QueueItem.played == False)
-    )
-    next_position = position_result.scalar()
+    # Create queue item; only the new row is written
+    guild_id = await resolve_guild_id(guild_id, db_session)
+    try:
+        if after is None:
+            queue_item_id = await append_to_queue(db_session, guild_id, track_id, requested_by)
+        else:
+            queue_item_id = await insert_after(db_session, guild_id, track_id, after, requested_by)
+    except QueueItemNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    position = await queue_index(db_session, guild_id, queue_item_id)
+    item = queue_item_payload(await load_queue_item(db_session, queue_item_id))
+    await db_session.commit()
+    
+    # Notify WebSocket clients; a renumbered queue is reloaded as a whole
+    if queue_respaced(db_session, guild_id):
+        publish_queue_change(guild_id, "reset")
+    else:
+        publish_queue_change(guild_id, "added", item=item)
+    
+    return {"message": "Track added to queue", "queue_item_id": queue_item_id, "position": position}
+
+
+@app.post("/api/queue/bulk", response_model=BulkEnqueueResponse)
+async def bulk_add_to_queue(
+    selection: BulkEnqueueRequest,
+    guild_id: Optional[str] = Query(None, description="Guild whose queue to add to (default: most recently active)"),
+    db_session: AsyncSession = Depends(get_db_session),
+    read_session: AsyncSession = Depends(get_read_db_session)
+):
+    """Add many tracks to the end of the queue in one transaction.
+    
+    Tracks are given by id or selected by playlist, search, album or
+    artist, and at most BULK_ENQUEUE_LIMIT are added in play order.
+    Dashboard clients receive a single queue change for the whole batch.
+    """
+    try:
+        tracks = await select_tracks(
+            read_session,
+            track_ids=selection.track_ids,
+            playlist_id=selection.playlist_id,
+            search=selection.search,
+            album=selection.album,
+            artist=selection.artist,
+            limit=BULK_ENQUEUE_LIMIT
+        )
+    except InvalidSelection as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Create queue item
-    queue_item = QueueItem(
-        track_id=track_id,
-        position=next_position,
-        requested_by=requested_by
+    if not tracks:
+        raise HTTPException(status_code=404, detail="No tracks matched")
+    
+    guild_id = await resolve_guild_id(guild_id, read_session)
+    rows = await enqueue_tracks(db_session, guild_id, tracks, selection.requested_by)
+    position = await queue_index(db_session, guild_id, rows[0]["id"])
+    
+    return BulkEnqueueResponse(
+        message=f"Added {len(rows)} tracks to queue",
+        added=len(rows),
+        queue_item_ids=[row["id"] for row in rows],
+        position=position
     )
+
+
+@app.post("/api/queue/{queue_item_id}/move")
+async def move_in_queue(
+    queue_item_id: int,
+    after: Optional[int] = Query(None, description="Queue item to move after (default: front of queue)"),
+    db_session: AsyncSession = Depends(get_db_session)
+):
+    """Move a queue item after another one in its guild's queue, or to the front."""
+    result = await db_session.execute(select(QueueItem.guild_id).where(QueueItem.id == queue_item_id))
+    guild_id = result.scalar()
+    try:
+        key = await move_queue_item(db_session, guild_id, queue_item_id, after)
+    except QueueItemNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    db_session.add(queue_item)
+    position = await queue_index(db_session, guild_id, queue_item_id)
     await db_session.commit()
     
-    # Notify WebSocket clients
-    await manager.broadcast({
-        "type": "queue_updated",
-        "action": "added",
-        "track": TrackResponse.model_validate(track).model_dump()
-    })
+    # Notify WebSocket clients; a renumbered queue is reloaded as a whole
+    if queue_respaced(db_session, guild_id):
+        publish_queue_change(guild_id, "reset")
+    else:
+        publish_queue_change(guild_id, "moved", id=queue_item_id, position=key)
     
-    return {"message": "Track added to queue", "position": next_position}
+    return {"message": "Queue item moved", "position": position}
 
 
 @app.delete("/api/queue/{queue_item_id}")
@@ -224,22 +600,23 @@ async def remove_from_queue(
     if not queue_item:
         raise HTTPException(status_code=404, detail="Queue item not found")
     
+    guild_id = queue_item.guild_id
     await db_session.delete(queue_item)
     await db_session.commit()
     
     # Notify WebSocket clients
-    await manager.broadcast({
-        "type": "queue_updated",
-        "action": "removed",
-        "queue_item_id": queue_item_id
-    })
+    publish_queue_change(guild_id, "removed", id=queue_item_id)
     
     return {"message": "Track removed from queue"}
 
 
 @app.get("/api/playlists", response_model=List[PlaylistResponse])
-async def get_playlists(db_session: AsyncSession = Depends(get_db_session)):
-    """Get all playlists."""
+async def get_playlists(request: Request, db_session: AsyncSession = Depends(get_read_db_session)):
+    """Get all playlists, cached until they change."""
+    return await response_cache.respond(request, ("playlists",), lambda response: _playlists(db_session))
+
+
+async def _playlists(db_session: AsyncSession) -> List[PlaylistResponse]:
     result = await db_session.execute(
         select(Playlist, func.count(PlaylistItem.id).label("track_count"))
         .outerjoin(PlaylistItem)
@@ -256,6 +633,65 @@ async def get_playlists(db_session: AsyncSession = Depends(get_db_session)):
     return playlists
 
 
+@app.get("/api/stats", response_model=PlayStatsResponse)
+async def get_play_stats(
+    days: int = Query(7, ge=1, le=3650, description="Number of days to include"),
+    limit: int = Query(10, ge=1, le=100, description="Number of top tracks and users to return"),
+    db_session: AsyncSession = Depends(get_read_db_session)
+):
+    """Get listening statistics from the daily play rollups."""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    
+    total_result = await db_session.execute(
+        select(func.coalesce(func.sum(DailyTrackPlays.play_count), 0))
+        .where(DailyTrackPlays.day >= since)
+    )
+    
+    plays = func.sum(DailyTrackPlays.play_count).label("plays")
+    tracks_result = await db_session.execute(
+        select(Track, plays)
+        .join(DailyTrackPlays, DailyTrackPlays.track_id == Track.id)
+        .where(DailyTrackPlays.day >= since)
+        .group_by(Track.id)
+        .order_by(plays.desc())
+        .limit(limit)
+    )
+    
+    user_plays = func.sum(DailyUserPlays.play_count).label("plays")
+    users_result = await db_session.execute(
+        select(DailyUserPlays.user_id, user_plays)
+        .where(DailyUserPlays.day >= since)
+        .group_by(DailyUserPlays.user_id)
+        .order_by(user_plays.desc())
+        .limit(limit)
+    )
+    
+    return PlayStatsResponse(
+        days=days,
+        total_plays=total_result.scalar() or 0,
+        top_tracks=[
+            TrackPlaysResponse(track=TrackResponse.model_validate(track), play_count=count)
+            for track, count in tracks_result
+        ],
+        top_users=[
+            UserPlaysResponse(user_id=user_id, play_count=count)
+            for user_id, count in users_result
+        ]
+    )
+
+
+@app.get("/api/events")
+async def get_event_stats():
+    """Get event bus counts per event type, publish-to-delivery latency and response cache usage."""
+    return {**event_bus.metrics.to_dict(), "response_cache": response_cache.stats()}
+
+
+@app.get("/api/decoders")
+async def get_decoder_stats():
+    """Get decoder pool occupancy, FFmpeg spawn times and time to first frame."""
+    return decoder_pool.stats()
+
+
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -266,8 +702,10 @@ async def websocket_endpoint(websocket: WebSocket):
             # Keep connection alive and listen for messages
             data = await websocket.receive_text()
             # Echo back for now (can add message handling later)
-            await websocket.send_text(f"Message received: {data}")
+            manager.send_text(websocket, f"Message received: {data}")
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 
@@ -1,10 +1,10 @@
 """Database models for SNOWLANDER music bot."""
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index, UniqueConstraint, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 Base = declarative_base()
@@ -30,9 +30,54 @@ class Track(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_played = Column(DateTime)
     play_count = Column(Integer, default=0)
+    loudness = Column(Float)  # EBU R128 integrated loudness in LUFS
+    true_peak = Column(Float)  # True peak in dBTP
+    loudness_scanned_at = Column(DateTime)  # Set once analysed, even if analysis failed
     
     # Relationships
     queue_items = relationship("QueueItem", back_populates="track")
+    
+    __table_args__ = (
+        # Matches the library browse order so keyset pages are index range scans
+        Index(
+            "ix_tracks_browse_order",
+            func.coalesce(artist, ""),
+            func.coalesce(album, ""),
+            func.coalesce(title, ""),
+            id
+        ),
+    )
+
+
+class TrackFacet(Base):
+    """Track count per (artist, album, genre), maintained by triggers on tracks."""
+    __tablename__ = "track_facets"
+    
+    id = Column(Integer, primary_key=True)
+    artist = Column(String, nullable=False, default="")  # Empty string for untagged tracks
+    album = Column(String, nullable=False, default="")
+    genre = Column(String, nullable=False, default="")
+    track_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("artist", "album", "genre"),
+        # Covering indexes so each facet groups without a sort or table lookups
+        Index("ix_track_facets_artist", "artist", "album", "genre", "track_count"),
+        Index("ix_track_facets_album", "album", "artist", "genre", "track_count"),
+        Index("ix_track_facets_genre", "genre", "artist", "album", "track_count"),
+    )
+
+
+class LibraryFile(Base):
+    """Scan manifest entry for one file in the music directory."""
+    __tablename__ = "library_files"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, unique=True, index=True, nullable=False)  # Matches Track.filename
+    size = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=False)
+    inode = Column(Integer, nullable=False)
+    scanned_at = Column(DateTime, default=datetime.utcnow)
 
 
 class QueueItem(Base):
@@ -40,14 +85,19 @@ class QueueItem(Base):
     __tablename__ = "queue_items"
     
     id = Column(Integer, primary_key=True, index=True)
+    guild_id = Column(String)  # Discord guild whose queue this item belongs to
     track_id = Column(Integer, ForeignKey("tracks.id"), nullable=False)
-    position = Column(Integer, nullable=False)
+    position = Column(Float, nullable=False)  # Sparse sort key, see web/queue.py
     requested_by = Column(String)  # Discord user ID
     requested_at = Column(DateTime, default=datetime.utcnow)
     played = Column(Boolean, default=False)
     
     # Relationships
     track = relationship("Track", back_populates="queue_items")
+    
+    __table_args__ = (
+        Index("ix_queue_items_guild_position", "guild_id", "played", "position"),
+    )
 
 
 class Playlist(Base):
@@ -85,7 +135,7 @@ class BotStatus(Base):
     __tablename__ = "bot_status"
     
     id = Column(Integer, primary_key=True, index=True)
-    guild_id = Column(String)
+    guild_id = Column(String, unique=True, index=True)  # One row per guild
     channel_id = Column(String)
     is_connected = Column(Boolean, default=False)
     is_playing = Column(Boolean, default=False)
@@ -98,6 +148,44 @@ class BotStatus(Base):
     current_track = relationship("Track")
 
 
+class PlayEvent(Base):
+    """Append-only log of track plays, folded into statistics by the rollup job."""
+    __tablename__ = "play_events"
+    
+    id = Column(Integer, primary_key=True)
+    track_id = Column(Integer, ForeignKey("tracks.id"), nullable=False)
+    guild_id = Column(String)
+    user_id = Column(String)  # Discord user ID of the requester
+    played_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RollupState(Base):
+    """High-water marks of processed rows for periodic rollup jobs."""
+    __tablename__ = "rollup_state"
+    
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DailyTrackPlays(Base):
+    """Plays per track per day."""
+    __tablename__ = "daily_track_plays"
+    
+    day = Column(String, primary_key=True)  # YYYY-MM-DD (UTC)
+    track_id = Column(Integer, ForeignKey("tracks.id"), primary_key=True)
+    play_count = Column(Integer, nullable=False, default=0)
+
+
+class DailyUserPlays(Base):
+    """Plays per requesting user per day."""
+    __tablename__ = "daily_user_plays"
+    
+    day = Column(String, primary_key=True)  # YYYY-MM-DD (UTC)
+    user_id = Column(String, primary_key=True)
+    play_count = Column(Integer, nullable=False, default=0)
+
+
 # Pydantic models for API
 class TrackResponse(BaseModel):
     id: int
@@ -110,6 +198,8 @@ class TrackResponse(BaseModel):
     duration: Optional[float] = None
     format: Optional[str] = None
     play_count: int = 0
+    loudness: Optional[float] = None
+    true_peak: Optional[float] = None
     
     model_config = {"from_attributes": True}
 
@@ -117,7 +207,7 @@ class TrackResponse(BaseModel):
 class QueueItemResponse(BaseModel):
     id: int
     track: TrackResponse
-    position: int
+    position: float
     requested_by: Optional[str] = None
     requested_at: datetime
     played: bool = False
@@ -125,6 +215,37 @@ class QueueItemResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class QueueSyncResponse(BaseModel):
+    guild_id: Optional[str] = None
+    version: int
+    changes: Optional[List[dict]] = None  # Changes after the requested version, oldest first
+    items: Optional[List[QueueItemResponse]] = None  # Whole queue when those changes are gone
+
+
+class BulkEnqueueRequest(BaseModel):
+    # Exactly one source: track ids, a playlist, a search, or an album and/or artist
+    track_ids: Optional[List[int]] = None
+    playlist_id: Optional[int] = None
+    search: Optional[str] = None
+    album: Optional[str] = None
+    artist: Optional[str] = None
+    requested_by: Optional[str] = None
+
+
+class BulkEnqueueResponse(BaseModel):
+    message: str
+    added: int
+    queue_item_ids: List[int]
+    position: int  # 1-based queue position of the first added item
+
+
+class LibraryImportResponse(BaseModel):
+    imported: int  # Rows inserted or updated
+    unchanged: int
+    invalid: int
+    errors: List[str]  # The first few invalid lines and why
+
+
 class BotStatusResponse(BaseModel):
     guild_id: Optional[str] = None
     channel_id: Optional[str] = None
@@ -148,3 +269,25 @@ class PlaylistResponse(BaseModel):
     track_count: int = 0
     
     model_config = {"from_attributes": True}
+
+
+class FacetResponse(BaseModel):
+    value: Optional[str] = None
+    track_count: int = 0
+
+
+class TrackPlaysResponse(BaseModel):
+    track: TrackResponse
+    play_count: int = 0
+
+
+class UserPlaysResponse(BaseModel):
+    user_id: str
+    play_count: int = 0
+
+
+class PlayStatsResponse(BaseModel):
+    days: int
+    total_plays: int = 0
+    top_tracks: List[TrackPlaysResponse] = []
+    top_users: List[UserPlaysResponse] = []
@@ -0,0 +1,58 @@
+"""Keyset (cursor) pagination helpers for the track browser."""
+
+import base64
+import json
+from typing import Any, List, Optional
+
+from sqlalchemy import func, tuple_
+
+from .models import Track
+
+
+# Library browse order; mirrored exactly by the ix_tracks_browse_order index
+BROWSE_ORDER = (
+    func.coalesce(Track.artist, ""),
+    func.coalesce(Track.album, ""),
+    func.coalesce(Track.title, ""),
+    Track.id,
+)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(track) -> str:
+    """Encode the browse position of a track as an opaque cursor."""
+    key = [track.artist or "", track.album or "", track.title or "", track.id]
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor back into its (artist, album, title, id) key."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+    if (
+        not isinstance(key, list) or len(key) != 4 or
+        not all(isinstance(value, str) for value in key[:3]) or
+        not isinstance(key[3], int)
+    ):
+        raise InvalidCursor("Invalid cursor")
+    return key
+
+
+def apply_cursor(query, cursor: Optional[str]):
+    """Restrict a browse-ordered query to rows after the cursor position."""
+    if not cursor:
+        return query
+    key = decode_cursor(cursor)
+    # SQLite only seeks on the leading index column, so bound it explicitly
+    return query.where(
+        BROWSE_ORDER[0] >= key[0],
+        tuple_(*BROWSE_ORDER) > tuple_(*key)
+    )
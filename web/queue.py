@@ -0,0 +1,316 @@
+"""Queue ordering with sparse fractional position keys.
+
+Each guild has its own queue, whose unplayed items are ordered by
+``QueueItem.position``. New items are spaced ``POSITION_STEP`` apart and
+inserts or moves take the midpoint of their neighbours, so every operation
+writes a single row and reads its neighbours through the
+(guild_id, played, position) index, whatever the queue length.
+"""
+
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, insert, update, func, tuple_
+from sqlalchemy.orm import selectinload
+
+from .models import Track, QueueItem, TrackResponse, QueueItemResponse
+from bot.events import publish_queue_change
+
+
+POSITION_STEP = 1024.0
+
+# Most tracks added at once that dashboard clients receive as items; more make them reload the queue
+QUEUE_DELTA_MAX_ITEMS = 100
+
+BULK_ENQUEUE_LIMIT = int(os.getenv("BULK_ENQUEUE_LIMIT", 1000))
+
+
+class QueueItemNotFound(LookupError):
+    """Raised when a queue operation references a missing or played item."""
+
+
+def _unplayed(guild_id: Optional[str]):
+    return (QueueItem.guild_id == guild_id) & (QueueItem.played == False)
+
+
+def guild_queue(query, guild_id: Optional[str]):
+    """Restrict a query to the unplayed queue of a guild."""
+    return query.where(_unplayed(guild_id))
+
+
+async def _anchor_position(session, guild_id: Optional[str], item_id: int) -> float:
+    result = await session.execute(
+        select(QueueItem.position).where(QueueItem.id == item_id, _unplayed(guild_id))
+    )
+    position = result.scalar_one_or_none()
+    if position is None:
+        raise QueueItemNotFound(f"Queue item {item_id} not found")
+    return position
+
+
+async def _key_after(
+    session,
+    guild_id: Optional[str],
+    after_id: Optional[int],
+    exclude_id: Optional[int] = None
+) -> float:
+    """Position key between ``after_id`` (or the queue head) and its successor."""
+    lower = None if after_id is None else await _anchor_position(session, guild_id, after_id)
+
+    query = select(func.min(QueueItem.position)).where(_unplayed(guild_id))
+    if lower is not None:
+        query = query.where(QueueItem.position > lower)
+    if exclude_id is not None:
+        query = query.where(QueueItem.id != exclude_id)
+    upper = (await session.execute(query)).scalar()
+
+    if lower is None and upper is None:
+        return POSITION_STEP
+    if lower is None:
+        return upper - POSITION_STEP
+    if upper is None:
+        return lower + POSITION_STEP
+
+    key = (lower + upper) / 2
+    if lower < key < upper:
+        return key
+
+    # Float precision between these neighbours is used up; respace once and retry
+    await respace_queue(session, guild_id)
+    return await _key_after(session, guild_id, after_id, exclude_id)
+
+
+async def respace_queue(session, guild_id: Optional[str]):
+    """Renumber unplayed items ``POSITION_STEP`` apart, keeping their order.
+
+    Only needed after roughly fifty inserts into the same gap. Every key in
+    the queue changes, which ``queue_respaced`` reports after the fact.
+    """
+    session.info.setdefault("respaced_queues", set()).add(guild_id)
+    ranked = (
+        select(
+            QueueItem.id,
+            (func.row_number().over(order_by=(QueueItem.position, QueueItem.id)) * POSITION_STEP).label("key")
+        )
+        .where(_unplayed(guild_id))
+        .subquery()
+    )
+    await session.execute(
+        update(QueueItem)
+        .where(QueueItem.id == ranked.c.id)
+        .values(position=ranked.c.key)
+    )
+
+
+async def append_to_queue(
+    session,
+    guild_id: Optional[str],
+    track_id: int,
+    requested_by: Optional[str] = None
+) -> int:
+    """Append a track to the end of the queue in a single statement.
+
+    Returns the new queue item's id.
+    """
+    next_position = (
+        select(func.coalesce(func.max(QueueItem.position), 0) + POSITION_STEP)
+        .where(_unplayed(guild_id))
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        insert(QueueItem)
+        .values(
+            guild_id=guild_id,
+            track_id=track_id,
+            position=next_position,
+            requested_by=requested_by,
+            requested_at=datetime.utcnow(),
+            played=False
+        )
+        .returning(QueueItem.id)
+    )
+    return result.scalar_one()
+
+
+async def append_tracks_to_queue(
+    session,
+    guild_id: Optional[str],
+    track_ids: List[int],
+    requested_by: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Append several tracks to the end of the queue, in order, with one insert.
+
+    Positions continue from a single read of the queue's last position.
+    Returns the inserted rows with their ``id``.
+    """
+    if not track_ids:
+        return []
+
+    result = await session.execute(
+        select(func.coalesce(func.max(QueueItem.position), 0)).where(_unplayed(guild_id))
+    )
+    last_position = result.scalar()
+    requested_at = datetime.utcnow()
+    rows = [
+        {
+            "guild_id": guild_id,
+            "track_id": track_id,
+            "position": last_position + POSITION_STEP * index,
+            "requested_by": requested_by,
+            "requested_at": requested_at,
+            "played": False,
+        }
+        for index, track_id in enumerate(track_ids, 1)
+    ]
+    result = await session.execute(
+        insert(QueueItem).returning(QueueItem.id, sort_by_parameter_order=True), rows
+    )
+    for row, item_id in zip(rows, result.scalars()):
+        row["id"] = item_id
+    return rows
+
+
+def queue_item_payload(item: QueueItem) -> dict:
+    """JSON form of a queue item, as sent in ``added`` changes."""
+    return QueueItemResponse.model_validate(item).model_dump(mode="json")
+
+
+async def enqueue_tracks(session, guild_id: Optional[str], tracks: List[Track], requested_by: Optional[str]) -> List[Dict[str, Any]]:
+    """Append tracks to a guild's queue in one transaction and publish them as one queue change.
+
+    Returns the inserted queue rows.
+    """
+    rows = await append_tracks_to_queue(session, guild_id, [track.id for track in tracks], requested_by)
+    items = None
+    if len(rows) <= QUEUE_DELTA_MAX_ITEMS:
+        items = [
+            QueueItemResponse(
+                id=row["id"], track=TrackResponse.model_validate(track), position=row["position"],
+                requested_by=row["requested_by"], requested_at=row["requested_at"], played=False
+            ).model_dump(mode="json")
+            for row, track in zip(rows, tracks)
+        ]
+    await session.commit()
+
+    # One change for the whole batch; a very long addition is reloaded instead
+    if items is None:
+        publish_queue_change(guild_id, "reset")
+    else:
+        publish_queue_change(guild_id, "added", items=items)
+    return rows
+
+
+async def insert_after(
+    session,
+    guild_id: Optional[str],
+    track_id: int,
+    after_id: Optional[int],
+    requested_by: Optional[str] = None
+) -> int:
+    """Insert a track directly after another queue item, or first if ``after_id`` is None.
+
+    Returns the new queue item's id.
+    """
+    position = await _key_after(session, guild_id, after_id)
+    result = await session.execute(
+        insert(QueueItem)
+        .values(
+            guild_id=guild_id,
+            track_id=track_id,
+            position=position,
+            requested_by=requested_by,
+            requested_at=datetime.utcnow(),
+            played=False
+        )
+        .returning(QueueItem.id)
+    )
+    return result.scalar_one()
+
+
+async def move_queue_item(
+    session,
+    guild_id: Optional[str],
+    item_id: int,
+    after_id: Optional[int] = None
+) -> float:
+    """Move an item directly after another, or to the front if ``after_id`` is None.
+
+    Only the moved row is updated. Returns its new position key.
+    """
+    if item_id == after_id:
+        raise ValueError("Cannot move a queue item after itself")
+    await _anchor_position(session, guild_id, item_id)
+
+    position = await _key_after(session, guild_id, after_id, exclude_id=item_id)
+    await session.execute(
+        update(QueueItem).where(QueueItem.id == item_id).values(position=position)
+    )
+    return position
+
+
+def queue_respaced(session, guild_id: Optional[str]) -> bool:
+    """Whether this session renumbered a guild's queue; clears the flag."""
+    respaced = session.info.get("respaced_queues", set())
+    if guild_id in respaced:
+        respaced.discard(guild_id)
+        return True
+    return False
+
+
+async def load_queue_item(session, item_id: int) -> Optional[QueueItem]:
+    """A queue item with its track loaded."""
+    result = await session.execute(
+        select(QueueItem).options(selectinload(QueueItem.track)).where(QueueItem.id == item_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def queue_index(session, guild_id: Optional[str], item_id: int) -> int:
+    """1-based place of an unplayed item in its guild's queue."""
+    position = await _anchor_position(session, guild_id, item_id)
+    result = await session.execute(
+        select(func.count(QueueItem.id))
+        .where(
+            _unplayed(guild_id),
+            QueueItem.position <= position,
+            tuple_(QueueItem.position, QueueItem.id) <= tuple_(position, item_id)
+        )
+    )
+    return result.scalar()
+
+
+async def queue_length(session, guild_id: Optional[str]) -> int:
+    """Number of unplayed items in a guild's queue."""
+    result = await session.execute(select(func.count(QueueItem.id)).where(_unplayed(guild_id)))
+    return result.scalar() or 0
+
+
+async def next_in_queue(session, guild_id: Optional[str]) -> Optional[QueueItem]:
+    """First unplayed item of a guild's queue, with its track loaded."""
+    result = await session.execute(
+        select(QueueItem)
+        .options(selectinload(QueueItem.track))
+        .where(_unplayed(guild_id))
+        .order_by(QueueItem.position, QueueItem.id)
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def upcoming_tracks(session, guild_id: Optional[str], limit: int) -> List[Track]:
+    """Tracks of the first ``limit`` unplayed items of a guild's queue, in play order."""
+    result = await session.execute(
+        select(Track)
+        .join(QueueItem, QueueItem.track_id == Track.id)
+        .where(_unplayed(guild_id))
+        .order_by(QueueItem.position, QueueItem.id)
+        .limit(limit)
+    )
+    return list(result.scalars())
+
+
+async def mark_played(session, item_id: int) -> bool:
+    """Take an item out of the queue once playback has started. False if it was already removed."""
+    result = await session.execute(update(QueueItem).where(QueueItem.id == item_id).values(played=True))
+    return result.rowcount > 0
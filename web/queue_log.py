@@ -0,0 +1,52 @@
+"""Per-guild queue versions and the recent changes dashboard clients replay."""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+class QueueChangeLog:
+    """A monotonic version per guild queue and a bounded log of its latest changes.
+
+    Every committed queue mutation is recorded as a compact change (added,
+    removed, moved, played or reset) carrying the queue's new version, and
+    broadcast to dashboard clients. Versions grow by one per change, so a
+    client notices a gap and asks for ``changes_since`` its last version;
+    when those changes are no longer retained it reloads the whole queue.
+    Versions start from the process start time in milliseconds, so they
+    keep increasing across restarts and clients from a previous run resync.
+    """
+
+    def __init__(self, retain: int = 256):
+        self.retain = retain
+        self._base = int(time.time() * 1000)
+        self._versions: Dict[Optional[str], int] = {}
+        self._changes: Dict[Optional[str], Deque[Dict[str, Any]]] = {}
+
+    def version(self, guild_id: Optional[str]) -> int:
+        """Current version of a guild's queue."""
+        return self._versions.get(guild_id, self._base)
+
+    def record(self, guild_id: Optional[str], op: str, **data) -> Dict[str, Any]:
+        """Append a change to a guild's log and return it with its version."""
+        version = self._versions[guild_id] = self.version(guild_id) + 1
+        change = {"op": op, "version": version, **data}
+        changes = self._changes.get(guild_id)
+        if changes is None:
+            changes = self._changes[guild_id] = deque(maxlen=self.retain)
+        changes.append(change)
+        return change
+
+    def changes_since(self, guild_id: Optional[str], version: int) -> Optional[List[Dict[str, Any]]]:
+        """Changes after ``version``, or None if they can no longer be replayed."""
+        current = self.version(guild_id)
+        if version == current:
+            return []
+        changes = self._changes.get(guild_id)
+        if version > current or not changes or changes[0]["version"] > version + 1:
+            return None
+        return [change for change in changes if change["version"] > version]
+
+
+# Global queue change log
+queue_log = QueueChangeLog()
@@ -0,0 +1,190 @@
+"""Server-side cache of read API responses with strong ETags."""
+
+import os
+import gzip
+import hashlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.requests import Request
+from fastapi.responses import Response
+
+from .serialization import dumps
+
+
+# Browsers may keep responses but must revalidate them, which a matching ETag answers with 304
+CACHE_CONTROL = "no-cache"
+
+# Bodies at least this large are sent gzip-compressed to clients that accept it
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+@dataclass
+class CachedResponse:
+    """A serialised response body and the generations it was computed at."""
+    generation: Tuple[int, ...]
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    # Compressed once, on the first request that accepts gzip
+    gzipped: Optional[bytes] = None
+
+    @property
+    def gzip_etag(self) -> str:
+        # The compressed representation is a different byte sequence, so it gets its own strong ETag
+        return self.etag[:-1] + '-gzip"'
+
+    @property
+    def size(self) -> int:
+        return (
+            len(self.body) + len(self.gzipped or b"") +
+            sum(len(k) + len(v) for k, v in self.headers.items())
+        )
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """LRU cache of JSON responses, invalidated by per-domain generation counters.
+
+    Writes bump the generation of what they changed (``tracks``, ``queue``,
+    ``playlists``, ``status``); a cached response is served only while every
+    domain it was computed from is still at the same generation, so nothing
+    has to be found and evicted on a write. Entries are keyed by path and
+    query string and evicted least recently used first once their bodies
+    exceed ``max_bytes``.
+
+    Every response carries a strong ETag over its body, and a request whose
+    ``If-None-Match`` matches gets an empty 304.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+
+    def bump(self, *domains: str):
+        """Invalidate every response computed from these domains."""
+        for domain in domains:
+            self._generations[domain] += 1
+
+    def generation(self, domains: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._generations[domain] for domain in domains)
+
+    @staticmethod
+    def key(request: Request) -> str:
+        return f"{request.url.path}?{'&'.join(sorted(request.url.query.split('&')))}"
+
+    def get(self, key: str, generation: Tuple[int, ...]) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.generation != generation:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += entry.size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def _compress(self, key: str, entry: CachedResponse) -> bytes:
+        if entry.gzipped is None:
+            entry.gzipped = gzip.compress(entry.body, compresslevel=GZIP_LEVEL, mtime=0)
+            if self._entries.get(key) is entry:
+                self.size += len(entry.gzipped)
+                self._evict()
+        return entry.gzipped
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    async def respond(
+        self,
+        request: Request,
+        domains: Tuple[str, ...],
+        build: Callable[[Response], Awaitable[Any]],
+        variant: str = ""
+    ) -> Response:
+        """Serve a GET from the cache, or build, serialise and cache it.
+
+        ``build`` receives a scratch response whose headers are cached with
+        the body, and returns the response content, or the serialised JSON
+        bytes. ``variant`` separates responses to the same URL that come
+        from different sources.
+        """
+        key = variant + self.key(request)
+        # Read before building: a write landing meanwhile leaves the entry already stale
+        generation = self.generation(domains)
+
+        entry = self.get(key, generation)
+        if entry is None:
+            self.misses += 1
+            scratch = Response()
+            content = await build(scratch)
+            body = content if isinstance(content, bytes) else dumps(jsonable_encoder(content))
+            headers = {
+                name: value for name, value in scratch.headers.items()
+                if name not in ("content-length", "content-type")
+            }
+            entry = CachedResponse(generation, body, strong_etag(body), headers)
+            self.put(key, entry)
+        else:
+            self.hits += 1
+
+        headers = {**entry.headers, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        body, etag = entry.body, entry.etag
+        if len(body) >= GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+            body, etag = self._compress(key, entry), entry.gzip_etag
+            headers["Content-Encoding"] = "gzip"
+        headers["ETag"] = etag
+
+        if_none_match = request.headers.get("if-none-match")
+        if etag_matches(if_none_match, entry.etag) or etag_matches(if_none_match, entry.gzip_etag):
+            self.not_modified += 1
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "generations": dict(self._generations),
+        }
+
+
+# Global response cache instance
+response_cache = ResponseCache(max_bytes=int(float(os.getenv("RESPONSE_CACHE_MB", 16)) * 1024 * 1024))
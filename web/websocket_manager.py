@@ -1,35 +1,117 @@
 """WebSocket connection manager for real-time updates."""
 
 import json
-from typing import List
+import asyncio
+from typing import Dict
 from fastapi import WebSocket
 
 
+# What happens to a client whose send queue is full: drop its oldest message, or disconnect it
+SLOW_CLIENT_POLICIES = ("drop_oldest", "disconnect")
+
+
+class ClientConnection:
+    """One WebSocket client with a bounded outbound queue and its own writer task.
+    
+    Broadcasts only append to the queue, so a client on a slow network
+    delays nobody but itself; its writer sends one message at a time and
+    gives up on the connection if a send takes longer than ``send_timeout``.
+    """
+    
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self.writer: asyncio.Task = None
+    
+    def offer(self, text: str, policy: str) -> bool:
+        """Queue a message without waiting. Returns False if the client must be disconnected."""
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            if policy == "disconnect":
+                return False
+        # Positions and status updates supersede older ones, so the oldest goes first
+        self.queue.get_nowait()
+        self.dropped += 1
+        self.queue.put_nowait(text)
+        return True
+    
+    async def run_writer(self):
+        """Send queued messages until the connection fails or is closed."""
+        while True:
+            text = await self.queue.get()
+            await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+
+
 class ConnectionManager:
-    """Manages WebSocket connections."""
+    """Manages WebSocket connections.
+    
+    Each message is serialised once per broadcast and handed to every
+    client's bounded queue, so broadcasting never waits on the network and
+    costs the same however slow individual clients are. Clients that fall
+    ``max_queue`` messages behind are handled by ``slow_client_policy``.
+    """
     
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: int = 64, slow_client_policy: str = "drop_oldest", send_timeout: float = 10.0):
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"slow_client_policy must be one of {', '.join(SLOW_CLIENT_POLICIES)}")
+        self.max_queue = max_queue
+        self.slow_client_policy = slow_client_policy
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
     
     async def connect(self, websocket: WebSocket):
         """Accept a new WebSocket connection."""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, self.max_queue, self.send_timeout)
+        client.writer = asyncio.create_task(self._write(client))
+        self.active_connections[websocket] = client
         print(f"WebSocket connected. Total connections: {len(self.active_connections)}")
     
-    def disconnect(self, websocket: WebSocket):
-        """Remove a WebSocket connection."""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            print(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+    async def _write(self, client: ClientConnection):
+        try:
+            await client.run_writer()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending to WebSocket: {e!r}")
+            self.disconnect(client.websocket, close=True)
+    
+    def disconnect(self, websocket: WebSocket, close: bool = False):
+        """Remove a WebSocket connection, closing it if the client is still there."""
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        if client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        if close:
+            asyncio.create_task(self._close(websocket))
+        print(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1008: policy violation, the client could not keep up
+            await asyncio.wait_for(websocket.close(code=1008), self.send_timeout)
+        except Exception:
+            pass
+    
+    def _offer(self, client: ClientConnection, text: str):
+        if not client.offer(text, self.slow_client_policy):
+            print(f"Disconnecting slow WebSocket client ({self.max_queue} messages behind)")
+            self.disconnect(client.websocket, close=True)
+    
+    def send_text(self, websocket: WebSocket, text: str):
+        """Queue raw text for a single connection."""
+        client = self.active_connections.get(websocket)
+        if client:
+            self._offer(client, text)
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send a message to a specific WebSocket connection."""
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            print(f"Error sending message to WebSocket: {e}")
-            self.disconnect(websocket)
+        self.send_text(websocket, json.dumps(message))
     
     async def broadcast(self, message: dict):
         """Broadcast a message to all connected WebSocket clients."""
@@ -37,18 +119,17 @@ class ConnectionManager:
             return
         
         message_text = json.dumps(message)
-        disconnected = []
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_text)
-            except Exception as e:
-                print(f"Error broadcasting to WebSocket: {e}")
-                disconnected.append(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
+        for client in list(self.active_connections.values()):
+            self._offer(client, message_text)
+    
+    def stats(self) -> Dict:
+        """Connection count and how far behind clients are."""
+        clients = list(self.active_connections.values())
+        return {
+            "connections": len(clients),
+            "queued": sum(client.queue.qsize() for client in clients),
+            "dropped": sum(client.dropped for client in clients),
+        }
     
     async def broadcast_status_update(self, status_data: dict):
         """Broadcast bot status update."""
@@ -64,6 +145,13 @@ class ConnectionManager:
             "data": track_data
         })
     
+    async def broadcast_position_update(self, positions: list):
+        """Broadcast live playback positions of playing guilds."""
+        await self.broadcast({
+            "type": "position_update",
+            "data": positions
+        })
+    
     async def broadcast_queue_update(self, action: str, data: dict = None):
         """Broadcast queue update."""
         await self.broadcast({